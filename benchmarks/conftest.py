@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+import importlib
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+from lightgbm import LGBMRegressor
+
+PROJECT_DIR = Path(__file__).resolve().parents[1]
+
+# the modules of the project configure MLflow and the model cache at import, so a local registry
+# has to be set up before they are imported to keep the benchmarks offline
+os.environ["TRACKING_URI"] = f"sqlite:///{Path(tempfile.mkdtemp()) / 'mlflow.db'}"
+os.environ["MODEL_CACHE_DIR"] = tempfile.mkdtemp()
+
+from benchmarks.synthetic import generate_rides
+from src.cities import CITIES, DEFAULT_CITY
+from src.features.build_features import (
+    build_features_on_date,
+    build_features_on_geodata,
+    correct_formats,
+    create_community_codes_dict,
+    get_center_lat_lon,
+    get_dataset_to_featurize,
+)
+from src.features.definitions import CATEGORICAL_FEATURES, MODEL_FEATURES
+from src.features.geometry_store import ensure_geometry_artifact
+
+CITY = DEFAULT_CITY
+MODEL_NAME = CITIES[CITY].model_name
+
+
+@pytest.fixture(scope="session")
+def boundaries():
+    """
+    A fixture for the districts boundaries data stored in the repository
+    @return: list of GeoJSON features
+    """
+
+    with open(PROJECT_DIR / "data/external/chicago/boundaries.json", "r", encoding="utf-8") as boundaries_file:
+        return json.load(boundaries_file)["features"]
+
+
+@pytest.fixture(scope="session")
+def city_center():
+    """
+    A fixture for the coordinates of the city center stored in the repository
+    @return: latitude and longitude of the city center
+    """
+
+    return get_center_lat_lon(PROJECT_DIR / "data/external/chicago/city_center_coordinates.txt")
+
+
+@pytest.fixture(scope="session")
+def rides_factory(boundaries):
+    """
+    A fixture for generating synthetic rides datasets of any size
+    @return: function returning a DataFrame with the given number of trips
+    """
+
+    cache = {}
+
+    def make_rides(n_trips):
+        if n_trips not in cache:
+            cache[n_trips] = correct_formats(generate_rides(n_trips, boundaries))
+        return cache[n_trips].copy()
+
+    return make_rides
+
+
+@pytest.fixture(scope="session")
+def interim_features(rides_factory, boundaries, city_center):
+    """
+    A fixture for the features built from 100 000 synthetic trips
+    @return: pandas DataFrame with the same columns as interim_features.parquet
+    """
+
+    rides = rides_factory(100_000)
+    features = build_features_on_date(get_dataset_to_featurize(rides))
+    community_codes_inv_dict = {v: k for k, v in create_community_codes_dict(rides).items()}
+    features['community_name'] = features['community'].map(community_codes_inv_dict)
+    features = build_features_on_geodata(features, boundaries, *city_center)
+
+    return features.drop(columns=["geometry", "community_name"]).reset_index(drop=True)
+
+
+@pytest.fixture(scope="session")
+def community_features():
+    """
+    A fixture for the static features of 77 communities
+    @return: pandas DataFrame with one row per community
+    """
+
+    rng = np.random.default_rng(585)
+    return pd.DataFrame(
+        {
+            "community": np.arange(1, 78),
+            "area": rng.uniform(0.0002, 0.0037, 77),
+            "distance_to_center": rng.uniform(0.003, 0.29, 77),
+        }
+    )
+
+
+@pytest.fixture(scope="session")
+def production_sized_model(community_features):
+    """
+    A fixture for a model with the hyperparameters of the production model,
+    trained on synthetic data
+    @return: lightgbm Booster
+    """
+
+    with open(PROJECT_DIR / "models/chicago/best_params.json", "r", encoding="utf-8") as best_params_file:
+        model_params = json.load(best_params_file)
+
+    rng = np.random.default_rng(585)
+    days = pd.date_range("2020-06-01", "2020-10-17", freq="1D")
+    train = pd.DataFrame(
+        {
+            "start_day": np.repeat(days.values, len(community_features)),
+            "community": np.tile(community_features["community"].values, len(days)),
+        }
+    ).merge(community_features, on="community")
+    train = build_features_on_date(train)
+    train["rides_number"] = rng.poisson(50 * np.exp(-5 * train["distance_to_center"]) * (1 + train["is_weekend"]))
+    train[CATEGORICAL_FEATURES] = train[CATEGORICAL_FEATURES].astype("category")
+
+    model = LGBMRegressor(objective="poisson", random_state=585, **model_params)
+    model.fit(train[MODEL_FEATURES], train["rides_number"])
+
+    return model.booster_
+
+
+@pytest.fixture(scope="session")
+def api_module(production_sized_model, tmp_path_factory):
+    """
+    A fixture for the prediction service served by a local file-based model registry
+    @return: the src.api.predict module
+    """
+
+    import mlflow
+    from mlflow import MlflowClient
+
+    workdir = tmp_path_factory.mktemp("api")
+    city_dir = workdir / "cities" / CITY
+    shutil.copytree(PROJECT_DIR / "data/external" / CITY, city_dir)
+    shutil.copy(PROJECT_DIR / "references" / CITY / "community_codes_dict.pkl", city_dir)
+    ensure_geometry_artifact(city_dir / "boundaries.json", city_dir / "boundaries.feather")
+
+    mlflow.set_tracking_uri(os.environ["TRACKING_URI"])
+    experiment_id = mlflow.create_experiment("benchmarks", artifact_location=(workdir / "artifacts").as_uri())
+    with mlflow.start_run(experiment_id=experiment_id):
+        model_info = mlflow.lightgbm.log_model(production_sized_model, "model")
+    model_version = mlflow.register_model(model_uri=model_info.model_uri, name=MODEL_NAME)
+    MlflowClient().transition_model_version_stage(MODEL_NAME, model_version.version, "Production")
+
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        module = importlib.import_module("src.api.predict")
+    finally:
+        os.chdir(cwd)
+
+    return module
@@ -0,0 +1,69 @@
+"""Module for generating synthetic rides data with the schema of the Chicago e-scooter trips dataset"""
+from datetime import datetime
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+from shapely.geometry import shape
+
+VENDORS = ["Bird", "Lime", "Spin", "Lyft", "Jump", "Bolt", "Grow", "Wheels", "Sherpa", "VeoRide"]
+
+
+def generate_rides(
+    n_trips: int,
+    boundaries: List[Dict[str, Any]],
+    first_day: datetime = datetime(2020, 8, 12),
+    n_days: int = 67,
+    seed: int = 585,
+) -> pd.DataFrame:
+    """
+    Function generates trips between the communities of the boundaries data
+    @param n_trips: int, the number of trips to generate
+    @param boundaries: list of GeoJSON features of the communities boundaries
+    @param first_day: datetime, the first day of the trips
+    @param n_days: int, the number of days the trips are spread over
+    @param seed: int, random state
+    @return: pd.DataFrame with the same columns as the raw rides dataset
+    """
+
+    rng = np.random.default_rng(seed)
+
+    names = np.array([feature["properties"]["community"] for feature in boundaries])
+    numbers = np.array([int(feature["properties"]["area_numbe"]) for feature in boundaries])
+    centroids = [shape(feature["geometry"]).centroid for feature in boundaries]
+    latitudes = np.array([centroid.y for centroid in centroids])
+    longitudes = np.array([centroid.x for centroid in centroids])
+    locations = np.array([f"POINT ({centroid.x} {centroid.y})" for centroid in centroids])
+
+    popularity = rng.pareto(1.5, len(names)) + 0.05
+    start_idx = rng.choice(len(names), size=n_trips, p=popularity / popularity.sum())
+    stay_inside = rng.random(n_trips) < 0.7
+    end_idx = np.where(stay_inside, start_idx, rng.integers(0, len(names), n_trips))
+
+    start_time = (
+        np.datetime64(first_day, "s")
+        + rng.integers(0, n_days, n_trips).astype("timedelta64[D]")
+        + rng.integers(0, 24 * 3600, n_trips).astype("timedelta64[s]")
+    )
+    duration = rng.gamma(2.0, 450.0, n_trips).round()
+
+    return pd.DataFrame(
+        {
+            "Trip ID": np.arange(n_trips).astype(str),
+            "Start Time": start_time,
+            "End Time": start_time + duration.astype("timedelta64[s]"),
+            "Trip Distance": rng.gamma(2.0, 1000.0, n_trips).round(),
+            "Trip Duration": duration,
+            "Vendor": rng.choice(VENDORS, n_trips),
+            "Start Community Area Number": numbers[start_idx],
+            "End Community Area Number": numbers[end_idx],
+            "Start Community Area Name": names[start_idx],
+            "End Community Area Name": names[end_idx],
+            "Start Centroid Latitude": latitudes[start_idx],
+            "Start Centroid Longitude": longitudes[start_idx],
+            "Start Centroid Location": locations[start_idx],
+            "End Centroid Latitude": latitudes[end_idx],
+            "End Centroid Longitude": longitudes[end_idx],
+            "End Centroid Location": locations[end_idx],
+        }
+    )
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+from scipy.stats import poisson
+
+from benchmarks.conftest import CITY
+
+
+def test_prepare_features_and_predict(benchmark, api_module):
+    """
+    Function benchmarks the hot path of the prediction service
+    """
+    input_data = {"community": "LAKE VIEW", "date": "2020-09-20"}
+    shard = api_module.SHARDS.get(CITY)
+
+    def prepare_features_and_predict():
+        return api_module.predict(api_module.prepare_features(input_data, shard), shard.model)
+
+    pred = benchmark(prepare_features_and_predict)
+
+    assert pred >= 0
+
+
+def test_predict_endpoint(benchmark, api_module):
+    """
+    Function benchmarks the whole request to the prediction service
+    """
+    client = api_module.app.test_client()
+    input_data = {"city": CITY, "community": "LAKE VIEW", "date": "2020-09-20", "quantiles": True}
+
+    response = benchmark(client.post, "/predict", json=input_data)
+
+    assert response.status_code == 200
+
+
+def test_predict_endpoint_quantiles(api_module):
+    """
+    Function for testing that the quantiles of the response are ordered and derived from the predicted rate
+    """
+    client = api_module.app.test_client()
+    input_data = {"city": CITY, "community": "LAKE VIEW", "date": "2020-09-20", "quantiles": True}
+    shard = api_module.SHARDS.get(CITY)
+    rate = api_module.predict_rate(api_module.prepare_features(input_data, shard), shard.model)
+
+    result = client.post("/predict", json=input_data).get_json()
+
+    quantiles = result["trips_quantiles"]
+    assert set(quantiles) == {"p10", "p50", "p90"}
+    assert quantiles["p10"] <= quantiles["p50"] <= quantiles["p90"]
+    assert quantiles["p50"] == poisson.ppf(0.5, rate)
+    assert result["trips"] == round(rate)
+
+
+def test_predict_endpoint_without_quantiles(api_module):
+    """
+    Function for testing that the response without quantiles keeps its shape
+    """
+    client = api_module.app.test_client()
+    input_data = {"city": CITY, "community": "LAKE VIEW", "date": "2020-09-20"}
+    shard = api_module.SHARDS.get(CITY)
+    rate = api_module.predict_rate(api_module.prepare_features(input_data, shard), shard.model)
+
+    result = client.post("/predict", json=input_data).get_json()
+
+    assert set(result) == {"trips", "model_version", "city", "model_stage"}
+    assert result["trips"] == round(rate)
+    assert result["model_version"] == shard.model.metadata.run_id
+
+
+def test_load_city_shard(benchmark, api_module):
+    """
+    Function benchmarks the first request for a city, loading its model and reference data
+    """
+    shard, size = benchmark.pedantic(api_module.load_city_shard, args=(CITY,), rounds=3)
+
+    assert shard.city == CITY
+    assert size > 0
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from datetime import date
+
+import pytest
+
+from src.pipeline.batch_forecast import build_horizon_features, reconcile_city_totals, score_horizon
+
+
+def forecast_horizon(model, community_features, horizon_days):
+    horizon_features = build_horizon_features(community_features, date(2020, 10, 18), horizon_days)
+    forecast = score_horizon(model, horizon_features)
+    city_forecast = reconcile_city_totals(forecast)
+
+    return forecast, city_forecast
+
+
+@pytest.mark.parametrize("horizon_days", [3, 30, 365])
+def test_forecast_horizon(benchmark, production_sized_model, community_features, horizon_days):
+    """
+    Function benchmarks scoring of every community over the whole horizon in a single pass
+    """
+    forecast, city_forecast = benchmark(forecast_horizon, production_sized_model, community_features, horizon_days)
+
+    assert len(forecast) == 77 * horizon_days
+    assert len(city_forecast) == horizon_days
+    assert city_forecast["trips"].sum() == pytest.approx(forecast["trips"].sum())
+    # the stats are None when the benchmarks are run with --benchmark-disable
+    if benchmark.stats is not None:
+        assert benchmark.stats.stats.mean < 5
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+import lightgbm as lgb
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.features.build_features import build_features_on_date
+from src.features.definitions import CATEGORICAL_FEATURES, MODEL_FEATURES
+from src.models.compaction import COMPACTION_MAE_TOLERANCE, compact_model
+
+
+@pytest.fixture(scope="module")
+def holdout(community_features):
+    """
+    A fixture for four weeks following the train data of the production sized model
+    @return: pandas DataFrame with the model features and the target
+    """
+
+    rng = np.random.default_rng(586)
+    days = pd.date_range("2020-10-18", periods=28, freq="1D")
+    holdout = pd.DataFrame(
+        {
+            "start_day": np.repeat(days.values, len(community_features)),
+            "community": np.tile(community_features["community"].values, len(days)),
+        }
+    ).merge(community_features, on="community")
+    holdout = build_features_on_date(holdout)
+    holdout["rides_number"] = rng.poisson(50 * np.exp(-5 * holdout["distance_to_center"]) * (1 + holdout["is_weekend"]))
+    holdout[CATEGORICAL_FEATURES] = holdout[CATEGORICAL_FEATURES].astype("category")
+
+    return holdout
+
+
+@pytest.fixture(scope="module")
+def model_strings(production_sized_model, holdout):
+    """
+    A fixture for the production sized model and its compacted version
+    @return: dict of the models in the LightGBM text format
+    """
+
+    compact_model_str, metrics = compact_model(
+        production_sized_model, holdout[MODEL_FEATURES], holdout["rides_number"], COMPACTION_MAE_TOLERANCE
+    )
+    print(metrics)
+
+    return {"full": production_sized_model.model_to_string(), "compact": compact_model_str}
+
+
+@pytest.mark.parametrize("model_kind", ["full", "compact"])
+def test_model_load(benchmark, model_strings, model_kind):
+    """
+    Function benchmarks loading of the full and the compacted model
+    """
+
+    booster = benchmark(lgb.Booster, model_str=model_strings[model_kind])
+
+    assert booster.num_trees() > 0
+
+
+@pytest.mark.parametrize("model_kind", ["full", "compact"])
+def test_model_scoring(benchmark, model_strings, holdout, model_kind):
+    """
+    Function benchmarks scoring of the holdout with the full and the compacted model
+    and checks the holdout MAE of the compacted model is within the tolerance
+    """
+
+    booster = lgb.Booster(model_str=model_strings[model_kind])
+    predictions = benchmark(booster.predict, holdout[MODEL_FEATURES])
+
+    full_predictions = lgb.Booster(model_str=model_strings["full"]).predict(holdout[MODEL_FEATURES])
+    full_mae = np.abs(holdout["rides_number"] - full_predictions).mean()
+    assert np.abs(holdout["rides_number"] - predictions).mean() <= full_mae * (1 + COMPACTION_MAE_TOLERANCE)
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from benchmarks.conftest import PROJECT_DIR
+from src.features.build_features import (
+    build_features_on_date,
+    build_features_on_geodata,
+    build_features_pandas,
+    get_dataset_to_featurize,
+)
+from src.features.duckdb_features import RAW_TIME_FORMAT, build_features_duckdb
+from src.features.geometry_store import ensure_geometry_artifact, load_geometry_artifact
+
+ENGINES = {"pandas": build_features_pandas, "duckdb": build_features_duckdb}
+
+
+@pytest.mark.parametrize("n_trips", [10_000, 100_000, 1_000_000])
+def test_get_dataset_to_featurize(benchmark, rides_factory, n_trips):
+    """
+    Function benchmarks building of the dense communities x days dataset
+    """
+    rides = rides_factory(n_trips)
+
+    result = benchmark.pedantic(get_dataset_to_featurize, setup=lambda: ((rides.copy(),), {}), rounds=5)
+
+    assert result["rides_number"].sum() == n_trips
+
+
+def test_build_features_on_date(benchmark, interim_features):
+    """
+    Function benchmarks generation of the features on date
+    """
+    data = interim_features[["start_day", "community", "rides_number"]]
+
+    result = benchmark.pedantic(build_features_on_date, setup=lambda: ((data.copy(),), {}), rounds=10)
+
+    assert result["is_weekend"].isin({0, 1}).all()
+
+
+def test_build_features_on_geodata(benchmark, interim_features, rides_factory, boundaries, city_center):
+    """
+    Function benchmarks generation of the features on geographical data
+    """
+    rides = rides_factory(10_000)
+    community_names = rides.drop_duplicates("Start Community Area Number").set_index("Start Community Area Number")
+    data = interim_features[["start_day", "community"]].copy()
+    data["community_name"] = data["community"].map(community_names["Start Community Area Name"])
+
+    result = benchmark.pedantic(
+        build_features_on_geodata,
+        setup=lambda: ((data.copy(), boundaries, *city_center), {}),
+        rounds=5,
+    )
+
+    assert (result["area"] > 0).all()
+
+
+@pytest.fixture(scope="module")
+def geometry(tmp_path_factory):
+    """
+    A fixture for the geometry of the communities stored in the repository
+    """
+
+    artifact_path = ensure_geometry_artifact(
+        PROJECT_DIR / "data/external/chicago/boundaries.json",
+        tmp_path_factory.mktemp("geometry") / "boundaries.feather",
+    )
+    return load_geometry_artifact(artifact_path)
+
+
+@pytest.mark.parametrize("n_trips", [10_000, 100_000, 1_000_000])
+@pytest.mark.parametrize("engine", ENGINES)
+def test_featurize_engine(benchmark, rides_factory, geometry, city_center, tmp_path, engine, n_trips):
+    """
+    Function benchmarks the whole feature building by the engines from the raw rides parquet file
+    with the times stored as strings as in the source dataset
+    """
+    rides = rides_factory(n_trips)
+    rides["Start Time"] = rides["Start Time"].dt.strftime(RAW_TIME_FORMAT)
+    rides_path = tmp_path / "rides_data.parquet"
+    rides.to_parquet(rides_path)
+
+    features, _ = benchmark.pedantic(ENGINES[engine], args=(rides_path, geometry, *city_center, "2020-10-18"), rounds=3)
+
+    assert features["rides_number"].sum() == n_trips
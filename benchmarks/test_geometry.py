@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+import json
+import tracemalloc
+
+import pytest
+from shapely.geometry import Point, shape
+
+from benchmarks.conftest import PROJECT_DIR
+from src.features.geometry_store import build_geometry_artifact, load_geometry_artifact
+
+BOUNDARIES_PATH = PROJECT_DIR / "data/external/chicago/boundaries.json"
+
+
+def load_geojson(lat, lon):
+    with open(BOUNDARIES_PATH, "r", encoding="utf-8") as boundaries_file:
+        boundaries = json.load(boundaries_file)["features"]
+    geometries = {feature["properties"]["community"]: shape(feature["geometry"]) for feature in boundaries}
+    areas = {name: geometry.area for name, geometry in geometries.items()}
+    distances = {name: geometry.centroid.distance(Point(lon, lat)) for name, geometry in geometries.items()}
+
+    return areas, distances
+
+
+def load_artifact(artifact_path, lat, lon):
+    geometry = load_geometry_artifact(artifact_path)
+
+    return geometry.areas(), geometry.distances_to_center(lat, lon)
+
+
+def peak_memory_mb(func, *args):
+    tracemalloc.start()
+    func(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return peak / 2**20
+
+
+def test_load_geojson(benchmark, city_center):
+    """
+    Function benchmarks loading of the communities geometry from the full GeoJSON
+    """
+    benchmark.extra_info["peak_memory_mb"] = peak_memory_mb(load_geojson, *city_center)
+
+    areas, _ = benchmark(load_geojson, *city_center)
+
+    assert len(areas) == 77
+
+
+@pytest.mark.parametrize("simplify_tolerance", [None, 1e-5])
+def test_load_artifact(benchmark, boundaries, city_center, tmp_path, simplify_tolerance):
+    """
+    Function benchmarks loading of the communities geometry from the binary artifact
+    """
+    artifact_path = tmp_path / "boundaries.feather"
+    build_geometry_artifact(boundaries, artifact_path, simplify_tolerance, center=city_center)
+    benchmark.extra_info["artifact_size_mb"] = artifact_path.stat().st_size / 2**20
+    benchmark.extra_info["peak_memory_mb"] = peak_memory_mb(load_artifact, artifact_path, *city_center)
+
+    areas, _ = benchmark(load_artifact, artifact_path, *city_center)
+
+    assert len(areas) == 77
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+import json
+
+from hyperopt import Trials
+from hyperopt.early_stop import no_progress_loss
+from hyperopt.fmin import generate_trials_to_calculate
+
+from benchmarks.conftest import PROJECT_DIR
+from src.features.definitions import CATEGORICAL_FEATURES, MODEL_FEATURES
+from src.models.hpo import (
+    EARLY_STOP_MIN_IMPROVEMENT_PERCENT,
+    EARLY_STOP_PATIENCE,
+    WARM_START_TOP_K,
+    cross_val_score,
+    get_best_lightgbm_params,
+    get_convergence,
+    get_ok_trials,
+    get_top_configurations,
+)
+
+
+def test_cross_val_score(benchmark, interim_features):
+    """
+    Function benchmarks a single evaluation of the HPO objective
+    with the hyperparameters of the production model
+    """
+    with open(PROJECT_DIR / "models/chicago/best_params.json", "r", encoding="utf-8") as best_params_file:
+        model_params = json.load(best_params_file)
+    data = interim_features.copy()
+    data[CATEGORICAL_FEATURES] = data[CATEGORICAL_FEATURES].astype("category")
+
+    score = benchmark.pedantic(
+        cross_val_score,
+        args=(data, MODEL_FEATURES, "rides_number", 585),
+        kwargs={"objective": "poisson", **model_params},
+        rounds=3,
+    )
+
+    assert score >= 0
+
+
+def test_warm_started_search(interim_features):
+    """
+    Function compares the number of trials a cold and a warm-started search need
+    to reach the best loss of the previous search on a part of the data
+    """
+    data = interim_features.copy()
+    data[CATEGORICAL_FEATURES] = data[CATEGORICAL_FEATURES].astype("category")
+    days = sorted(data["start_day"].unique())
+    previous_data = data[data["start_day"] < days[int(len(days) * 0.8)]]
+
+    previous_trials = Trials()
+    get_best_lightgbm_params(
+        previous_data, MODEL_FEATURES, "rides_number", cross_val_score, 585, n_rounds=20, trials=previous_trials
+    )
+    previous_best_loss = min(trial["result"]["loss"] for trial in get_ok_trials(previous_trials))
+    warm_start_points = get_top_configurations(previous_trials, WARM_START_TOP_K)
+
+    cold_trials = Trials()
+    get_best_lightgbm_params(
+        data, MODEL_FEATURES, "rides_number", cross_val_score, 585, n_rounds=20, trials=cold_trials
+    )
+    warm_trials = generate_trials_to_calculate(warm_start_points)
+    get_best_lightgbm_params(
+        data,
+        MODEL_FEATURES,
+        "rides_number",
+        cross_val_score,
+        585,
+        n_rounds=len(warm_start_points) + 20,
+        trials=warm_trials,
+        early_stop_fn=no_progress_loss(EARLY_STOP_PATIENCE, EARLY_STOP_MIN_IMPROVEMENT_PERCENT),
+    )
+
+    cold_trials_number, cold_time = get_convergence(cold_trials, previous_best_loss)
+    warm_trials_number, warm_time = get_convergence(warm_trials, previous_best_loss)
+    print(
+        f"trials to the previous best loss {previous_best_loss:.4f}: "
+        f"cold {cold_trials_number} ({cold_time} s), warm {warm_trials_number} ({warm_time} s)"
+    )
+
+    assert len(warm_trials.trials) >= len(warm_start_points)
+    assert min(trial["result"]["loss"] for trial in get_ok_trials(warm_trials)) <= min(
+        trial["result"]["loss"] for trial in get_ok_trials(cold_trials)
+    ) * (1 + EARLY_STOP_MIN_IMPROVEMENT_PERCENT / 100)
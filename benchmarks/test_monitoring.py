@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from src.features.definitions import CATEGORICAL_FEATURES, MODEL_FEATURES
+from src.monitoring.monitoring import calculate_metrics
+
+
+def test_monitoring_window(benchmark, production_sized_model, interim_features):
+    """
+    Function benchmarks calculation of the monitoring metrics for one day
+    """
+    data = interim_features.copy()
+    data[CATEGORICAL_FEATURES] = data[CATEGORICAL_FEATURES].astype("category")
+    days = sorted(data["start_day"].unique())
+    reference_data = data[data["start_day"] < days[-10]].copy()
+    reference_data["prediction"] = production_sized_model.predict(reference_data[MODEL_FEATURES])
+    current_data = data[data["start_day"] == days[-1]]
+
+    prediction_drift, _, share_missing_values = benchmark.pedantic(
+        calculate_metrics,
+        setup=lambda: ((production_sized_model, reference_data, current_data.copy()), {}),
+        rounds=5,
+    )
+
+    assert 0 <= prediction_drift <= 1
+    assert share_missing_values == 0
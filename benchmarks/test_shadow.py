@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+import dataclasses
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from benchmarks.conftest import CITY
+from src.api.shadow import ShadowScorer
+from src.api.shard_cache import ShardCache
+
+INPUT_DATA = {"city": CITY, "community": "LAKE VIEW", "date": "2020-09-20"}
+
+
+class BlockingModel:
+    """
+    A candidate model blocking the shadow executor until it is released
+    """
+
+    def __init__(self, model):
+        self.metadata = model.metadata
+        self.released = threading.Event()
+
+    def predict(self, features):
+        self.released.wait()
+        return [0.0] * len(features)
+
+
+@pytest.fixture
+def saturated_api(api_module, monkeypatch):
+    """
+    A fixture for the prediction service scoring every request in the shadow
+    with a candidate model that never finishes, so the shadow executor is saturated
+    @return: the src.api.predict module and its shadow scorer
+    """
+
+    shard = api_module.SHARDS.get(CITY)
+    candidate = BlockingModel(shard.model)
+    shadow_shard = dataclasses.replace(shard, candidate=candidate)
+    scorer = ShadowScorer(max_workers=1, max_pending=1)
+    monkeypatch.setattr(api_module, "SHARDS", ShardCache(lambda city: (shadow_shard, 0), max_bytes=1))
+    monkeypatch.setattr(api_module, "SHADOW", scorer)
+    monkeypatch.setattr(api_module, "SHADOW_SAMPLE_RATE", 1.0)
+
+    yield api_module, scorer
+
+    candidate.released.set()
+    scorer.shutdown()
+
+
+def measure_p99(client, n_requests=1000):
+    latencies = []
+    for _ in range(n_requests):
+        request_start = time.perf_counter()
+        client.post("/predict", json=INPUT_DATA)
+        latencies.append(time.perf_counter() - request_start)
+
+    return np.percentile(latencies, 99)
+
+
+def test_predict_endpoint_saturated_shadow(benchmark, saturated_api):
+    """
+    Function benchmarks the request to the prediction service while the shadow executor is saturated
+    """
+    api_module, scorer = saturated_api
+    client = api_module.app.test_client()
+    # the first scoring takes the only slot and never finishes, so the benchmarked requests are dropped
+    # even if the benchmark calls the endpoint once, as with --benchmark-disable
+    client.post("/predict", json=INPUT_DATA)
+
+    response = benchmark(client.post, "/predict", json=INPUT_DATA)
+
+    assert response.status_code == 200
+    assert scorer.snapshot().get(CITY, {}).get("dropped", 0) > 0
+
+
+def test_saturated_shadow_adds_no_p99_latency(saturated_api, monkeypatch):
+    """
+    Function compares the p99 latency of the requests without the shadow scoring
+    and with the saturated shadow executor
+    """
+    api_module, scorer = saturated_api
+    client = api_module.app.test_client()
+    measure_p99(client, n_requests=200)
+
+    monkeypatch.setattr(api_module, "SHADOW_SAMPLE_RATE", 0.0)
+    baseline_p99 = measure_p99(client)
+    monkeypatch.setattr(api_module, "SHADOW_SAMPLE_RATE", 1.0)
+    shadow_p99 = measure_p99(client)
+
+    print(f"p99 without shadow: {baseline_p99 * 1000:.2f}ms, with saturated shadow: {shadow_p99 * 1000:.2f}ms")
+    assert scorer.snapshot()[CITY]["dropped"] >= 1000 - 1
+    assert shadow_p99 <= baseline_p99 * 1.2 + 0.0005
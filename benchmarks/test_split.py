@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+import os
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from src.data.split import split_train_test, split_train_test_streaming
+
+# the days from 2000-01-01 stay before the end of the timestamp[ns] range in 2262
+MAX_DAYS = 10_000
+
+
+def test_split_train_test(benchmark, interim_features):
+    """
+    Function benchmarks splitting of the features dataset into train and test datasets
+    """
+    train, test = benchmark.pedantic(
+        split_train_test, setup=lambda: ((interim_features.sample(frac=1, random_state=585), 0.15), {}), rounds=10
+    )
+
+    assert len(train) + len(test) == len(interim_features)
+    assert train["start_day"].max() < test["start_day"].min()
+
+
+@pytest.fixture(scope="module")
+def large_features_path(tmp_path_factory):
+    """
+    A fixture for a features dataset written row group by row group, so it can be larger than RAM.
+    The number of rows is set by SPLIT_BENCHMARK_ROWS, the rows are spread over more communities
+    than 77 when needed to keep the days within the range of timestamp[ns]
+    @return: Path of the dataset
+    """
+
+    rows_num = int(os.getenv("SPLIT_BENCHMARK_ROWS", "20000000"))
+    communities_num = max(77, -(-rows_num // MAX_DAYS))
+    path = tmp_path_factory.mktemp("split") / "interim_features.parquet"
+    rng = np.random.default_rng(585)
+    writer = None
+    row_group_size = 1_000_000
+    first_day = np.datetime64("2000-01-01", "ns")
+    for start in range(0, rows_num, row_group_size):
+        rows = np.arange(start, min(start + row_group_size, rows_num))
+        row_group = pa.table(
+            {
+                "start_day": first_day + (rows // communities_num).astype("timedelta64[D]"),
+                "community": rows % communities_num + 1,
+                "rides_number": rng.poisson(20, len(rows)).astype(float),
+                "area": rng.random(len(rows)),
+                "distance_to_center": rng.random(len(rows)),
+            }
+        )
+        if writer is None:
+            writer = pq.ParquetWriter(path, row_group.schema)
+        writer.write_table(row_group)
+    writer.close()
+
+    return path
+
+
+def test_split_train_test_streaming(benchmark, large_features_path, tmp_path):
+    """
+    Function benchmarks the streaming split, its peak memory does not depend on the size of the dataset
+    """
+    pool = pa.default_memory_pool()
+
+    train_rows_num, test_rows_num = benchmark.pedantic(
+        split_train_test_streaming,
+        args=(large_features_path, tmp_path / "train.parquet", tmp_path / "test.parquet", 0.15),
+        rounds=1,
+    )
+    benchmark.extra_info["arrow_peak_memory_mb"] = pool.max_memory() / 2**20
+    benchmark.extra_info["dataset_size_mb"] = large_features_path.stat().st_size / 2**20
+
+    assert train_rows_num + test_rows_num == pq.ParquetFile(large_features_path).metadata.num_rows
+    assert test_rows_num > 0
@@ -0,0 +1,22 @@
+"""Gunicorn configuration of the prediction service"""
+import os
+import shutil
+import tempfile
+
+# prometheus_client chooses the multiprocess mode on import, so the directory of the metrics is set before it
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "prometheus"))
+
+from prometheus_client import multiprocess
+
+bind = "0.0.0.0:9696"
+
+
+def on_starting(server):  # pylint: disable=unused-argument
+    # metrics of the workers of a previous run must not be aggregated with the new ones
+    multiproc_dir = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(multiproc_dir, ignore_errors=True)
+    os.makedirs(multiproc_dir)
+
+
+def child_exit(server, worker):  # pylint: disable=unused-argument
+    multiprocess.mark_process_dead(worker.pid)
@@ -1,55 +1,178 @@
+import atexit
 import json
+import logging
+import os
 import pickle
+import queue
+import random
+import sys
+import time
+from dataclasses import dataclass
 from datetime import date, datetime
-from typing import Tuple
+from logging.handlers import QueueHandler, QueueListener
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
 
 import mlflow.pyfunc
-from flask import Flask, jsonify, request
-from mlflow import MlflowClient
-from shapely.geometry import Point, shape
-
-TRACKING_URI = "http://16.171.140.74:5000"
+import numpy as np
+from flask import Flask, Response, jsonify, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from scipy.stats import poisson
+
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from src.api.shadow import ShadowScorer
+from src.api.shard_cache import ShardCache
+from src.cities import DEFAULT_CITY, load_cities
+from src.features.definitions import MODEL_FEATURES
+from src.features.geometry_store import ensure_geometry_artifact, load_geometry_artifact
+from src.models.model_cache import ModelCache, load_cached_model
+
+TRACKING_URI = os.getenv("TRACKING_URI", "http://16.171.140.74:5000")
 # mlflow.set_tracking_uri(TRACKING_URI)
 
-MODEL_NAME = "escooter-demand-model"
-MODEL_FEATURES = [
-    'community',
-    'day_of_year',
-    'day_of_week',
-    'is_weekend',
-    'week',
-    'month',
-    'area',
-    'distance_to_center',
-]
+# the directory with a subdirectory of the reference data per city
+SHARDS_DIR = Path(os.getenv("SHARDS_DIR", "cities")).resolve()
+SHARD_CACHE_MAX_BYTES = int(os.getenv("SHARD_CACHE_MAX_MB", "1024")) * 1024 * 1024
+# the cities served by the process, all the known cities if empty
+SERVED_CITIES = {city for city in os.getenv("SERVED_CITIES", "").split(",") if city}
+
+# the share of the requests also scored by the Staging model of the city in the background
+SHADOW_SAMPLE_RATE = float(os.getenv("SHADOW_SAMPLE_RATE", "0"))
+# the percentage of the requests served by the Staging model instead of the Production one
+CANARY_PERCENT = float(os.getenv("CANARY_PERCENT", "0"))
+SHADOW_WORKERS = int(os.getenv("SHADOW_WORKERS", "1"))
+SHADOW_MAX_PENDING = int(os.getenv("SHADOW_MAX_PENDING", "64"))
+
+QUANTILES = (0.1, 0.5, 0.9)
+
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.1"))
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+FEATURES_LATENCY = Histogram(
+    "prediction_features_seconds", "Time spent preparing the features of a request", buckets=LATENCY_BUCKETS
+)
+SCORING_LATENCY = Histogram("prediction_scoring_seconds", "Time spent scoring a request", buckets=LATENCY_BUCKETS)
+REQUEST_LATENCY = Histogram("prediction_request_seconds", "Total time of a request", buckets=LATENCY_BUCKETS)
+UNKNOWN_COMMUNITIES = Counter(
+    "prediction_unknown_community", "Requests for communities the model does not know", ["city"]
+)
+UNKNOWN_CITIES = Counter("prediction_unknown_city", "Requests for cities the process does not serve")
+MODEL_VERSION = Gauge(
+    "prediction_model_version_info",
+    "Version of the served model",
+    ["city", "model_version"],
+    multiprocess_mode="max",
+)
+SHARD_LOADS = Counter("prediction_shard_loads", "Loads of the shards of the cities", ["city"])
+SHARD_EVICTIONS = Counter("prediction_shard_evictions", "Evictions of the shards of the cities", ["city"])
+SHARD_LOAD_LATENCY = Histogram("prediction_shard_load_seconds", "Time spent loading the shard of a city")
+CANARY_REQUESTS = Counter("prediction_canary_requests", "Requests served by the candidate model", ["city"])
+SHADOW_REQUESTS = Counter("prediction_shadow_requests", "Requests scored by the candidate model", ["city"])
+SHADOW_DROPPED = Counter(
+    "prediction_shadow_dropped", "Shadow scorings dropped because the executor was saturated", ["city"]
+)
+SHADOW_ERRORS = Counter("prediction_shadow_errors", "Failed shadow scorings", ["city"])
+SHADOW_DIFFERENCE = Histogram(
+    "prediction_shadow_abs_difference",
+    "Absolute difference of the predictions of the candidate and the served models",
+    ["city"],
+    buckets=(0.5, 1, 2, 5, 10, 25, 50, 100, 250),
+)
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        log = {
+            "timestamp": datetime.fromtimestamp(record.created).isoformat(),
+            "level": record.levelname,
+            "message": record.getMessage(),
+            **getattr(record, "fields", {}),
+        }
+        return json.dumps(log, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Filter passing only a share of the INFO records marked as sampled,
+    other records are always passed
+    """
+
+    def __init__(self, sample_rate: float):
+        super().__init__()
+        self.sample_rate = sample_rate
+
+    def filter(self, record):
+        if record.levelno > logging.INFO or not getattr(record, "sampled", False):
+            return True
+        return random.random() < self.sample_rate
+
+
+def get_logger(name: str) -> logging.Logger:
+    """
+    Function creates a logger writing JSON records to stderr from a background thread,
+    so a request only puts a record into a queue
+    @param name: str, the name of the logger
+    @return: logging.Logger
+    """
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(JsonFormatter())
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, stream_handler)
+    listener.start()
+    atexit.register(listener.stop)
+
+    new_logger = logging.getLogger(name)
+    new_logger.setLevel(logging.INFO)
+    new_logger.addHandler(QueueHandler(log_queue))
+    new_logger.addFilter(SamplingFilter(LOG_SAMPLE_RATE))
+    new_logger.propagate = False
+
+    return new_logger
 
 
-def load_model(model_name):
-    stage = "Production"
-    client = MlflowClient(registry_uri=TRACKING_URI)
-    latest_version = client.get_latest_versions(model_name, stages=[stage])[0].source
-    model = mlflow.pyfunc.load_model(model_uri=latest_version)
-    print(f'{datetime.now()} Model loaded')
+logger = get_logger("trips-prediction")
 
-    return model
 
+# the workers share the cache, so a restart loads the models without downloading them
+MODEL_CACHE = ModelCache(tracking_uri=TRACKING_URI)
 
-MODEL = load_model(MODEL_NAME)
 
-with open("community_codes_dict.pkl", 'rb') as community_codes_file:
-    COMMUNITY_CODES_DICT = pickle.load(community_codes_file)
+def load_model(model_name: str, stage: str = "Production") -> Tuple[mlflow.pyfunc.PyFuncModel, int]:
+    """
+    Function loads a version of a model through the local model cache
+    @param model_name: str, the name of the registered model
+    @param stage: str, the stage of the version
+    @return: the model and the size of its artifacts in bytes
+    """
 
-with open("boundaries.json", "r", encoding="utf-8") as boundaries_file:
-    BOUNDARIES = json.load(boundaries_file)["features"]
+    model, cached_model = load_cached_model(model_name, stage, cache=MODEL_CACHE)
+    logger.info(
+        "Model loaded",
+        extra={
+            "fields": {
+                "model_name": model_name,
+                "stage": stage,
+                "registry_version": cached_model.version,
+                "model_version": model.metadata.run_id,
+            }
+        },
+    )
 
-COMMUNITY_GEOMETRY_DICT = {feature["properties"]["community"]: feature["geometry"] for feature in BOUNDARIES}
-COMMUNITY_AREA_DICT = {
-    community_name: shape(COMMUNITY_GEOMETRY_DICT[community_name]).area
-    for community_name in COMMUNITY_GEOMETRY_DICT.keys()
-}
+    return model, cached_model.size_bytes
 
 
-def get_center_lat_lon(path_to_file: str) -> Tuple[float, float]:
+def get_center_lat_lon(path_to_file: Path) -> Tuple[float, float]:
     """
     Function loads the coordinates of the city center from a file
     @param path_to_file:
@@ -63,57 +186,276 @@ def get_center_lat_lon(path_to_file: str) -> Tuple[float, float]:
     return lat, lon
 
 
-LATITUDE, LONGITUDE = get_center_lat_lon("city_center_coordinates.txt")
+@dataclass
+class CityShard:
+    """
+    Model and reference data serving the requests for a city
+    """
+
+    city: str
+    model: mlflow.pyfunc.PyFuncModel
+    community_codes: Dict[str, int]
+    community_areas: Dict[str, float]
+    community_distances: Dict[str, float]
+    candidate: Optional[mlflow.pyfunc.PyFuncModel] = None
+
+    @property
+    def model_version(self) -> str:
+        return self.model.metadata.run_id
+
+
+def load_candidate_model(model_name: str) -> Tuple[Optional[mlflow.pyfunc.PyFuncModel], int]:
+    """
+    Function loads the Staging version of a model if the shadow or canary mode is on
+    @param model_name: str, the name of the registered model
+    @return: the model or None if there is no Staging version, and the size of its artifacts in bytes
+    """
+
+    if SHADOW_SAMPLE_RATE <= 0 and CANARY_PERCENT <= 0:
+        return None, 0
+    try:
+        return load_model(model_name, stage="Staging")
+    except Exception as error:  # pylint: disable=broad-except
+        # the city is served by the Production model alone
+        logger.warning("Candidate model is not loaded", extra={"fields": {"model_name": model_name, "error": error}})
+        return None, 0
+
+
+def load_city_shard(city: str) -> Tuple[CityShard, int]:
+    """
+    Function loads the shard of a city: its model from the registry
+    and the reference data from the city directory in SHARDS_DIR
+    @param city: str, the name of the city
+    @return: the shard and its size in bytes
+    """
+
+    load_start = time.perf_counter()
+    city_dir = SHARDS_DIR / city
+    model, model_size = load_model(KNOWN_CITIES[city].model_name)
+    candidate, candidate_size = load_candidate_model(KNOWN_CITIES[city].model_name)
+
+    with open(city_dir / "community_codes_dict.pkl", 'rb') as community_codes_file:
+        community_codes = pickle.load(community_codes_file)
+
+    geometry_artifact_path = ensure_geometry_artifact(city_dir / "boundaries.json", city_dir / "boundaries.feather")
+    geometry = load_geometry_artifact(geometry_artifact_path)
+    latitude, longitude = get_center_lat_lon(city_dir / "city_center_coordinates.txt")
+
+    shard = CityShard(
+        city=city,
+        model=model,
+        community_codes=community_codes,
+        community_areas=geometry.areas(),
+        community_distances=geometry.distances_to_center(latitude, longitude),
+        candidate=candidate,
+    )
+    SHARD_LOADS.labels(city=city).inc()
+    SHARD_LOAD_LATENCY.observe(time.perf_counter() - load_start)
+    MODEL_VERSION.labels(city=city, model_version=shard.model_version).set(1)
+
+    return shard, model_size + candidate_size + geometry_artifact_path.stat().st_size
+
+
+def evict_city_shard(city: str, shard: CityShard):
+    SHARD_EVICTIONS.labels(city=city).inc()
+    MODEL_VERSION.labels(city=city, model_version=shard.model_version).set(0)
+    logger.info("Shard evicted", extra={"fields": {"city": city}})
+
 
-COMMUNITY_DISTANCE_DICT = {
-    community_name: shape(COMMUNITY_GEOMETRY_DICT[community_name]).centroid.distance(Point(LONGITUDE, LATITUDE))
-    for community_name in COMMUNITY_GEOMETRY_DICT.keys()
-}
+def is_served_city(city: str) -> bool:
+    if SERVED_CITIES and city not in SERVED_CITIES:
+        return False
+    return city in KNOWN_CITIES and (SHARDS_DIR / city).is_dir()
 
 
-def prepare_features(input_data):
+KNOWN_CITIES = load_cities()
+# the shards are loaded on the first request for a city, so a process serving dozens
+# of cities keeps in memory only the ones requested recently
+SHARDS = ShardCache(load_city_shard, SHARD_CACHE_MAX_BYTES, on_evict=evict_city_shard)
+SHADOW = ShadowScorer(max_workers=SHADOW_WORKERS, max_pending=SHADOW_MAX_PENDING)
+
+
+def prepare_features(input_data, shard: CityShard):
     calculated_features = dict()
     start_date = date.fromisoformat(input_data["date"])
-    calculated_features['community'] = COMMUNITY_CODES_DICT[input_data["community"]]
+    calculated_features['community'] = shard.community_codes[input_data["community"]]
     calculated_features['day_of_year'] = start_date.timetuple().tm_yday
     calculated_features['day_of_week'] = start_date.weekday()
     calculated_features['is_weekend'] = int(start_date.weekday() in {5, 6})
     calculated_features['week'] = start_date.isocalendar().week
     calculated_features['month'] = start_date.month
-    calculated_features['area'] = COMMUNITY_AREA_DICT[input_data["community"]]
-    calculated_features['distance_to_center'] = COMMUNITY_DISTANCE_DICT[input_data["community"]]
+    calculated_features['area'] = shard.community_areas[input_data["community"]]
+    calculated_features['distance_to_center'] = shard.community_distances[input_data["community"]]
 
     features = [calculated_features[key] for key in MODEL_FEATURES]
 
     return features
 
 
-def predict(features):
-    pred = MODEL.predict([features])[0]
-    return round(pred)
+def predict_rate(features, model) -> float:
+    return float(model.predict([features])[0])
+
+
+def predict(features, model):
+    return round(predict_rate(features, model))
+
+
+def poisson_quantiles(rates: Sequence[float], quantiles: Sequence[float] = QUANTILES) -> np.ndarray:
+    """
+    Function derives prediction intervals from the Poisson rates predicted by the model
+    @param rates: expected numbers of trips, one per row of the feature matrix
+    @param quantiles: levels of the quantiles to calculate
+    @return: np.ndarray of shape (len(rates), len(quantiles)) with the quantiles of trips
+    """
+
+    rates = np.clip(np.asarray(rates, dtype=float), 0, None)
+    return poisson.ppf(np.asarray(quantiles)[np.newaxis, :], rates[:, np.newaxis])
+
+
+def predict_with_quantiles(
+    features_matrix: List[list], model, quantiles: Sequence[float] = QUANTILES
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Function scores the whole feature matrix with a single model call
+    and calculates all the requested quantiles from the predicted rates
+    @param features_matrix: list of feature vectors
+    @param model: the model of the city
+    @param quantiles: levels of the quantiles to calculate
+    @return: predicted rates and the matrix of their quantiles
+    """
+
+    rates = np.asarray(model.predict(features_matrix), dtype=float)
+    return rates, poisson_quantiles(rates, quantiles)
+
+
+def format_quantiles(quantile_values: Sequence[float], quantiles: Sequence[float] = QUANTILES) -> Dict[str, int]:
+    return {f"p{round(level * 100)}": int(value) for level, value in zip(quantiles, quantile_values)}
+
 
+def choose_model(shard: CityShard) -> Tuple[mlflow.pyfunc.PyFuncModel, str]:
+    """
+    Function routes CANARY_PERCENT of the requests to the candidate model of the city
+    @param shard: CityShard, the shard of the city
+    @return: the model to serve the request with and its stage
+    """
+
+    if shard.candidate is not None and random.random() * 100 < CANARY_PERCENT:
+        CANARY_REQUESTS.labels(city=shard.city).inc()
+        return shard.candidate, "Staging"
+    return shard.model, "Production"
+
+
+def submit_shadow_scoring(shard: CityShard, features: list, served_prediction: float) -> bool:
+    """
+    Function scores SHADOW_SAMPLE_RATE of the requests with the candidate model in the background,
+    a scoring is dropped if the executor is saturated
+    @param shard: CityShard, the shard of the city
+    @param features: list, the features of the request
+    @param served_prediction: float, the rate predicted by the served model before the rounding
+    @return: bool, True if the scoring is submitted
+    """
+
+    if shard.candidate is None or random.random() >= SHADOW_SAMPLE_RATE:
+        return False
+
+    def score_candidate() -> float:
+        try:
+            candidate_prediction = float(shard.candidate.predict([features])[0])
+        except Exception:
+            SHADOW_ERRORS.labels(city=shard.city).inc()
+            raise
+        SHADOW_REQUESTS.labels(city=shard.city).inc()
+        SHADOW_DIFFERENCE.labels(city=shard.city).observe(abs(candidate_prediction - served_prediction))
+        return candidate_prediction
 
-print(f'{datetime.now()} Starting app')
+    if not SHADOW.submit(shard.city, score_candidate, served_prediction):
+        SHADOW_DROPPED.labels(city=shard.city).inc()
+        return False
+    return True
+
+
+logger.info("Starting app")
 app = Flask('trips-prediction')
-print(f'{datetime.now()} App started')
+logger.info("App started")
 
 
 @app.route('/predict', methods=['POST'])
 def predict_endpoint():
+    request_start = time.perf_counter()
     community_date = request.get_json()
-    print(f"{datetime.now()} Request: {community_date}")
+    city = community_date.get("city", DEFAULT_CITY)
+
+    if not is_served_city(city):
+        UNKNOWN_CITIES.inc()
+        logger.warning("Unknown city", extra={"fields": {"request": community_date}})
+        return jsonify({'error': f"unknown city: {city}"}), 404
+
+    shard = SHARDS.get(city)
+
+    if community_date.get("community") not in shard.community_codes:
+        UNKNOWN_COMMUNITIES.labels(city=city).inc()
+        logger.warning("Unknown community", extra={"fields": {"request": community_date}})
+        return jsonify({'error': f"unknown community: {community_date.get('community')}"}), 400
+
+    with FEATURES_LATENCY.time():
+        features = prepare_features(community_date, shard)
+
+    model, stage = choose_model(shard)
+    with SCORING_LATENCY.time():
+        if community_date.get("quantiles", False):
+            rates, quantile_values = predict_with_quantiles([features], model)
+            rate = float(rates[0])
+            result = {
+                'trips': round(rate),
+                'trips_quantiles': format_quantiles(quantile_values[0]),
+                'model_version': model.metadata.run_id,
+            }
+        else:
+            rate = predict_rate(features, model)
+            result = {'trips': round(rate), 'model_version': model.metadata.run_id}
+    result['city'] = city
+    result['model_stage'] = stage
+
+    if stage == "Production":
+        # the candidate is compared with the rate before the rounding of the response
+        submit_shadow_scoring(shard, features, rate)
+
+    request_time = time.perf_counter() - request_start
+    REQUEST_LATENCY.observe(request_time)
+    log_fields = {"request": community_date, "trips": result['trips'], "seconds": request_time}
+    logger.info("Request", extra={"sampled": True, "fields": log_fields})
 
-    features = prepare_features(community_date)
-    pred = predict(features)
+    return jsonify(result)
 
-    result = {'trips': pred, 'model_version': MODEL.metadata.run_id}
 
-    return jsonify(result)
+@app.route('/shadow', methods=['GET'])
+def shadow_endpoint():
+    # the statistics are kept per worker process, the aggregated ones are in /metrics
+    stats = SHADOW.snapshot()
+    for city, shard in SHARDS.items():
+        if shard.candidate is not None:
+            stats.setdefault(city, {})["candidate_version"] = shard.candidate.metadata.run_id
+            stats[city]["model_version"] = shard.model_version
+
+    return jsonify(stats)
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+
+    return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
 
 
 # input_data = {"community": "LAKE VIEW", "date": "2020-09-20"}
 # input_data = {"community": "ENGLEWOOD", "date": "2020-10-15"}
 # input_data = {"community": "OHARE", "date": "2020-09-20"}
+# input_data = {"community": "LAKE VIEW", "date": "2020-09-20", "quantiles": True}
+# input_data = {"city": "chicago", "community": "LAKE VIEW", "date": "2020-09-20"}
 
 
 if __name__ == "__main__":
@@ -0,0 +1,99 @@
+"""Module for scoring candidate models in the shadow of the served ones"""
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Dict
+
+
+@dataclass
+class ShadowStats:
+    """
+    Running statistics of the comparison of a candidate model with the served one
+    """
+
+    requests: int = 0
+    errors: int = 0
+    dropped: int = 0
+    disagreements: int = 0
+    sum_abs_difference: float = 0.0
+    max_abs_difference: float = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        scored = self.requests - self.errors
+        return {
+            **asdict(self),
+            "mean_abs_difference": self.sum_abs_difference / scored if scored else None,
+            "disagreement_rate": self.disagreements / scored if scored else None,
+        }
+
+
+class ShadowScorer:
+    """
+    Bounded background executor scoring candidate models off the request path.
+    A scoring is dropped instead of queued when max_pending scorings are in flight,
+    so with a saturated executor a request pays only for a non-blocking semaphore acquire
+    """
+
+    def __init__(self, max_workers: int = 1, max_pending: int = 64, disagreement_tolerance: float = 0.1):
+        """
+        @param max_workers: int, the number of threads scoring the candidates
+        @param max_pending: int, the maximum number of scorings submitted and not finished yet
+        @param disagreement_tolerance: float, the relative difference of the predictions
+        counted as a disagreement
+        """
+
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="shadow")
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.disagreement_tolerance = disagreement_tolerance
+        self.stats: Dict[str, ShadowStats] = defaultdict(ShadowStats)
+        self._lock = threading.Lock()
+
+    def submit(self, key: str, score_candidate: Callable[[], float], served_prediction: float) -> bool:
+        """
+        Function submits scoring of a candidate model if the executor has a free slot
+        @param key: str, the key the statistics are kept by, e.g. the city
+        @param score_candidate: function returning the prediction of the candidate model
+        @param served_prediction: float, the prediction of the served model
+        @return: bool, True if the scoring is submitted, False if it is dropped
+        """
+
+        if not self.slots.acquire(blocking=False):
+            with self._lock:
+                self.stats[key].dropped += 1
+            return False
+
+        try:
+            future = self.executor.submit(self._score, key, score_candidate, served_prediction)
+        except RuntimeError:
+            # the executor is shut down
+            self.slots.release()
+            return False
+        future.add_done_callback(lambda _: self.slots.release())
+
+        return True
+
+    def _score(self, key: str, score_candidate: Callable[[], float], served_prediction: float):
+        try:
+            candidate_prediction = score_candidate()
+        except Exception:  # pylint: disable=broad-except
+            with self._lock:
+                self.stats[key].requests += 1
+                self.stats[key].errors += 1
+            return
+
+        abs_difference = abs(candidate_prediction - served_prediction)
+        with self._lock:
+            stats = self.stats[key]
+            stats.requests += 1
+            stats.sum_abs_difference += abs_difference
+            stats.max_abs_difference = max(stats.max_abs_difference, abs_difference)
+            if abs_difference > self.disagreement_tolerance * max(abs(served_prediction), 1.0):
+                stats.disagreements += 1
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {key: stats.to_dict() for key, stats in self.stats.items()}
+
+    def shutdown(self, wait: bool = True):
+        self.executor.shutdown(wait=wait)
@@ -0,0 +1,73 @@
+"""Module with a cache of the per-city shards of the prediction service"""
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Tuple
+
+
+class ShardCache:
+    """
+    LRU cache of shards loaded lazily on the first request.
+    The least recently used shards are evicted when the total size of the loaded shards
+    exceeds max_bytes, the shard in use is never evicted even if it is larger than max_bytes
+    """
+
+    def __init__(
+        self,
+        load_shard: Callable[[str], Tuple[Any, int]],
+        max_bytes: int,
+        on_evict: Callable[[str, Any], None] = lambda key, shard: None,
+    ):
+        """
+        @param load_shard: function returning the shard for a key and its size in bytes
+        @param max_bytes: int, the maximum total size of the loaded shards
+        @param on_evict: function called with the key and the shard when the shard is evicted
+        """
+
+        self.load_shard = load_shard
+        self.max_bytes = max_bytes
+        self.on_evict = on_evict
+        self._shards: "OrderedDict[str, Tuple[Any, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks: Dict[str, threading.Lock] = {}
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            if key in self._shards:
+                self._shards.move_to_end(key)
+                return self._shards[key][0]
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        # a shard is loaded outside the cache lock, so the other shards are served meanwhile,
+        # and only once if several threads request it at the same time
+        with load_lock:
+            with self._lock:
+                if key in self._shards:
+                    self._shards.move_to_end(key)
+                    return self._shards[key][0]
+            shard, size = self.load_shard(key)
+            with self._lock:
+                self._shards[key] = (shard, size)
+                self._evict()
+
+        return shard
+
+    def _evict(self):
+        while len(self._shards) > 1 and self.size_bytes > self.max_bytes:
+            key, (shard, _) = self._shards.popitem(last=False)
+            self.on_evict(key, shard)
+
+    @property
+    def size_bytes(self) -> int:
+        return sum(size for _, size in self._shards.values())
+
+    def keys(self) -> List[str]:
+        with self._lock:
+            return list(self._shards)
+
+    def items(self) -> List[Tuple[str, Any]]:
+        with self._lock:
+            return [(key, shard) for key, (shard, _) in self._shards.items()]
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return key in self._shards
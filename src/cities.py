@@ -0,0 +1,66 @@
+"""Module describing the cities the demand is forecasted in"""
+import json
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional
+
+CITIES_CONFIG_ENV = "CITIES_CONFIG"
+DEFAULT_CITY = "chicago"
+
+
+@dataclass(frozen=True)
+class City:
+    """
+    Data sources and the registered model of a city
+    """
+
+    name: str
+    rides_data_url: str
+    boundaries_url: str
+    coordinates_page_url: str
+    model_name: str
+    data_until: Optional[str] = None
+
+
+CITIES: Dict[str, City] = {
+    "chicago": City(
+        name="chicago",
+        rides_data_url="https://data.cityofchicago.org/api/views/3rse-fbp6/rows.csv?accessType=DOWNLOAD&bom=true&format=true&delimiter=%3B",
+        boundaries_url="https://data.cityofchicago.org/api/geospatial/cauq-8yn6?method=export&format=GeoJSON",
+        coordinates_page_url="https://www.latlong.net/place/chicago-il-usa-1855.html",
+        # the name the model was registered under before the other cities were added
+        model_name="escooter-demand-model",
+        data_until="2020-10-18",
+    ),
+}
+
+
+def load_cities(config_path: Optional[str] = None) -> Dict[str, City]:
+    """
+    Function loads the cities described in a JSON file in addition to the built-in ones.
+    The file maps the names of the cities to their data sources,
+    the model of a city is registered as escooter-demand-model-<city> unless model_name is given
+    @param config_path: str, the path of the JSON file, CITIES_CONFIG by default
+    @return: dict of the cities by their names
+    """
+
+    config_path = config_path or os.getenv(CITIES_CONFIG_ENV)
+    cities = dict(CITIES)
+    if config_path:
+        with open(config_path, "r", encoding="utf-8") as config_file:
+            for name, city in json.load(config_file).items():
+                cities[name] = City(name=name, **{"model_name": f"escooter-demand-model-{name}", **city})
+
+    return cities
+
+
+def get_city(name: str) -> City:
+    cities = load_cities()
+    if name not in cities:
+        raise ValueError(f"unknown city: {name}")
+    return cities[name]
+
+
+def get_city_path(path: str, city: str) -> Path:
+    return Path(path) / city
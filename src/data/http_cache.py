@@ -0,0 +1,118 @@
+"""Module providing conditional downloading of data sources"""
+import json
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+_SESSION: Optional[requests.Session] = None
+
+
+def create_session(retries: int = 3, backoff_factor: float = 0.5) -> requests.Session:
+    """
+    Function creates a session with a pool of connections retrying failed requests with a backoff
+    @param retries: int, the number of retries of a request
+    @param backoff_factor: float, the backoff factor between the retries
+    @return: requests.Session
+    """
+
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=("GET", "HEAD"),
+    )
+    adapter = HTTPAdapter(max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    return session
+
+
+def get_session() -> requests.Session:
+    global _SESSION  # pylint: disable=global-statement
+    if _SESSION is None:
+        _SESSION = create_session()
+    return _SESSION
+
+
+def get_metadata_path(cached_path: Path) -> Path:
+    return cached_path.with_name(cached_path.name + ".http.json")
+
+
+def read_metadata(cached_path: Path) -> Dict[str, Any]:
+    metadata_path = get_metadata_path(cached_path)
+    if not cached_path.exists() or not metadata_path.exists():
+        return {}
+    with open(metadata_path, "r", encoding="utf-8") as metadata_file:
+        return json.load(metadata_file)
+
+
+def fetch_if_changed(
+    url: str,
+    cached_path: Path,
+    save: Callable[[requests.Response], None],
+    session: Optional[requests.Session] = None,
+    timeout: float = 3,
+) -> bool:
+    """
+    Function downloads a source only if it has changed since the last download.
+    The ETag and Last-Modified headers of the last download are kept next to the cached file
+    and sent as If-None-Match and If-Modified-Since, so an unchanged source costs one 304 response.
+    A source sending neither of them is not requested again once its download is recorded.
+    The cached file is used when the source is unavailable or responds with an error
+    @param url: str, the address of the source
+    @param cached_path: Path, the path of the file the source is saved into
+    @param save: function saving the response into cached_path
+    @param session: requests.Session to send the request with, the shared session by default
+    @param timeout: float, the timeout of the request
+    @return: bool, True if the source was downloaded and saved, False if the cached file is up to date
+    """
+
+    session = session or get_session()
+    metadata = read_metadata(cached_path)
+    headers = {}
+    if metadata.get("url") == url:
+        if metadata.get("etag"):
+            headers["If-None-Match"] = metadata["etag"]
+        if metadata.get("last_modified"):
+            headers["If-Modified-Since"] = metadata["last_modified"]
+    # there is no way to check the source has changed if the last download recorded no validators,
+    # a file cached without the metadata is downloaded again to record them
+    if cached_path.exists() and not headers and metadata.get("url") == url:
+        return False
+
+    try:
+        response = session.get(url, headers=headers, allow_redirects=True, timeout=timeout, stream=True)
+    except requests.RequestException as error:
+        if cached_path.exists():
+            print(f"{url} is unavailable ({error}), using {cached_path}")
+            return False
+        raise
+
+    with response:
+        if response.status_code == 304:
+            return False
+        try:
+            response.raise_for_status()
+        except requests.HTTPError as error:
+            if cached_path.exists():
+                print(f"Warning: {url} responded with an error ({error}), using {cached_path}")
+                return False
+            raise
+
+        cached_path.parent.mkdir(parents=True, exist_ok=True)
+        save(response)
+
+    metadata = {
+        "url": url,
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+    }
+    with open(get_metadata_path(cached_path), "w", encoding="utf-8") as metadata_file:
+        json.dump(metadata, metadata_file)
+
+    return True
@@ -10,6 +10,11 @@ import pandas as pd
 import requests
 from prefect import task
 
+from src.cities import DEFAULT_CITY, get_city, get_city_path
+from src.data.http_cache import fetch_if_changed
+from src.features.geometry_store import ensure_geometry_artifact
+from src.pipeline.instrumentation import instrument_stage, record_rows
+
 JSONType = Union[str, int, float, bool, None, Dict[str, Any], List[Any]]
 
 BUCKET_NAME = "serjeeon-learning-bucket"
@@ -29,15 +34,12 @@ def load_rides_data(
     @return: pandas DataFrame, the rides dataset
     """
 
-    if path_to_save_raw_data.exists():
-        print("raw rides data already exist. skipping downloading")
-    else:
+    def save_rides_data(response: requests.Response):
         print("downloading raw rides data")
-        response = requests.get(url_download_file_from, allow_redirects=True, timeout=3)
         temp_csv_file = os.path.splitext(str(path_to_save_raw_data))[0] + ".csv"
-        path_to_save_raw_data.parent.mkdir(parents=True, exist_ok=True)
         with open(temp_csv_file, "wb") as temp_file:
-            temp_file.write(response.content)
+            for chunk in response.iter_content(chunk_size=1 << 20):
+                temp_file.write(chunk)
         data = pd.read_csv(temp_csv_file, sep=";")
         data.dropna(subset=["Start Community Area Name"], inplace=True)
         data.loc[:, "Start Community Area Number"] = data["Start Community Area Number"].astype(int)
@@ -45,6 +47,9 @@ def load_rides_data(
         print(f"raw rides data saved to {path_to_save_raw_data}")
         os.remove(temp_csv_file)
 
+    if not fetch_if_changed(url_download_file_from, path_to_save_raw_data, save_rides_data):
+        print("raw rides data has not changed. skipping downloading")
+
     data = pd.read_parquet(path_to_save_raw_data)
 
     if return_data:
@@ -67,19 +72,19 @@ def load_boundaries_data(
     @return: json: the districts boundaries data
     """
 
-    if path_to_save_raw_data.exists():
-        print("boundaries data already exist. skipping downloading")
-        with open(path_to_save_raw_data, "r", encoding="utf-8") as file_with_boundaries:
-            communities_boundaries_json = json.load(file_with_boundaries)
-    else:
+    def save_boundaries_data(response: requests.Response):
         print("downloading boundaries data")
-        response = requests.get(url_download_file_from, allow_redirects=True, timeout=3)
         communities_boundaries_json = json.loads(response.text)
-        path_to_save_raw_data.parent.mkdir(parents=True, exist_ok=True)
         with open(path_to_save_raw_data, "w", encoding="utf-8") as file_with_boundaries:
             json.dump(communities_boundaries_json, file_with_boundaries)
         print(f"boundaries data saved to {path_to_save_raw_data}")
 
+    if not fetch_if_changed(url_download_file_from, path_to_save_raw_data, save_boundaries_data):
+        print("boundaries data has not changed. skipping downloading")
+
+    with open(path_to_save_raw_data, "r", encoding="utf-8") as file_with_boundaries:
+        communities_boundaries_json = json.load(file_with_boundaries)
+
     if return_data:
         return communities_boundaries_json
     return None
@@ -91,22 +96,33 @@ def upload_data_to_s3(filename):
 
 
 @task(retries=3, retry_delay_seconds=2, name="Read escooter trips data")
+@instrument_stage("load_raw_data")
 def load_raw_data(
-    rides_data_url: str = "https://data.cityofchicago.org/api/views/3rse-fbp6/rows.csv?accessType=DOWNLOAD&bom=true&format=true&delimiter=%3B",
-    boundaries_url: str = "https://data.cityofchicago.org/api/geospatial/cauq-8yn6?method=export&format=GeoJSON",
+    city: str = DEFAULT_CITY,
+    rides_data_url: Optional[str] = None,
+    boundaries_url: Optional[str] = None,
     path_to_raw_data: str = "data/raw",
 ):
     log_fmt = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
     logging.basicConfig(level=logging.INFO, format=log_fmt)
 
-    rides_data_filepath = Path.joinpath(Path(path_to_raw_data), "rides_data.parquet")
-    load_rides_data(rides_data_url, rides_data_filepath, return_data=True)
+    city_config = get_city(city)
+    path_to_raw_data = get_city_path(path_to_raw_data, city)
+    path_to_raw_data.mkdir(parents=True, exist_ok=True)
+
+    rides_data_filepath = Path.joinpath(path_to_raw_data, "rides_data.parquet")
+    rides_data = load_rides_data(rides_data_url or city_config.rides_data_url, rides_data_filepath, return_data=True)
+    record_rows(rows_out=len(rides_data))
     upload_data_to_s3(rides_data_filepath)
 
-    boundaries_filepath = Path.joinpath(Path(path_to_raw_data), "boundaries.json")
-    load_boundaries_data(boundaries_url, boundaries_filepath, return_data=True)
+    boundaries_filepath = Path.joinpath(path_to_raw_data, "boundaries.json")
+    load_boundaries_data(boundaries_url or city_config.boundaries_url, boundaries_filepath, return_data=True)
     upload_data_to_s3(boundaries_filepath)
 
+    geometry_artifact_filepath = Path.joinpath(path_to_raw_data, "boundaries.feather")
+    ensure_geometry_artifact(boundaries_filepath, geometry_artifact_filepath)
+    upload_data_to_s3(geometry_artifact_filepath)
+
 
 if __name__ == "__main__":
     load_raw_data()
@@ -1,15 +1,32 @@
 """Module providing functions for scraping external data"""
 import logging
 import os
+import re
 from pathlib import Path
-from typing import Tuple
+from typing import Optional, Tuple
 
 import boto3
 import requests
 from bs4 import BeautifulSoup
 from prefect import task
 
+from src.cities import DEFAULT_CITY, get_city, get_city_path
+from src.data.http_cache import fetch_if_changed
+from src.pipeline.instrumentation import instrument_stage
+
 BUCKET_NAME = "serjeeon-learning-bucket"
+COORDINATES_TEXT = re.compile("Latitude and longitude coordinates are:")
+
+
+def parse_city_center_coordinates(html_doc: bytes) -> str:
+    """
+    Function finds the coordinates of the city center on the page
+    @param html_doc: bytes, the page from latlong.net
+    @return: str, the coordinates in the "lat, lon" format
+    """
+
+    soup = BeautifulSoup(html_doc, "html.parser")
+    return soup.find(string=COORDINATES_TEXT).find_next("strong").text
 
 
 def scrape_city_center_coordinates(url: str, city_center_filepath: Path) -> Tuple[float, float]:
@@ -22,26 +39,20 @@ def scrape_city_center_coordinates(url: str, city_center_filepath: Path) -> Tupl
     @return: Tuple[float, float], the coordinates of the city center
     """
 
-    if city_center_filepath.exists():
-        with open(city_center_filepath, "r", encoding="utf-8") as file_with_coords:
-            coordinates_str_list = file_with_coords.read().split(",")
-            lat, lon = float(coordinates_str_list[0]), float(coordinates_str_list[1])
-            print("skipping scrapping")
-    else:
-        html_doc = requests.get(url, allow_redirects=True, timeout=3).content
-        soup = BeautifulSoup(html_doc, "html.parser")
-        coordinates_element = soup.find_all(
-            lambda tag: len(tag.find_all("p")) == 0 and "Latitude and longitude coordinates are:" in tag.text
-        )[0]
-        coordinates_str = coordinates_element.find("strong").text
-        city_center_filepath.parent.mkdir(parents=True, exist_ok=True)
+    def save_coordinates(response: requests.Response):
+        coordinates_str = parse_city_center_coordinates(response.content)
         with open(city_center_filepath, "w", encoding="utf-8") as file_with_coords:
             file_with_coords.write(coordinates_str)
         print(coordinates_str)
-        coordinates_str_list = coordinates_str.split(",")
-        lat, lon = float(coordinates_str_list[0]), float(coordinates_str_list[1])
         print("scrapping finished")
 
+    if not fetch_if_changed(url, city_center_filepath, save_coordinates):
+        print("skipping scrapping")
+
+    with open(city_center_filepath, "r", encoding="utf-8") as file_with_coords:
+        coordinates_str_list = file_with_coords.read().split(",")
+        lat, lon = float(coordinates_str_list[0]), float(coordinates_str_list[1])
+
     return lat, lon
 
 
@@ -58,15 +69,21 @@ def upload_data_to_s3(filename):
 # )
 # @click.option("--path_to_external_data", default="./data/external", help="Path to external data")
 @task(retries=3, retry_delay_seconds=2, name="Scrape external geodata")
+@instrument_stage("scrape_external_data")
 def scrape_external_data(
-    coordinates_page_url: str = "https://www.latlong.net/place/chicago-il-usa-1855.html",
+    city: str = DEFAULT_CITY,
+    coordinates_page_url: Optional[str] = None,
     path_to_external_data: str = "data/external",
 ):
     log_fmt = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
     logging.basicConfig(level=logging.INFO, format=log_fmt)
 
-    city_center_coordinates_filepath = Path.joinpath(Path(path_to_external_data), "city_center_coordinates.txt")
-    scrape_city_center_coordinates(coordinates_page_url, city_center_coordinates_filepath)
+    city_center_coordinates_filepath = Path.joinpath(
+        get_city_path(path_to_external_data, city), "city_center_coordinates.txt"
+    )
+    scrape_city_center_coordinates(
+        coordinates_page_url or get_city(city).coordinates_page_url, city_center_coordinates_filepath
+    )
     upload_data_to_s3(city_center_coordinates_filepath)
 
 
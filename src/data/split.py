@@ -1,24 +1,84 @@
 import os
 from pathlib import Path
-from typing import Tuple
+from typing import List, Tuple
 
 import boto3
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 from prefect import task
 
+from src.cities import DEFAULT_CITY, get_city_path
+from src.pipeline.instrumentation import instrument_stage, record_rows
+
 BUCKET_NAME = "serjeeon-learning-bucket"
 
 
-def split_train_test(df: pd.DataFrame, test_size: float) -> Tuple[pd.DataFrame, pd.DataFrame]:
-    df.sort_values("start_day", inplace=True)
-    days = sorted(df["start_day"].unique())
+def get_test_start(days: List, test_size: float):
+    days = sorted(days)
     days_in_test_num = round(test_size * len(days))
-    test_start = days[-days_in_test_num]
+
+    return days[-days_in_test_num]
+
+
+def split_train_test(df: pd.DataFrame, test_size: float) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    df.sort_values("start_day", inplace=True, kind="stable")
+    test_start = get_test_start(df["start_day"].unique(), test_size)
     train, test = df[df["start_day"] < test_start], df[df["start_day"] >= test_start]
 
     return train, test
 
 
+def split_train_test_streaming(
+    features_path: Path, train_path: Path, test_path: Path, test_size: float, batch_size: int = 1 << 16
+) -> Tuple[int, int]:
+    """
+    Function splits a parquet dataset sorted by start_day into train and test datasets
+    without loading it into memory: the first day of the test is found by a scan
+    of the start_day column, then record batches are routed to the train and test writers
+    as they are read. The result is the same as the result of split_train_test
+    @param features_path: Path, the path of the features dataset
+    @param train_path: Path, the path of the train dataset
+    @param test_path: Path, the path of the test dataset
+    @param test_size: float, the share of the days in the test dataset
+    @param batch_size: int, the number of rows in a record batch
+    @return: the numbers of rows in the train and test datasets
+    """
+
+    features_file = pq.ParquetFile(features_path)
+    days = set()
+    for batch in features_file.iter_batches(batch_size=batch_size, columns=["start_day"]):
+        days.update(pc.unique(batch.column("start_day")).to_pylist())
+    start_day_type = features_file.schema_arrow.field("start_day").type
+    test_start = pa.scalar(get_test_start(list(days), test_size), type=start_day_type)
+
+    rows_num = {"train": 0, "test": 0}
+    last_day = None
+    with pq.ParquetWriter(train_path, features_file.schema_arrow) as train_writer, pq.ParquetWriter(
+        test_path, features_file.schema_arrow
+    ) as test_writer:
+        for batch in features_file.iter_batches(batch_size=batch_size):
+            batch_days = batch.column("start_day")
+            if len(batch_days) == 0:
+                continue
+            first_day = batch_days[0]
+            if (last_day is not None and pc.less(first_day, last_day).as_py()) or pc.any(
+                pc.less(batch_days[1:], batch_days[:-1])
+            ).as_py():
+                raise ValueError(f"{features_path} is not sorted by start_day")
+            last_day = batch_days[-1]
+
+            is_test = pc.greater_equal(batch_days, test_start)
+            train_batch, test_batch = batch.filter(pc.invert(is_test)), batch.filter(is_test)
+            train_writer.write_batch(train_batch)
+            test_writer.write_batch(test_batch)
+            rows_num["train"] += train_batch.num_rows
+            rows_num["test"] += test_batch.num_rows
+
+    return rows_num["train"], rows_num["test"]
+
+
 def upload_data_to_s3(filename):
     client = boto3.client("s3")
     client.upload_file(filename, BUCKET_NAME, os.path.join("escooters-demand", filename))
@@ -33,17 +93,36 @@ def upload_data_to_s3(filename):
 #     help="Path to processed data",
 # )
 @task(retries=3, retry_delay_seconds=2, name="Split dataset into train and test datasets")
+@instrument_stage("split_dataset")
 def split_dataset(
+    city: str = DEFAULT_CITY,
     test_size: float = 0.15,
     path_to_interim_data: str = "data/interim",
     path_to_processed_data: str = "data/processed",
+    streaming: bool = True,
 ):
-    features_df = pd.read_parquet(Path.joinpath(Path(path_to_interim_data), "interim_features.parquet"))
+    path_to_processed_data = get_city_path(path_to_processed_data, city)
+    features_path = Path.joinpath(get_city_path(path_to_interim_data, city), "interim_features.parquet")
+    train_path = Path.joinpath(path_to_processed_data, "train.parquet")
+    test_path = Path.joinpath(path_to_processed_data, "test.parquet")
+    train_path.parent.mkdir(parents=True, exist_ok=True)
+
+    if streaming:
+        try:
+            train_rows_num, test_rows_num = split_train_test_streaming(features_path, train_path, test_path, test_size)
+            record_rows(rows_in=train_rows_num + test_rows_num, rows_out=train_rows_num + test_rows_num)
+        except ValueError as error:
+            print(f"{error}, splitting in memory")
+            streaming = False
+
+    if not streaming:
+        features_df = pd.read_parquet(features_path)
+        train, test = split_train_test(features_df, test_size)
+        record_rows(rows_in=len(features_df), rows_out=len(train) + len(test))
+        train.to_parquet(train_path)
+        test.to_parquet(test_path)
 
-    train, test = split_train_test(features_df, test_size)
-    train.to_parquet(Path.joinpath(Path(path_to_processed_data), "train.parquet"))
-    test.to_parquet(Path.joinpath(Path(path_to_processed_data), "test.parquet"))
-    upload_data_to_s3(Path.joinpath(Path(path_to_processed_data), "test.parquet"))
+    upload_data_to_s3(test_path)
 
 
 if __name__ == "__main__":
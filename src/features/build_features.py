@@ -1,17 +1,26 @@
 """Module for generating features"""
-import json
 import pickle
 from datetime import datetime
 from itertools import product
 from pathlib import Path
-from typing import Any, Dict, List, Tuple, Union
+from typing import Any, Dict, List, Optional, Tuple, Union
 
+import numpy as np
 import pandas as pd
+import pyarrow.parquet as pq
 from prefect import task
 from shapely.geometry import Point, shape
 
+from src.cities import DEFAULT_CITY, get_city, get_city_path
+from src.features.community_codes import create_community_codes_dict
+from src.features.definitions import INTERIM_FEATURES
+from src.features.geometry_store import CommunityGeometry, ensure_geometry_artifact, load_geometry_artifact
+from src.pipeline.instrumentation import instrument_stage, record_rows
+
 JSONType = Union[str, int, float, bool, None, Dict[str, Any], List[Any]]
 
+FEATURIZE_ENGINES = ["pandas", "duckdb"]
+
 
 def correct_formats(data: pd.DataFrame) -> pd.DataFrame:
     """
@@ -25,12 +34,55 @@ def correct_formats(data: pd.DataFrame) -> pd.DataFrame:
     return data
 
 
+def aggregate_trips(rides_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Function aggregates the trips per community and day in a single group-by pass over the starts
+    and the ends of the trips stacked together. A start counts to the number of rides, the distance,
+    duration and vendor statistics of its community, an end counts to the inflow of its community
+    @param rides_df: pd.DataFrame, rides data with the formats corrected
+    @return: pd.DataFrame with the number of rides and the trip aggregates by start_day and community
+    """
+
+    trips_num = len(rides_df)
+    vendor_trips = pd.get_dummies(rides_df["Vendor"], dtype=float)
+    vendor_columns = [f"vendor_{i}" for i in range(vendor_trips.shape[1])]
+    stacked = pd.DataFrame(
+        {
+            "start_day": np.concatenate(
+                [rides_df["Start Time"].dt.normalize().values, rides_df["End Time"].dt.normalize().values]
+            ),
+            "community": np.concatenate(
+                [rides_df["Start Community Area Number"].values, rides_df["End Community Area Number"].values]
+            ),
+            "started": np.repeat([1, 0], trips_num),
+            "ended": np.repeat([0, 1], trips_num),
+            "trip_distance": np.concatenate([rides_df["Trip Distance"].values, np.full(trips_num, np.nan)]),
+            "trip_duration": np.concatenate([rides_df["Trip Duration"].values, np.full(trips_num, np.nan)]),
+        }
+    )
+    stacked[vendor_columns] = np.concatenate([vendor_trips.values, np.zeros(vendor_trips.shape)])
+
+    aggregates = stacked.groupby(["start_day", "community"]).agg(
+        rides_number=("started", "sum"),
+        inflow=("ended", "sum"),
+        mean_trip_distance=("trip_distance", "mean"),
+        median_trip_distance=("trip_distance", "median"),
+        mean_trip_duration=("trip_duration", "mean"),
+        **{column: (column, "sum") for column in vendor_columns},
+    )
+    aggregates["vendors_number"] = (aggregates[vendor_columns] > 0).sum(axis=1)
+    aggregates["top_vendor_share"] = aggregates[vendor_columns].max(axis=1) / aggregates["rides_number"]
+
+    return aggregates.drop(columns=vendor_columns).reset_index()
+
+
 def get_dataset_to_featurize(rides_df: pd.DataFrame) -> pd.DataFrame:
     """
     Function creates a dataset with all combinations of communities and dates
     @param rides_df: pd.DataFrame, input DataFrame with rides data
     @return: pd.DataFrame, a dataset with all combinations of communities
-    and dates and target value for each combination  - the number of rides
+    and dates, target value for each combination  - the number of rides,
+    and the aggregates of the trips
     """
     rides_df["start_day"] = rides_df["Start Time"].dt.date
     days = list(pd.date_range(rides_df["start_day"].min(), rides_df["start_day"].max(), freq="1D"))
@@ -43,21 +95,11 @@ def get_dataset_to_featurize(rides_df: pd.DataFrame) -> pd.DataFrame:
     full_df.sort_values(["start_day", "community"], inplace=True)
     full_df["community"] = full_df["community"].astype(int)
 
-    community_rides_stat = (
-        rides_df.groupby([pd.Grouper(key="Start Time", freq="d"), "Start Community Area Number"])
-        .agg(rides_number=("Start Community Area Number", "count"))
-        .reset_index()
-    )
-    community_rides_stat["start_day"] = pd.to_datetime(community_rides_stat["Start Time"].dt.date)
-    community_rides_stat.columns = [
-        "Start Time",
-        "community",
-        "rides_number",
-        "start_day",
-    ]
-
-    full_df = full_df.merge(community_rides_stat, how="left", on=["start_day", "community"]).fillna(0)
-    full_df = full_df[["start_day", "community", "rides_number"]]
+    full_df = full_df.merge(aggregate_trips(rides_df), how="left", on=["start_day", "community"])
+    # the counts are zero on the days without trips, the statistics of the trips stay missing
+    counts = ["rides_number", "inflow", "vendors_number"]
+    full_df[counts] = full_df[counts].fillna(0).astype(float)
+    full_df["net_flow"] = full_df["inflow"] - full_df["rides_number"]
 
     return full_df
 
@@ -113,21 +155,53 @@ def build_features_on_geodata(data: pd.DataFrame, boundaries: JSONType, lat: flo
     return data
 
 
-def create_community_codes_dict(data):
-    community_codes_df = data[['Start Community Area Number', 'Start Community Area Name']]
-    community_codes_df.dropna(inplace=True)
-    community_codes_df.loc[:, 'Start Community Area Number'] = community_codes_df['Start Community Area Number'].astype(
-        int
-    )
-    community_codes_df_dict = (
-        community_codes_df[['Start Community Area Number', 'Start Community Area Name']]
-        .drop_duplicates()
-        .dropna()
-        .set_index('Start Community Area Name')['Start Community Area Number']
-        .to_dict()
-    )
+def build_features_on_community_geometry(
+    data: pd.DataFrame, geometry: CommunityGeometry, lat: float, lon: float
+) -> pd.DataFrame:
+    """
+    Function generates features based on geographical data loaded from the geometry artifact,
+    the features are calculated once per community instead of once per row
+    @param data: input DataFrame
+    @param geometry: geometry of the communities
+    @param lat: latitude of the city center
+    @param lon: longitude of the city center
+    @return: DataFrame with features on geographical data
+    """
 
-    return community_codes_df_dict
+    data = data[data["community_name"] != "None"]
+    data["area"] = data["community_name"].map(geometry.areas())
+    data["distance_to_center"] = data["community_name"].map(geometry.distances_to_center(lat, lon))
+
+    return data
+
+
+def build_features_pandas(
+    rides_path: Path, geometry: CommunityGeometry, lat: float, lon: float, data_until: Optional[str] = None
+) -> Tuple[pd.DataFrame, Dict[str, int]]:
+    """
+    Function builds the dense communities x days dataset with the features on date and on geographical data
+    @param rides_path: Path, the raw rides data
+    @param geometry: geometry of the communities
+    @param lat: latitude of the city center
+    @param lon: longitude of the city center
+    @param data_until: str, the date the days are taken before, all days if None
+    @return: the features and the codes of the community names
+    """
+
+    clean_data = correct_formats(pd.read_parquet(rides_path))
+
+    dataset_to_featurize = get_dataset_to_featurize(clean_data)
+    features = build_features_on_date(dataset_to_featurize)
+
+    community_codes_dict = create_community_codes_dict(clean_data)
+    community_codes_inv_dict = {v: k for k, v in community_codes_dict.items()}
+    features['community_name'] = features['community'].map(community_codes_inv_dict)
+
+    features = build_features_on_community_geometry(features, geometry, lat, lon)
+    if data_until is not None:
+        features = features[features["start_day"] < datetime.fromisoformat(data_until)]
+
+    return features[INTERIM_FEATURES], community_codes_dict
 
 
 # @click.command()
@@ -135,53 +209,55 @@ def create_community_codes_dict(data):
 # @click.option("--path_to_external_data", default="./data/external", help="Path to external data")
 # @click.option("--path_to_interim_data", default="./data/interim", help="Path to interim data")
 @task(retries=3, retry_delay_seconds=2, name="Build features")
+@instrument_stage("featurize")
 def featurize(
+    city: str = DEFAULT_CITY,
     path_to_raw_data: str = "./data/raw",
     path_to_external_data: str = "./data/external",
     path_to_interim_data: str = "./data/interim",
     path_to_references: str = "./data/references",
+    engine: str = "pandas",
 ):
-    rides_data_filepath = Path.joinpath(Path(path_to_raw_data), "rides_data.parquet")
-    input_data = pd.read_parquet(rides_data_filepath)
+    if engine not in FEATURIZE_ENGINES:
+        raise ValueError(f"Unknown featurize engine {engine}, expected one of {', '.join(FEATURIZE_ENGINES)}")
 
-    clean_data = correct_formats(input_data)
+    city_config = get_city(city)
+    path_to_raw_data = get_city_path(path_to_raw_data, city)
+    path_to_external_data = get_city_path(path_to_external_data, city)
+    path_to_interim_data = get_city_path(path_to_interim_data, city)
+    path_to_references = get_city_path(path_to_references, city)
 
-    dataset_to_featurize = get_dataset_to_featurize(clean_data)
-    features = build_features_on_date(dataset_to_featurize)
+    rides_data_filepath = Path.joinpath(path_to_raw_data, "rides_data.parquet")
 
-    with open(Path.joinpath(Path(path_to_raw_data), "boundaries.json"), "r", encoding="utf-8") as boundaries_file:
-        geometry_data = json.load(boundaries_file)["features"]
+    geometry_artifact_path = ensure_geometry_artifact(
+        Path.joinpath(path_to_raw_data, "boundaries.json"),
+        Path.joinpath(path_to_raw_data, "boundaries.feather"),
+    )
+    geometry = load_geometry_artifact(geometry_artifact_path)
 
-    latitude, longitude = get_center_lat_lon(Path.joinpath(Path(path_to_external_data), "city_center_coordinates.txt"))
+    latitude, longitude = get_center_lat_lon(Path.joinpath(path_to_external_data, "city_center_coordinates.txt"))
 
-    community_codes_dict = create_community_codes_dict(clean_data)
-    community_codes_inv_dict = {v: k for k, v in community_codes_dict.items()}
-    features['community_name'] = features['community'].map(community_codes_inv_dict)
+    if engine == "duckdb":
+        from src.features.duckdb_features import build_features_duckdb
 
-    features = build_features_on_geodata(features, geometry_data, latitude, longitude)
+        features, community_codes_dict = build_features_duckdb(
+            rides_data_filepath, geometry, latitude, longitude, city_config.data_until
+        )
+    else:
+        features, community_codes_dict = build_features_pandas(
+            rides_data_filepath, geometry, latitude, longitude, city_config.data_until
+        )
 
-    features_filepath = Path.joinpath(Path(path_to_interim_data), "interim_features.parquet")
+    features_filepath = Path.joinpath(path_to_interim_data, "interim_features.parquet")
     features_filepath.parent.mkdir(parents=True, exist_ok=True)
 
-    community_codes_filepath = Path.joinpath(Path(path_to_references), "community_codes_dict.pkl")
+    community_codes_filepath = Path.joinpath(path_to_references, "community_codes_dict.pkl")
     community_codes_filepath.parent.mkdir(parents=True, exist_ok=True)
     with open(community_codes_filepath, "wb") as community_codes_file:
         pickle.dump(community_codes_dict, community_codes_file)
 
-    features_names = [
-        "start_day",
-        "community",
-        "rides_number",
-        "day_of_year",
-        "day_of_week",
-        "is_weekend",
-        "week",
-        "month",
-        "area",
-        "distance_to_center",
-    ]
-    features = features[features["start_day"] < datetime(2020, 10, 18)]
-    features[features_names].to_parquet(features_filepath)
+    features.to_parquet(features_filepath)
+    record_rows(rows_in=pq.ParquetFile(rides_data_filepath).metadata.num_rows, rows_out=len(features))
     print('ready')
 
 
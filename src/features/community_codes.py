@@ -0,0 +1,21 @@
+"""Module with the codes of the community names shared by the feature engines"""
+from typing import Dict
+
+import pandas as pd
+
+
+def create_community_codes_dict(data: pd.DataFrame) -> Dict[str, int]:
+    community_codes_df = data[['Start Community Area Number', 'Start Community Area Name']]
+    community_codes_df.dropna(inplace=True)
+    community_codes_df.loc[:, 'Start Community Area Number'] = community_codes_df['Start Community Area Number'].astype(
+        int
+    )
+    community_codes_df_dict = (
+        community_codes_df[['Start Community Area Number', 'Start Community Area Name']]
+        .drop_duplicates()
+        .dropna()
+        .set_index('Start Community Area Name')['Start Community Area Number']
+        .to_dict()
+    )
+
+    return community_codes_df_dict
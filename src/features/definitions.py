@@ -0,0 +1,25 @@
+"""Module with the definitions of the features shared by the training, the serving and the monitoring"""
+
+TARGET = "rides_number"
+
+DATE_FEATURES = ["day_of_year", "day_of_week", "is_weekend", "week", "month"]
+GEO_FEATURES = ["area", "distance_to_center"]
+# the order of the features is the order the model is trained and scored with
+MODEL_FEATURES = ["community", *DATE_FEATURES, *GEO_FEATURES]
+CATEGORICAL_FEATURES = ["community", "day_of_week", "is_weekend"]
+NUMERICAL_FEATURES = [feature for feature in MODEL_FEATURES if feature not in CATEGORICAL_FEATURES]
+
+# the aggregates of the trips of a community-day are known only after the day ends, they describe
+# the demand of the day like the target does, so they are not inputs of the model forecasting it
+TRIP_AGGREGATES = [
+    "mean_trip_distance",
+    "median_trip_distance",
+    "mean_trip_duration",
+    "vendors_number",
+    "top_vendor_share",
+    "inflow",
+    "net_flow",
+]
+
+# the columns of interim_features.parquet
+INTERIM_FEATURES = ["start_day", "community", TARGET, *DATE_FEATURES, *GEO_FEATURES, *TRIP_AGGREGATES]
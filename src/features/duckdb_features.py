@@ -0,0 +1,184 @@
+"""Module for building the features with a single DuckDB query over the raw rides data"""
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import duckdb
+import pandas as pd
+
+from src.features.community_codes import create_community_codes_dict
+from src.features.definitions import INTERIM_FEATURES
+from src.features.geometry_store import CommunityGeometry
+
+# the format of the times in the raw rides data, e.g. 10/18/2020 05:00:00 PM
+RAW_TIME_FORMAT = "%m/%d/%Y %I:%M:%S %p"
+
+FEATURES_QUERY = """
+with rides as (
+    select
+        {start_time}::date as start_day,
+        {end_time}::date as end_day,
+        "Start Community Area Number" as community,
+        "End Community Area Number" as end_community,
+        "Trip Distance"::double as trip_distance,
+        "Trip Duration"::double as trip_duration,
+        "Vendor" as vendor
+    from read_parquet('{rides_path}')
+),
+trips as (
+    select start_day, community, 1 as started, 0 as ended, trip_distance, trip_duration, vendor
+    from rides
+    where community is not null
+    union all
+    select end_day, end_community, 0, 1, null, null, null
+    from rides
+    where community is not null
+),
+days as (
+    select unnest(generate_series(first_day, last_day, interval 1 day)) as start_day
+    from (select min(start_day)::timestamp as first_day, max(start_day)::timestamp as last_day from rides)
+),
+communities as (
+    select distinct community from rides where community is not null
+),
+trips_stat as (
+    select
+        start_day::timestamp as start_day,
+        community,
+        sum(started) as rides_number,
+        sum(ended) as inflow,
+        avg(trip_distance) as mean_trip_distance,
+        median(trip_distance) as median_trip_distance,
+        avg(trip_duration) as mean_trip_duration,
+        histogram(vendor) as vendor_trips
+    from trips
+    where community is not null and start_day is not null
+    group by all
+),
+grid as (
+    select
+        days.start_day,
+        communities.community,
+        coalesce(trips_stat.rides_number, 0)::double as rides_number,
+        coalesce(trips_stat.inflow, 0)::double as inflow,
+        trips_stat.mean_trip_distance,
+        trips_stat.median_trip_distance,
+        trips_stat.mean_trip_duration,
+        coalesce(cardinality(trips_stat.vendor_trips), 0)::double as vendors_number,
+        coalesce(list_max(map_values(trips_stat.vendor_trips)), 0)
+            / nullif(trips_stat.rides_number, 0) as top_vendor_share,
+        row_number() over (order by days.start_day, communities.community) - 1 as grid_index
+    from days
+    cross join communities
+    left join trips_stat on trips_stat.start_day = days.start_day and trips_stat.community = communities.community
+)
+select
+    grid.grid_index,
+    grid.start_day,
+    grid.community::bigint as community,
+    grid.rides_number,
+    dayofyear(grid.start_day)::integer as day_of_year,
+    (isodow(grid.start_day) - 1)::integer as day_of_week,
+    (isodow(grid.start_day) >= 6)::bigint as is_weekend,
+    weekofyear(grid.start_day)::bigint as week,
+    month(grid.start_day)::bigint as month,
+    community_geo.area,
+    community_geo.distance_to_center,
+    grid.mean_trip_distance,
+    grid.median_trip_distance,
+    grid.mean_trip_duration,
+    grid.vendors_number,
+    grid.top_vendor_share::double as top_vendor_share,
+    grid.inflow,
+    grid.inflow - grid.rides_number as net_flow
+from grid
+left join community_geo on community_geo.community = grid.community::bigint
+where community_geo.community_name is distinct from 'None' {data_until_filter}
+order by grid.grid_index
+"""
+
+COMMUNITY_CODES_QUERY = """
+select "Start Community Area Number", "Start Community Area Name"
+from read_parquet('{rides_path}', file_row_number = true)
+where "Start Community Area Number" is not null and "Start Community Area Name" is not null
+group by all
+order by min(file_row_number)
+"""
+
+
+def quote_path(path: Path) -> str:
+    return str(path).replace("'", "''")
+
+
+def get_time_expression(conn: duckdb.DuckDBPyConnection, rides_path: Path, column: str) -> str:
+    column_type = conn.sql(f"select \"{column}\" from read_parquet('{quote_path(rides_path)}')").types[0]
+    if str(column_type) == "VARCHAR":
+        return f"strptime(\"{column}\", '{RAW_TIME_FORMAT}')"
+    return f"\"{column}\""
+
+
+def build_features_duckdb(
+    rides_path: Path,
+    geometry: CommunityGeometry,
+    lat: float,
+    lon: float,
+    data_until: Optional[str] = None,
+    community_codes_dict: Optional[Dict[str, int]] = None,
+    threads: Optional[int] = None,
+) -> Tuple[pd.DataFrame, Dict[str, int]]:
+    """
+    Function builds the dense communities x days dataset with the trip aggregates, the features on date
+    and on geographical data as one query scanning the rides parquet file, the result is the same
+    as of the pandas engine including the index the rows have in the dense dataset
+    @param rides_path: Path, the raw rides data
+    @param geometry: geometry of the communities
+    @param lat: latitude of the city center
+    @param lon: longitude of the city center
+    @param data_until: str, the date the days are taken before, all days if None
+    @param community_codes_dict: dict, the codes of the community names, they are read from the rides data if None
+    @param threads: int, the number of threads of the query, all cores if None
+    @return: the features and the codes of the community names
+    """
+
+    conn = duckdb.connect()
+    try:
+        if threads is not None:
+            conn.execute(f"set threads = {int(threads)}")
+
+        if community_codes_dict is None:
+            # the distinct pairs in the order of their first rows give the same codes as the whole data
+            community_codes = conn.execute(COMMUNITY_CODES_QUERY.format(rides_path=quote_path(rides_path))).df()
+            community_codes_dict = create_community_codes_dict(community_codes)
+        community_codes_inv_dict = {v: k for k, v in community_codes_dict.items()}
+
+        areas = geometry.areas()
+        distances = geometry.distances_to_center(lat, lon)
+        community_geo = pd.DataFrame(
+            {
+                "community": pd.Series([int(code) for code in community_codes_inv_dict], dtype="int64"),
+                "community_name": pd.Series(list(community_codes_inv_dict.values()), dtype="object"),
+            }
+        )
+        community_geo["area"] = community_geo["community_name"].map(areas).astype(float)
+        community_geo["distance_to_center"] = community_geo["community_name"].map(distances).astype(float)
+        conn.register("community_geo", community_geo)
+
+        data_until_filter = ""
+        if data_until is not None:
+            data_until_filter = f"and grid.start_day < '{data_until}'::timestamp"
+        features = conn.execute(
+            FEATURES_QUERY.format(
+                start_time=get_time_expression(conn, rides_path, "Start Time"),
+                end_time=get_time_expression(conn, rides_path, "End Time"),
+                rides_path=quote_path(rides_path),
+                data_until_filter=data_until_filter,
+            )
+        ).df()
+    finally:
+        conn.close()
+
+    features = features.set_index("grid_index")
+    features.index = features.index.astype("int64").rename(None)
+    features["start_day"] = features["start_day"].astype("datetime64[ns]")
+    features = features[INTERIM_FEATURES]
+
+    return features, community_codes_dict
@@ -0,0 +1,161 @@
+"""Module for storing the communities geometry in a compact binary artifact"""
+import argparse
+import json
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.feather as feather
+import shapely
+from shapely.geometry import shape
+
+JSONType = List[Dict[str, Any]]
+
+
+class CommunityGeometry:
+    """
+    Geometry of the communities of a city loaded from the artifact.
+    Geometries are prepared and indexed with an STRtree for spatial queries
+    """
+
+    def __init__(self, names: np.ndarray, area_numbers: np.ndarray, geometries: np.ndarray):
+        self.names = names
+        self.area_numbers = area_numbers
+        self.geometries = geometries
+        shapely.prepare(self.geometries)
+        self.index = shapely.STRtree(self.geometries)
+
+    def areas(self) -> Dict[str, float]:
+        return dict(zip(self.names, shapely.area(self.geometries)))
+
+    def distances_to_center(self, lat: float, lon: float) -> Dict[str, float]:
+        distances = shapely.distance(shapely.centroid(self.geometries), shapely.Point(lon, lat))
+        return dict(zip(self.names, distances))
+
+    def locate(self, lat: float, lon: float) -> Optional[str]:
+        """
+        Function finds the community a point belongs to
+        @param lat: latitude of the point
+        @param lon: longitude of the point
+        @return: the name of the community or None if the point is outside the city
+        """
+
+        found = self.index.query(shapely.Point(lon, lat), predicate="intersects")
+        return self.names[found[0]] if len(found) else None
+
+
+def check_simplification(
+    geometries: np.ndarray,
+    simplified: np.ndarray,
+    max_relative_error: float,
+    center: Optional[Tuple[float, float]] = None,
+):
+    """
+    Function checks that the features derived from the simplified geometries
+    stay within the tolerance of the features derived from the full geometries
+    @param geometries: np.ndarray, the full geometries
+    @param simplified: np.ndarray, the simplified geometries
+    @param max_relative_error: float, the maximum relative error of area and distance_to_center
+    @param center: latitude and longitude of the city center
+    """
+
+    area_error = np.abs(shapely.area(simplified) / shapely.area(geometries) - 1).max()
+    if area_error > max_relative_error:
+        raise ValueError(f"relative error of area {area_error:.2e} exceeds {max_relative_error:.2e}")
+
+    if center is not None:
+        lat, lon = center
+        distance = shapely.distance(shapely.centroid(geometries), shapely.Point(lon, lat))
+        simplified_distance = shapely.distance(shapely.centroid(simplified), shapely.Point(lon, lat))
+        distance_error = np.abs(simplified_distance / distance - 1).max()
+        if distance_error > max_relative_error:
+            raise ValueError(
+                f"relative error of distance_to_center {distance_error:.2e} exceeds {max_relative_error:.2e}"
+            )
+
+
+def build_geometry_artifact(
+    boundaries: JSONType,
+    artifact_path: Path,
+    simplify_tolerance: Optional[float] = None,
+    max_relative_error: float = 1e-3,
+    center: Optional[Tuple[float, float]] = None,
+):
+    """
+    Function converts GeoJSON boundaries of the communities into a Feather file with WKB geometries
+    @param boundaries: list of GeoJSON features of the communities boundaries
+    @param artifact_path: Path, the path of the artifact
+    @param simplify_tolerance: float, the tolerance of the topology-preserving simplification,
+    the geometries are stored at full precision if None
+    @param max_relative_error: float, the maximum relative error of the features
+    derived from the simplified geometries
+    @param center: latitude and longitude of the city center to check distance_to_center
+    """
+
+    geometries = np.array([shape(feature["geometry"]) for feature in boundaries], dtype=object)
+    if simplify_tolerance is not None:
+        simplified = shapely.simplify(geometries, simplify_tolerance, preserve_topology=True)
+        check_simplification(geometries, simplified, max_relative_error, center)
+        geometries = simplified
+
+    table = pa.table(
+        {
+            "community": [feature["properties"]["community"] for feature in boundaries],
+            "area_number": [int(feature["properties"]["area_numbe"]) for feature in boundaries],
+            "geometry": pa.array(shapely.to_wkb(geometries), type=pa.binary()),
+        }
+    )
+    artifact_path.parent.mkdir(parents=True, exist_ok=True)
+    feather.write_feather(table, artifact_path, compression="uncompressed")
+
+
+def load_geometry_artifact(artifact_path: Path) -> CommunityGeometry:
+    table = feather.read_table(artifact_path, memory_map=True)
+
+    # ChunkedArray.to_numpy of pyarrow 12 takes no zero_copy_only, the columns are combined into arrays first
+    return CommunityGeometry(
+        table.column("community").combine_chunks().to_numpy(zero_copy_only=False),
+        table.column("area_number").combine_chunks().to_numpy(),
+        shapely.from_wkb(table.column("geometry").combine_chunks().to_numpy(zero_copy_only=False)),
+    )
+
+
+def ensure_geometry_artifact(boundaries_path: Path, artifact_path: Path, **kwargs) -> Path:
+    """
+    Function builds the artifact if it does not exist or is older than the boundaries data
+    @param boundaries_path: Path, the path of the GeoJSON boundaries data
+    @param artifact_path: Path, the path of the artifact
+    @return: Path of the artifact
+    """
+
+    if not artifact_path.exists() or artifact_path.stat().st_mtime < boundaries_path.stat().st_mtime:
+        with open(boundaries_path, "r", encoding="utf-8") as boundaries_file:
+            boundaries = json.load(boundaries_file)["features"]
+        build_geometry_artifact(boundaries, artifact_path, **kwargs)
+
+    return artifact_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert GeoJSON boundaries of the communities into a binary artifact")
+    parser.add_argument("boundaries_path", type=Path)
+    parser.add_argument("artifact_path", type=Path)
+    parser.add_argument("--simplify_tolerance", type=float, default=None)
+    parser.add_argument("--max_relative_error", type=float, default=1e-3)
+    parser.add_argument("--city_center_path", type=Path, default=None)
+    args = parser.parse_args()
+
+    city_center = None
+    if args.city_center_path is not None:
+        with open(args.city_center_path, "r", encoding="utf-8") as file_with_coordinates:
+            city_center = tuple(float(x) for x in file_with_coordinates.read().split(","))
+
+    with open(args.boundaries_path, "r", encoding="utf-8") as file_with_boundaries:
+        build_geometry_artifact(
+            json.load(file_with_boundaries)["features"],
+            args.artifact_path,
+            args.simplify_tolerance,
+            args.max_relative_error,
+            city_center,
+        )
@@ -0,0 +1,202 @@
+"""Module for compacting a trained LightGBM model for serving"""
+import re
+import time
+from typing import Dict, List, Tuple
+
+import lightgbm as lgb
+import numpy as np
+import pandas as pd
+
+# the maximum relative growth of the holdout MAE of the compacted model over the MAE of the trained one
+COMPACTION_MAE_TOLERANCE = 0.005
+# the statistics a tree keeps from the training are used only by the feature importance by gain
+# and the SHAP values, not to score
+TRAINING_STATISTICS = ["split_gain", "internal_value", "internal_weight", "internal_count", "leaf_weight", "leaf_count"]
+FLOAT32_FIELDS = ["threshold", "leaf_value"]
+FLOAT32_MAX = float(np.finfo(np.float32).max)
+LATENCY_REPEATS = 100
+
+
+def split_model_string(model_str: str) -> Tuple[str, List[Dict[str, str]], str]:
+    """
+    Function splits a model saved in the LightGBM text format into its parts
+    @param model_str: str, the model
+    @return: the header, the fields of every tree and the rest of the model after the trees
+    """
+
+    trees_start = model_str.index("\nTree=") + 1
+    trees_end = model_str.index("end of trees")
+    trees = [
+        dict(line.split("=", 1) for line in tree_str.splitlines())
+        for tree_str in re.split(r"\n\n+", model_str[trees_start:trees_end].strip())
+    ]
+
+    return model_str[:trees_start], trees, model_str[trees_end:]
+
+
+def pack_float32(values: str) -> str:
+    # the values out of the float32 range are kept as they are
+    return " ".join(
+        str(np.float32(value)) if abs(float(value)) <= FLOAT32_MAX else value for value in values.split(" ")
+    )
+
+
+def format_tree(tree: Dict[str, str], index: int) -> str:
+    lines = [f"Tree={index}"]
+    for key, value in tree.items():
+        if key == "Tree" or key in TRAINING_STATISTICS:
+            continue
+        lines.append(f"{key}={pack_float32(value) if key in FLOAT32_FIELDS else value}")
+    return "\n".join(lines) + "\n\n\n"
+
+
+def get_tree_outputs(booster: lgb.Booster, trees: List[Dict[str, str]], X: pd.DataFrame) -> np.ndarray:
+    """
+    Function computes the output of every tree on every row, the raw score of a row is the sum of its outputs
+    @param booster: lgb.Booster, the model
+    @param trees: list of the fields of the trees of the model
+    @param X: pd.DataFrame, the features
+    @return: np.ndarray of the shape (rows, trees)
+    """
+
+    leaves = booster.predict(X, pred_leaf=True).reshape(len(X), len(trees))
+    outputs = np.empty(leaves.shape)
+    for i, tree in enumerate(trees):
+        outputs[:, i] = np.array(tree["leaf_value"].split(" "), dtype=np.float64)[leaves[:, i]]
+
+    return outputs
+
+
+def select_trees(tree_outputs: np.ndarray, y: np.ndarray, tolerance: float) -> Tuple[np.ndarray, np.ndarray, float]:
+    """
+    Function drops the trees of a Poisson model contributing the least to the holdout MAE while the MAE
+    stays within the tolerance. The dropped trees are merged into a constant added to the raw score,
+    so the total of the predictions stays the total predicted by the whole model
+    @param tree_outputs: np.ndarray, the outputs of the trees on the holdout
+    @param y: np.ndarray, the target of the holdout
+    @param tolerance: float, the maximum relative growth of the MAE
+    @return: the mask of the kept trees, the marginal contribution of every tree to the MAE and the constant
+    """
+
+    full_score = tree_outputs.sum(axis=1)
+    full_total = np.exp(full_score).sum()
+    full_mae = np.abs(y - np.exp(full_score)).mean()
+    max_mae = full_mae * (1 + tolerance)
+
+    # the contribution of a tree is the growth of the MAE when the tree alone is dropped
+    contributions = np.array(
+        [np.abs(y - np.exp(full_score - tree_outputs[:, i])).mean() - full_mae for i in range(tree_outputs.shape[1])]
+    )
+
+    kept = np.ones(tree_outputs.shape[1], dtype=bool)
+    score = full_score
+    for i in np.argsort(contributions, kind="stable"):
+        candidate_score = score - tree_outputs[:, i]
+        candidate_predictions = np.exp(candidate_score)
+        candidate_predictions *= full_total / candidate_predictions.sum()
+        if kept.sum() > 1 and np.abs(y - candidate_predictions).mean() <= max_mae:
+            kept[i] = False
+            score = candidate_score
+
+    return kept, contributions, float(np.log(full_total / np.exp(score).sum()))
+
+
+def build_compact_model_string(
+    header: str, trees: List[Dict[str, str]], footer: str, kept: np.ndarray, bias: float
+) -> str:
+    """
+    Function writes the kept trees with float32 thresholds and leaf values and without the training statistics
+    @param header: str, the header of the model
+    @param trees: list of the fields of the trees of the model
+    @param footer: str, the rest of the model after the trees
+    @param kept: np.ndarray, the mask of the kept trees
+    @param bias: float, the constant added to the leaf values of the first kept tree
+    @return: str, the compacted model in the LightGBM text format
+    """
+
+    kept_trees = [dict(tree) for tree, keep in zip(trees, kept) if keep]
+    first_leaf_values = np.array(kept_trees[0]["leaf_value"].split(" "), dtype=np.float64) + bias
+    kept_trees[0]["leaf_value"] = " ".join(repr(float(value)) for value in first_leaf_values)
+
+    # the sizes of the trees are optional, without them the trees are parsed one by one
+    header = re.sub(r"^tree_sizes=.*\n", "", header, flags=re.M)
+
+    return header + "".join(format_tree(tree, i) for i, tree in enumerate(kept_trees)) + footer
+
+
+def save_model_string(model_str: str, path: str):
+    # a booster saved by LightGBM gets the training statistics and the float64 values back
+    with open(path, "w", encoding="utf-8") as model_file:
+        model_file.write(model_str)
+
+
+def measure_model(model_str: str, X: pd.DataFrame, repeats: int = LATENCY_REPEATS) -> Dict[str, float]:
+    """
+    Function measures the size, the load time and the scoring latency of a model
+    @param model_str: str, the model in the LightGBM text format
+    @param X: pd.DataFrame, the features to score
+    @param repeats: int, the number of times a row is scored
+    @return: dict of the measurements
+    """
+
+    load_start = time.perf_counter()
+    booster = lgb.Booster(model_str=model_str)
+    load_time = time.perf_counter() - load_start
+
+    row_latencies = []
+    for _ in range(repeats):
+        row_start = time.perf_counter()
+        booster.predict(X.iloc[:1])
+        row_latencies.append(time.perf_counter() - row_start)
+
+    batch_start = time.perf_counter()
+    booster.predict(X)
+    batch_latency = time.perf_counter() - batch_start
+
+    return {
+        "size_bytes": len(model_str.encode("utf-8")),
+        "load_time_s": load_time,
+        "row_latency_ms": float(np.median(row_latencies)) * 1000,
+        "batch_latency_ms": batch_latency * 1000,
+    }
+
+
+def compact_model(
+    booster: lgb.Booster, X: pd.DataFrame, y: pd.Series, tolerance: float = COMPACTION_MAE_TOLERANCE
+) -> Tuple[str, Dict[str, float]]:
+    """
+    Function compacts a trained Poisson model for serving: it drops the trees contributing the least
+    to the holdout MAE within the tolerance and packs the thresholds and the leaf values to float32
+    @param booster: lgb.Booster, the trained model
+    @param X: pd.DataFrame, the features of the holdout
+    @param y: pd.Series, the target of the holdout
+    @param tolerance: float, the maximum relative growth of the holdout MAE
+    @return: the compacted model in the LightGBM text format and the metrics of the compaction
+    """
+
+    model_str = booster.model_to_string()
+    header, trees, footer = split_model_string(model_str)
+
+    tree_outputs = get_tree_outputs(booster, trees, X)
+    kept, contributions, bias = select_trees(tree_outputs, y.to_numpy(dtype=np.float64), tolerance)
+    compact_model_str = build_compact_model_string(header, trees, footer, kept, bias)
+
+    full_mae = np.abs(y - booster.predict(X)).mean()
+    compact_mae = np.abs(y - lgb.Booster(model_str=compact_model_str).predict(X)).mean()
+    full_measurements = measure_model(model_str, X)
+    compact_measurements = measure_model(compact_model_str, X)
+
+    metrics = {
+        "compaction_trees": len(trees),
+        "compaction_kept_trees": int(kept.sum()),
+        "compaction_max_dropped_contribution": float(contributions[~kept].max()) if (~kept).any() else 0.0,
+        "compaction_holdout_mae": compact_mae,
+        "compaction_mae_delta": compact_mae - full_mae,
+        "compaction_mae_delta_percent": (compact_mae / full_mae - 1) * 100,
+    }
+    for name, value in full_measurements.items():
+        metrics[f"compaction_{name}_before"] = value
+        metrics[f"compaction_{name}_after"] = compact_measurements[name]
+        metrics[f"compaction_{name}_reduction_percent"] = (1 - compact_measurements[name] / value) * 100
+
+    return compact_model_str, metrics
@@ -1,20 +1,39 @@
+import hashlib
 import json
 import os
 import pickle
+import time
 from pathlib import Path
+from typing import Dict, List, Optional, Tuple
 
+import boto3
 import mlflow
 import numpy as np
 import pandas as pd
-from hyperopt import hp, tpe
-from hyperopt.fmin import fmin
+from botocore.exceptions import BotoCoreError, ClientError
+from hyperopt import STATUS_OK, Trials, hp, tpe
+from hyperopt.early_stop import no_progress_loss
+from hyperopt.fmin import fmin, generate_trials_to_calculate
 from lightgbm import LGBMRegressor
 from prefect import task
 from sklearn.metrics import mean_absolute_error
 from sklearn.model_selection import KFold
 
+from src.cities import DEFAULT_CITY, get_city_path
+from src.features.definitions import CATEGORICAL_FEATURES, MODEL_FEATURES
+from src.pipeline.instrumentation import instrument_stage, record_rows
+
 EXPERIMENT_NAME = "escooters-demand-lightgbm-hpo"
 TRACKING_URI = os.getenv("TRACKING_URI")
+BUCKET_NAME = "serjeeon-learning-bucket"
+HPO_TRIALS_FILENAME = "hpo_trials.pkl"
+RESUME_FILENAME_PATTERN = "hpo_trials-*.inprogress.pkl"
+
+# the budget is larger than the patience, so the search can stop early
+HPO_NUM_TRIALS = 40
+WARM_START_TOP_K = 5
+EARLY_STOP_PATIENCE = 10
+EARLY_STOP_MIN_IMPROVEMENT_PERCENT = 0.5
 
 mlflow.set_tracking_uri(TRACKING_URI)
 mlflow.set_experiment(EXPERIMENT_NAME)
@@ -25,6 +44,74 @@ def load_pickle(filename):
         return pickle.load(f_in)
 
 
+def dump_pickle(obj, filename):
+    with open(filename, "wb") as f_out:
+        pickle.dump(obj, f_out)
+
+
+def load_trials(path: Path) -> Optional[Trials]:
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            client = boto3.client("s3")
+            client.download_file(BUCKET_NAME, os.path.join("escooters-demand", str(path)), str(path))
+        except (BotoCoreError, ClientError):
+            return None
+    return load_pickle(path)
+
+
+def upload_trials(path: Path):
+    client = boto3.client("s3")
+    client.upload_file(str(path), BUCKET_NAME, os.path.join("escooters-demand", str(path)))
+
+
+def get_file_checksum(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as data_file:
+        for chunk in iter(lambda: data_file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_ok_trials(trials: Trials) -> List[dict]:
+    return [trial for trial in trials.trials if trial["result"].get("status") == STATUS_OK]
+
+
+def get_top_configurations(trials: Trials, top_k: int) -> List[Dict[str, float]]:
+    """
+    Function selects the configurations with the lowest losses among the trials of a previous search
+    @param trials: Trials, the trials of the previous search
+    @param top_k: int, the number of configurations to select
+    @return: list of the configurations in the format of points_to_evaluate of fmin
+    """
+
+    configurations = []
+    for trial in sorted(get_ok_trials(trials), key=lambda trial: trial["result"]["loss"]):
+        configuration = {label: values[0] for label, values in trial["misc"]["vals"].items() if values}
+        if configuration not in configurations:
+            configurations.append(configuration)
+        if len(configurations) == top_k:
+            break
+
+    return configurations
+
+
+def get_convergence(trials: Trials, target_loss: float) -> Tuple[Optional[int], Optional[float]]:
+    """
+    Function finds how many trials and how much wall time a search needed to reach a loss
+    @param trials: Trials, the trials of the search
+    @param target_loss: float, the loss to reach
+    @return: the number of trials and the seconds from the start of the search, None if the loss is not reached
+    """
+
+    search_start = min(trial["book_time"] for trial in trials.trials)
+    for trial_num, trial in enumerate(sorted(trials.trials, key=lambda trial: trial["tid"]), start=1):
+        if trial["result"].get("status") == STATUS_OK and trial["result"]["loss"] <= target_loss:
+            return trial_num, (trial["refresh_time"] - search_start).total_seconds()
+
+    return None, None
+
+
 def cross_val_score(data, features, target_name, random_state, **params):
     cross = KFold(n_splits=4, shuffle=True, random_state=random_state)
     data.reset_index(inplace=True, drop=True)
@@ -50,6 +137,10 @@ def get_best_lightgbm_params(
     n_rounds=10,
     search_space=None,
     n_jobs=3,
+    run_tags=None,
+    trials=None,
+    trials_save_file="",
+    early_stop_fn=None,
     **addition_model_params,
 ):
     if search_space is None:
@@ -90,7 +181,7 @@ def get_best_lightgbm_params(
         params["app"] = "regression"
         params["application"] = "regression"
 
-        with mlflow.start_run():
+        with mlflow.start_run(tags=run_tags):
             mlflow.log_params(params)
             cv_results = cross_val_function(
                 data,
@@ -104,12 +195,16 @@ def get_best_lightgbm_params(
 
         return cv_results
 
+    # n_rounds includes the trials the passed Trials already has
     best = fmin(
         fn=objective,
         space=search_space,
         algo=tpe.suggest,
         max_evals=n_rounds,
+        trials=trials,
         rstate=np.random.default_rng(random_state),
+        early_stop_fn=early_stop_fn,
+        trials_save_file=trials_save_file,
     )
 
     return proc_params(best)
@@ -131,63 +226,144 @@ def get_best_lightgbm_params(
 #     default=585,
 #     help="Random state",
 # )
-def search_params(data_path: str = "./data/processed", num_trials: int = 10, random_state: int = 585):
-    df = pd.read_parquet(os.path.join(data_path, "train.parquet"))
-    categorical_features = ['community', 'day_of_week', 'is_weekend']
-    df[categorical_features] = df[categorical_features].astype("category")
-
-    selected_features = [
-        'community',
-        'day_of_year',
-        'day_of_week',
-        'is_weekend',
-        'week',
-        'month',
-        'area',
-        'distance_to_center',
-    ]
+def search_params(
+    data_path: str = "./data/processed",
+    num_trials: int = HPO_NUM_TRIALS,
+    random_state: int = 585,
+    city: str = DEFAULT_CITY,
+    models_path: str = "models",
+    current_params: Optional[Dict] = None,
+    warm_start_top_k: int = WARM_START_TOP_K,
+    early_stop_patience: int = EARLY_STOP_PATIENCE,
+    early_stop_min_improvement_percent: float = EARLY_STOP_MIN_IMPROVEMENT_PERCENT,
+):
+    """
+    Function searches the hyperparameters of the model. The search is warm-started with the best
+    configurations of the previous search re-scored on the new data, and stops early when the incumbent
+    has not improved by early_stop_min_improvement_percent for early_stop_patience trials.
+    The trials are saved after every evaluation, so an interrupted search on the same data is resumed.
+    The found hyperparameters replace the current ones only if their cross-validation MAE is lower
+    @param current_params: dict, the hyperparameters the model is trained with now, None if there are none
+    @return: the cross-validation MAE of the best hyperparameters and the hyperparameters,
+    the current ones if the search has not improved on them
+    """
+
+    train_path = os.path.join(get_city_path(data_path, city), "train.parquet")
+    df = pd.read_parquet(train_path)
+    record_rows(rows_in=len(df))
+    df[CATEGORICAL_FEATURES] = df[CATEGORICAL_FEATURES].astype("category")
 
     mape_before = cross_val_score(
         df,
-        selected_features,
+        MODEL_FEATURES,
         "rides_number",
         random_state,
         **{"objective": "", "num_threads": 3},
     )
 
-    for _ in range(10):
-        best_params = get_best_lightgbm_params(
-            df,
-            selected_features,
-            "rides_number",
-            cross_val_score,
-            random_state,
-            n_rounds=num_trials,
-            **{"objective": "poisson", "n_jobs": 3},
-        )
-        mape_after = cross_val_score(
+    trials_path = Path.joinpath(get_city_path(models_path, city), HPO_TRIALS_FILENAME)
+    previous_trials = load_trials(trials_path)
+    warm_start_points = []
+    previous_best_loss = None
+    if previous_trials is not None and get_ok_trials(previous_trials):
+        warm_start_points = get_top_configurations(previous_trials, warm_start_top_k)
+        previous_best_loss = min(trial["result"]["loss"] for trial in get_ok_trials(previous_trials))
+
+    # the file of a search is named by the data, so only a search on the same data is resumed
+    resume_path = trials_path.with_name(f"hpo_trials-{get_file_checksum(train_path)[:16]}.inprogress.pkl")
+    if resume_path.exists():
+        trials = load_pickle(resume_path)
+        print(f"resuming the search from trial {len(trials.trials)}")
+    elif warm_start_points:
+        trials = generate_trials_to_calculate(warm_start_points)
+    else:
+        trials = Trials()
+
+    search_start = time.perf_counter()
+    best_params = get_best_lightgbm_params(
+        df,
+        MODEL_FEATURES,
+        "rides_number",
+        cross_val_score,
+        random_state,
+        n_rounds=len(warm_start_points) + num_trials,
+        run_tags={"city": city},
+        trials=trials,
+        trials_save_file=str(resume_path),
+        early_stop_fn=no_progress_loss(early_stop_patience, early_stop_min_improvement_percent),
+        **{"objective": "poisson", "n_jobs": 3},
+    )
+    search_time = time.perf_counter() - search_start
+
+    dump_pickle(trials, trials_path)
+    upload_trials(trials_path)
+    # the files of the searches interrupted on the data of the previous days are not resumed anymore
+    for stale_resume_path in trials_path.parent.glob(RESUME_FILENAME_PATTERN):
+        stale_resume_path.unlink(missing_ok=True)
+
+    mape_after = cross_val_score(
+        df,
+        MODEL_FEATURES,
+        "rides_number",
+        random_state,
+        **best_params,
+        **{"objective": "poisson", "num_threads": 3},
+    )
+
+    summary = {
+        "cv_mae_default_params": mape_before,
+        "cv_mae_search": mape_after,
+        "n_trials": len(trials.trials),
+        "warm_start_points": len(warm_start_points),
+        "search_time_s": search_time,
+    }
+    if previous_best_loss is not None:
+        trials_to_previous_best, time_to_previous_best = get_convergence(trials, previous_best_loss)
+        summary["previous_best_loss"] = previous_best_loss
+        if trials_to_previous_best is not None:
+            summary["trials_to_previous_best"] = trials_to_previous_best
+            summary["time_to_previous_best_s"] = time_to_previous_best
+    if mape_after >= mape_before:
+        print(f"the search has not improved on the default params: mape before {mape_before}, after {mape_after}")
+    if current_params is not None:
+        mape_current = cross_val_score(
             df,
-            selected_features,
+            MODEL_FEATURES,
             "rides_number",
             random_state,
-            **best_params,
+            **current_params,
             **{"objective": "poisson", "num_threads": 3},
         )
+        summary["cv_mae_current_params"] = mape_current
+        if mape_after >= mape_current:
+            print(f"the search has not improved on the current params: mape {mape_current}, after {mape_after}")
+            mape_after, best_params = mape_current, current_params
+    summary["cv_mae"] = mape_after
 
-        print(f"mape before: {mape_before}, mape after: {mape_after}")
-        print(best_params)
+    with mlflow.start_run(run_name="hpo-summary", tags={"city": city}):
+        mlflow.log_params(best_params)
+        mlflow.log_metrics(summary)
 
-        if mape_after < mape_before:
-            break
+    print(summary)
+    print(best_params)
 
     return mape_after, best_params
 
 
 @task(retries=3, retry_delay_seconds=2, name="Search model hyperparameters")
-def hpo():
+@instrument_stage("hpo")
+def hpo(city: str = DEFAULT_CITY):
     project_dir = Path(__file__).resolve().parents[2]
-    _, best_params = search_params()  # standalone_mode=False)
-    with open(os.path.join(project_dir, "./models/best_params.json"), "w", encoding="utf-8") as best_params_file:
+    best_params_filepath = Path.joinpath(get_city_path(os.path.join(project_dir, "models"), city), "best_params.json")
+    current_params = None
+    if best_params_filepath.exists():
+        with open(best_params_filepath, "r", encoding="utf-8") as best_params_file:
+            current_params = json.load(best_params_file)
+    _, best_params = search_params(city=city, current_params=current_params)  # standalone_mode=False)
+    if best_params == current_params:
+        return
+    best_params_filepath.parent.mkdir(parents=True, exist_ok=True)
+    with open(best_params_filepath, "w", encoding="utf-8") as best_params_file:
         best_params_json = json.dumps(best_params)
         best_params_file.write(best_params_json)
 
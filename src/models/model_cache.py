@@ -0,0 +1,280 @@
+"""Module for caching the registered models on the local disk"""
+import contextlib
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+import mlflow.artifacts
+import mlflow.pyfunc
+from mlflow import MlflowClient
+from mlflow.entities.model_registry import ModelVersion
+
+MODEL_CACHE_DIR = os.getenv("MODEL_CACHE_DIR", str(Path.home() / ".cache" / "escooters-demand" / "models"))
+MODEL_CACHE_MAX_BYTES = int(os.getenv("MODEL_CACHE_MAX_MB", "2048")) * 1024 * 1024
+# the time a cached version waits for the registry before it is used
+MODEL_REGISTRY_TIMEOUT_S = float(os.getenv("MODEL_REGISTRY_TIMEOUT_S", "2"))
+
+ENTRY_FILENAME = "entry.json"
+ARTIFACTS_DIRNAME = "model"
+
+
+@dataclass
+class CachedModel:
+    """
+    A version of a registered model stored in the cache
+    """
+
+    name: str
+    version: str
+    run_id: str
+    source: str
+    checksum: str
+    size_bytes: int
+    path: str
+
+    @property
+    def model_path(self) -> Path:
+        return Path(self.path) / ARTIFACTS_DIRNAME
+
+
+def compute_checksum(path: Path) -> str:
+    """
+    Function calculates the SHA-256 of a directory from the relative paths and contents of its files
+    @param path: Path, the directory
+    @return: str, the hex digest
+    """
+
+    digest = hashlib.sha256()
+    for file in sorted(file for file in path.rglob("*") if file.is_file()):
+        digest.update(file.relative_to(path).as_posix().encode())
+        with open(file, "rb") as artifact_file:
+            for chunk in iter(lambda: artifact_file.read(1 << 20), b""):
+                digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def get_directory_size(path: Path) -> int:
+    return sum(file.stat().st_size for file in path.rglob("*") if file.is_file())
+
+
+class ModelCache:
+    """
+    Content-addressed cache of the versions of registered models. A version is stored in
+    <cache_dir>/<name>/<version>-<checksum>/, so a cached version is loaded without network I/O
+    and a corrupted one is detected and downloaded again. The processes sharing the cache
+    take a file lock, so a version is downloaded by one of them only.
+    The last version resolved for a stage is used when the registry does not respond within
+    registry_timeout, the stage is then refreshed in the background
+    """
+
+    def __init__(
+        self,
+        cache_dir: str = MODEL_CACHE_DIR,
+        max_bytes: int = MODEL_CACHE_MAX_BYTES,
+        tracking_uri: Optional[str] = None,
+        verify: bool = True,
+        registry_timeout: float = MODEL_REGISTRY_TIMEOUT_S,
+    ):
+        """
+        @param cache_dir: str, the directory of the cache
+        @param max_bytes: int, the size of the cache the least recently used versions are evicted above
+        @param tracking_uri: str, the address of the model registry
+        @param verify: bool, a flag that determines whether the checksum of a cached version is verified on use
+        @param registry_timeout: float, the time in seconds a cached version waits for the registry
+        """
+
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.client = MlflowClient(tracking_uri=tracking_uri, registry_uri=tracking_uri)
+        self.verify = verify
+        self.registry_timeout = registry_timeout
+
+    @contextlib.contextmanager
+    def lock(self, name: str) -> Iterator[None]:
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.cache_dir / f".{name}.lock", "w", encoding="utf-8") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def entries(self, name: Optional[str] = None) -> List[CachedModel]:
+        entries = []
+        for entry_path in self.cache_dir.glob(f"{name or '*'}/*/{ENTRY_FILENAME}"):
+            try:
+                with open(entry_path, "r", encoding="utf-8") as entry_file:
+                    entries.append(CachedModel(**json.load(entry_file)))
+            except FileNotFoundError:
+                # removed by another process since the glob
+                continue
+        return entries
+
+    def find(self, model_version: ModelVersion) -> Optional[CachedModel]:
+        for entry in self.entries(model_version.name):
+            if entry.version != str(model_version.version) or entry.run_id != model_version.run_id:
+                continue
+            if self.verify and compute_checksum(entry.model_path) != entry.checksum:
+                print(f"cached {entry.name} version {entry.version} is corrupted, downloading it again")
+                shutil.rmtree(entry.path)
+                return None
+            return entry
+
+        return None
+
+    def download(self, model_version: ModelVersion) -> CachedModel:
+        model_dir = self.cache_dir / model_version.name
+        model_dir.mkdir(parents=True, exist_ok=True)
+        download_dir = Path(tempfile.mkdtemp(prefix=".download-", dir=model_dir))
+        try:
+            local_path = Path(
+                mlflow.artifacts.download_artifacts(artifact_uri=model_version.source, dst_path=str(download_dir))
+            )
+            checksum = compute_checksum(local_path)
+            entry_dir = model_dir / f"{model_version.version}-{checksum[:16]}"
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            entry_dir.mkdir()
+            shutil.move(str(local_path), entry_dir / ARTIFACTS_DIRNAME)
+        finally:
+            shutil.rmtree(download_dir, ignore_errors=True)
+
+        entry = CachedModel(
+            name=model_version.name,
+            # the file store of the registry has integer versions, the others have strings
+            version=str(model_version.version),
+            run_id=model_version.run_id,
+            source=model_version.source,
+            checksum=checksum,
+            size_bytes=get_directory_size(entry_dir / ARTIFACTS_DIRNAME),
+            path=str(entry_dir),
+        )
+        # the entry file is written last, a directory without it is an interrupted download
+        write_json_atomically(entry_dir / ENTRY_FILENAME, asdict(entry))
+        print(f"{entry.name} version {entry.version} downloaded to {entry.path}")
+
+        return entry
+
+    def get(self, name: str, stage: str = "Production") -> CachedModel:
+        """
+        Function returns the cached version of a registered model in a stage, downloading it if it is not cached.
+        If the stage was resolved before, the registry is waited for registry_timeout at most
+        and the version cached for the stage is returned when it does not respond in time or fails
+        @param name: str, the name of the registered model
+        @param stage: str, the stage of the version
+        @return: CachedModel
+        """
+
+        cached_entry = self.read_stage(name, stage)
+        if cached_entry is None:
+            return self.refresh(name, stage)
+
+        refreshed_entry: Future = Future()
+
+        def refresh_stage():
+            try:
+                refreshed_entry.set_result(self.refresh(name, stage))
+            except Exception as error:  # pylint: disable=broad-except
+                refreshed_entry.set_exception(error)
+
+        # a daemon thread does not delay the exit of the process while the registry is unreachable
+        threading.Thread(target=refresh_stage, name=f"refresh-{name}-{stage}", daemon=True).start()
+        try:
+            return refreshed_entry.result(timeout=self.registry_timeout)
+        except FutureTimeoutError:
+            print(
+                f"model registry did not respond in {self.registry_timeout}s, using cached {name} "
+                f"version {cached_entry.version} and refreshing it in the background"
+            )
+        except Exception as error:  # pylint: disable=broad-except
+            print(f"model registry is unavailable ({error}), using cached {name} version {cached_entry.version}")
+
+        return cached_entry
+
+    def refresh(self, name: str, stage: str) -> CachedModel:
+        """
+        Function resolves the version of a stage in the registry, caches it and points the stage to it
+        @param name: str, the name of the registered model
+        @param stage: str, the stage of the version
+        @return: CachedModel
+        """
+
+        model_version = self.client.get_latest_versions(name, stages=[stage])[0]
+        with self.lock(name):
+            entry = self.find(model_version) or self.download(model_version)
+            write_json_atomically(self.cache_dir / name / f"{stage}.json", asdict(entry))
+            # the modification time of the entry file orders the versions for the eviction
+            os.utime(Path(entry.path) / ENTRY_FILENAME)
+
+        self.evict(keep=entry)
+
+        return entry
+
+    def read_stage(self, name: str, stage: str) -> Optional[CachedModel]:
+        stage_path = self.cache_dir / name / f"{stage}.json"
+        if not stage_path.exists():
+            return None
+        with open(stage_path, "r", encoding="utf-8") as stage_file:
+            entry = CachedModel(**json.load(stage_file))
+
+        return entry if (Path(entry.path) / ENTRY_FILENAME).exists() else None
+
+    def evict(self, keep: Optional[CachedModel] = None):
+        """
+        Function removes the least recently used versions until the cache fits into max_bytes.
+        The versions the stages point to are kept to be used when the registry is unreachable
+        @param keep: CachedModel, a version that must not be removed
+        """
+
+        with self.lock("eviction"):
+            entries = sorted(self.entries(), key=get_last_used)
+            size_bytes = sum(entry.size_bytes for entry in entries)
+            in_use = {keep.path} if keep is not None else set()
+            for stage_path in self.cache_dir.glob("*/*.json"):
+                with open(stage_path, "r", encoding="utf-8") as stage_file:
+                    in_use.add(json.load(stage_file)["path"])
+
+            for entry in entries:
+                if size_bytes <= self.max_bytes:
+                    break
+                if entry.path in in_use:
+                    continue
+                shutil.rmtree(entry.path, ignore_errors=True)
+                size_bytes -= entry.size_bytes
+                print(f"cached {entry.name} version {entry.version} evicted")
+
+
+def get_last_used(entry: CachedModel) -> float:
+    try:
+        return (Path(entry.path) / ENTRY_FILENAME).stat().st_mtime
+    except FileNotFoundError:
+        return 0.0
+
+
+def write_json_atomically(path: Path, data: dict):
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as tmp_file:
+        json.dump(data, tmp_file)
+    os.replace(tmp_path, path)
+
+
+def load_cached_model(name: str, stage: str = "Production", cache: Optional[ModelCache] = None):
+    """
+    Function loads a registered model through the local cache
+    @param name: str, the name of the registered model
+    @param stage: str, the stage of the version
+    @param cache: ModelCache, the cache to use, the default one if None
+    @return: the pyfunc model and its cache entry
+    """
+
+    entry = (cache or ModelCache()).get(name, stage)
+    return mlflow.pyfunc.load_model(str(entry.model_path)), entry
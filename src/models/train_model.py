@@ -1,17 +1,35 @@
 import json
 import os
+import tempfile
+import time
+from datetime import date
+from pathlib import Path
+from typing import Any, Dict, Optional, Union
 
 import boto3
+import lightgbm as lgb
 import mlflow
 import pandas as pd
+from botocore.exceptions import BotoCoreError, ClientError
 from lightgbm import LGBMRegressor
 from mlflow import MlflowClient
 from prefect import task
+from sklearn.metrics import mean_absolute_error
+
+from src.cities import DEFAULT_CITY, get_city, get_city_path
+from src.features.definitions import CATEGORICAL_FEATURES, MODEL_FEATURES
+from src.models.compaction import COMPACTION_MAE_TOLERANCE, compact_model, save_model_string
+from src.pipeline.instrumentation import instrument_stage, record_rows
 
 EXPERIMENT_NAME = "escooters-demand-lightgbm-hpo"
 TRACKING_URI = os.getenv("TRACKING_URI")
 print(TRACKING_URI)
 BUCKET_NAME = "serjeeon-learning-bucket"
+MODELS_DIR = "models"
+
+MAX_DAYS_SINCE_FULL_REFIT = 7
+MAX_NEW_DAYS = 7
+MAX_MAE_REGRESSION = 0.05
 
 mlflow.set_tracking_uri(TRACKING_URI)
 mlflow.set_experiment(EXPERIMENT_NAME)
@@ -28,49 +46,256 @@ def train_lgbm_model(train: pd.DataFrame, model_features, categorical_features,
     return lgbm
 
 
+def train_incremental_model(
+    train: pd.DataFrame,
+    new_days_mask: pd.Series,
+    model_features,
+    categorical_features,
+    model_params,
+    init_model: Union[str, lgb.Booster],
+    n_new_trees: int,
+):
+    """
+    Function continues training of the previous model on the new days only
+    @param train: pd.DataFrame, the whole train dataset
+    @param new_days_mask: pd.Series, the mask of the rows the previous model was not trained on
+    @param model_features: list of the features of the model
+    @param categorical_features: list of the categorical features
+    @param model_params: dict, the hyperparameters of the model
+    @param init_model: the previous model or the path to it
+    @param n_new_trees: int, the number of trees to add to the previous model
+    @return: LGBMRegressor containing the trees of the previous model and the new ones
+    """
+
+    # categories come from the whole dataset, so the codes of the new days
+    # are the same as the ones the previous model was trained with
+    X_train = train[model_features].copy()
+    X_train[categorical_features] = X_train[categorical_features].astype("category")
+
+    lgbm = LGBMRegressor(objective="poisson", **{**model_params, "n_estimators": n_new_trees})
+    lgbm.fit(X_train[new_days_mask], train.loc[new_days_mask, "rides_number"], init_model=init_model)
+
+    return lgbm
+
+
+def get_model_path(city: str) -> str:
+    return str(Path.joinpath(get_city_path(MODELS_DIR, city), "model.txt"))
+
+
+def get_compact_model_path(city: str) -> str:
+    return str(Path.joinpath(get_city_path(MODELS_DIR, city), "model.compact.txt"))
+
+
+def get_training_state_path(city: str) -> str:
+    return str(Path.joinpath(get_city_path(MODELS_DIR, city), "training_state.json"))
+
+
+def load_training_state(path: str) -> Optional[Dict[str, Any]]:
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            client = boto3.client("s3")
+            client.download_file(BUCKET_NAME, os.path.join("escooters-demand", path), path)
+        except (BotoCoreError, ClientError):
+            # without the state the model is trained from scratch
+            return None
+    with open(path, "r", encoding="utf-8") as state_file:
+        return json.load(state_file)
+
+
+def save_training_state(state: Dict[str, Any], path: str):
+    with open(path, "w", encoding="utf-8") as state_file:
+        json.dump(state, state_file, indent=2)
+
+
+def choose_training_mode(
+    state: Optional[Dict[str, Any]],
+    new_days_num: int,
+    today: date,
+    max_days_since_full_refit: int = MAX_DAYS_SINCE_FULL_REFIT,
+    max_new_days: int = MAX_NEW_DAYS,
+) -> str:
+    """
+    Function chooses between a full refit and an incremental training of the previous model.
+    The holdout MAE is not checked here: an incremental model regressing against the last full refit
+    is replaced by a full refit right after its training, so the saved state never holds a regressed one
+    @param state: dict, the state saved by the previous training or None
+    @param new_days_num: int, the number of days the previous model was not trained on
+    @param today: date, the date of the training
+    @param max_days_since_full_refit: int, the maximum age of the last full refit
+    @param max_new_days: int, the maximum number of new days for an incremental training
+    @return: str, "full" or "incremental"
+    """
+
+    if state is None:
+        return "full"
+    if new_days_num == 0 or new_days_num > max_new_days:
+        return "full"
+    if (today - date.fromisoformat(state["last_full_refit"])).days >= max_days_since_full_refit:
+        return "full"
+
+    return "incremental"
+
+
+def load_init_model(model_path: str, model_name: str, source: str = "local") -> Union[str, lgb.Booster]:
+    if source == "registry" or not os.path.exists(model_path):
+        # the compacted model is registered as a booster, the full one as an LGBMRegressor
+        model = mlflow.lightgbm.load_model(f"models:/{model_name}/Production")
+        return model if isinstance(model, lgb.Booster) else model.booster_
+    return model_path
+
+
+def evaluate_model(model, val_data: pd.DataFrame, model_features) -> float:
+    return mean_absolute_error(val_data["rides_number"], model.predict(val_data[model_features]))
+
+
+def log_compact_model(booster: lgb.Booster, model_str: str, artifact_path: str) -> str:
+    """
+    Function logs a compacted model with the lightgbm flavor keeping the file of the booster as it was written
+    @param booster: lgb.Booster, the compacted model
+    @param model_str: str, the compacted model in the LightGBM text format
+    @param artifact_path: str, the path of the model in the artifacts of the active run
+    @return: str, the URI of the logged model
+    """
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        local_path = os.path.join(tmp_dir, artifact_path)
+        mlflow.lightgbm.save_model(booster, local_path)
+        model_file = mlflow.models.Model.load(local_path).flavors["lightgbm"]["data"]
+        save_model_string(model_str, os.path.join(local_path, model_file))
+        mlflow.log_artifacts(local_path, artifact_path)
+
+    return f"runs:/{mlflow.active_run().info.run_id}/{artifact_path}"
+
+
 def upload_reference_data(filename="data/reference.parquet"):
     client = boto3.client("s3")
     client.upload_file(filename, BUCKET_NAME, os.path.join("escooters-demand", filename))
 
 
 @task(retry_delay_seconds=2, name="Train a model and log it")
-def train_log_model():
-    train = pd.read_parquet(os.path.join("./data/processed", "train.parquet"))
-    val_data = pd.read_parquet(os.path.join("./data/processed", "test.parquet"))
-    model_features = [
-        'community',
-        'day_of_year',
-        'day_of_week',
-        'is_weekend',
-        'week',
-        'month',
-        'area',
-        'distance_to_center',
-    ]
-
-    model_params_path = "./models/best_params.json"
+@instrument_stage("train_log_model")
+def train_log_model(
+    city: str = DEFAULT_CITY,
+    mode: str = "auto",
+    n_incremental_trees: int = 25,
+    init_model_source: str = "local",
+    stage: str = "Production",
+    compaction_mae_tolerance: Optional[float] = COMPACTION_MAE_TOLERANCE,
+):
+    model_name = get_city(city).model_name
+    model_path = get_model_path(city)
+    training_state_path = get_training_state_path(city)
+    path_to_processed_data = get_city_path("data/processed", city)
+
+    train = pd.read_parquet(Path.joinpath(path_to_processed_data, "train.parquet"))
+    val_data = pd.read_parquet(Path.joinpath(path_to_processed_data, "test.parquet"))
+    record_rows(rows_in=len(train) + len(val_data))
+
+    model_params_path = Path.joinpath(get_city_path(MODELS_DIR, city), "best_params.json")
     with open(model_params_path, "r", encoding="utf-8") as file_with_model:
         model_params = json.load(file_with_model)
 
-    categorical_features = ['community', 'day_of_week', 'is_weekend']
+    val_data[CATEGORICAL_FEATURES] = val_data[CATEGORICAL_FEATURES].astype("category")
+
+    today = date.today()
+    state = load_training_state(training_state_path)
+    if state is None:
+        new_days_mask = pd.Series(True, index=train.index)
+    else:
+        new_days_mask = train["start_day"] > pd.Timestamp(state["trained_until"])
+    new_days_num = train.loc[new_days_mask, "start_day"].nunique()
+    can_train_incrementally = state is not None and new_days_num > 0
+    if mode == "auto":
+        mode = choose_training_mode(state, new_days_num, today)
+    if not can_train_incrementally:
+        mode = "full"
+
+    with mlflow.start_run(tags={"city": city}):
+        mlflow.log_params({"training_mode": mode, "new_days": new_days_num})
+        metrics = {}
+
+        # while a full refit is running anyway, the incremental model is trained too
+        # to compare the two on the holdout
+        if can_train_incrementally:
+            train_start = time.perf_counter()
+            incremental_model = train_incremental_model(
+                train,
+                new_days_mask,
+                MODEL_FEATURES,
+                CATEGORICAL_FEATURES,
+                model_params,
+                load_init_model(model_path, model_name, init_model_source),
+                n_incremental_trees,
+            )
+            metrics["incremental_train_time_s"] = time.perf_counter() - train_start
+            metrics["incremental_holdout_mae"] = evaluate_model(incremental_model, val_data, MODEL_FEATURES)
+
+        if mode == "incremental" and metrics["incremental_holdout_mae"] > state["full_refit_holdout_mae"] * (
+            1 + MAX_MAE_REGRESSION
+        ):
+            print("incremental model regressed on the holdout, falling back to a full refit")
+            mode = "full"
+            mlflow.log_param("training_mode_fallback", mode)
+
+        if mode == "full":
+            train_start = time.perf_counter()
+            model = train_lgbm_model(train, MODEL_FEATURES, CATEGORICAL_FEATURES, model_params)
+            metrics["full_train_time_s"] = time.perf_counter() - train_start
+            metrics["full_holdout_mae"] = evaluate_model(model, val_data, MODEL_FEATURES)
+            state = {"last_full_refit": today.isoformat(), "full_refit_holdout_mae": metrics["full_holdout_mae"]}
+        else:
+            model = incremental_model
+
+        metrics["holdout_mae"] = metrics[f"{mode}_holdout_mae"]
+        mlflow.log_metrics(metrics)
+        print(metrics)
+
+        model.booster_.save_model(model_path)
+        state.update(
+            {
+                "trained_until": train["start_day"].max().date().isoformat(),
+                "holdout_mae": metrics["holdout_mae"],
+            }
+        )
+        save_training_state(state, training_state_path)
+        upload_reference_data(training_state_path)
 
-    with mlflow.start_run() as run:
-        model = train_lgbm_model(train, model_features, categorical_features, model_params)
-        model.booster_.save_model("./models/model.txt")
+        # the full model is kept for the incremental training and the batch forecast,
+        # the compacted one is served
+        served_model, compact_model_str = model, None
+        if compaction_mae_tolerance is not None:
+            compact_model_str, compaction_metrics = compact_model(
+                model.booster_, val_data[MODEL_FEATURES], val_data["rides_number"], compaction_mae_tolerance
+            )
+            mlflow.log_metrics(compaction_metrics)
+            print(compaction_metrics)
+            # the float32 values may move the MAE of the selected trees over the tolerance
+            if compaction_metrics["compaction_mae_delta_percent"] <= compaction_mae_tolerance * 100:
+                save_model_string(compact_model_str, get_compact_model_path(city))
+                served_model = lgb.Booster(model_str=compact_model_str)
+            else:
+                print("compacted model exceeded the MAE tolerance, serving the full model")
+                compact_model_str = None
 
-        val_data[categorical_features] = val_data[categorical_features].astype("category")
-        val_preds = model.predict(val_data[model_features])
+        val_preds = served_model.predict(val_data[MODEL_FEATURES])
         val_data['prediction'] = val_preds
-        val_data[: round(len(val_data) / 2)].to_parquet("data/reference.parquet")
-        upload_reference_data("./data/reference.parquet")
+        reference_data_path = str(Path.joinpath(path_to_processed_data, "reference.parquet"))
+        val_data[: round(len(val_data) / 2)].to_parquet(reference_data_path)
+        upload_reference_data(reference_data_path)
 
         artifact_path = "model"
-        model_info = mlflow.lightgbm.log_model(model, artifact_path)
+        if compact_model_str is None:
+            model_uri = mlflow.lightgbm.log_model(served_model, artifact_path).model_uri
+        else:
+            model_uri = log_compact_model(served_model, compact_model_str, artifact_path)
 
-        model_name = "escooter-demand-model"
         client = MlflowClient()
-        model_version = mlflow.register_model(model_uri=model_info.model_uri, name=model_name)
-        client.transition_model_version_stage(model_name, model_version.version, "Production")
+        model_version = mlflow.register_model(model_uri=model_uri, name=model_name)
+        # a model registered as Staging is scored in the shadow of the Production one by the API
+        client.transition_model_version_stage(
+            model_name, model_version.version, stage, archive_existing_versions=stage == "Staging"
+        )
 
     return model
 
@@ -0,0 +1,152 @@
+"""Module with a local memory-mapped store of the monitoring data"""
+import io
+import json
+import os
+import tempfile
+from datetime import datetime
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+import boto3
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from botocore.exceptions import BotoCoreError, ClientError
+
+from src.models.model_cache import write_json_atomically
+
+MONITORING_CACHE_DIR = os.getenv(
+    "MONITORING_CACHE_DIR", str(Path.home() / ".cache" / "escooters-demand" / "monitoring")
+)
+BUCKET_NAME = "serjeeon-learning-bucket"
+DAY_COLUMN = "start_day"
+
+
+class DailyTable:
+    """
+    Table sorted by day with an index of the rows of every day,
+    so the data of a day is a zero-copy slice of the memory-mapped table
+    """
+
+    def __init__(self, table: pa.Table, categorical_features: Optional[List[str]] = None):
+        """
+        @param table: pa.Table sorted by start_day in a single chunk
+        @param categorical_features: list of the columns converted to categories over the whole table
+        """
+
+        self.table = table
+        days = table.column(DAY_COLUMN).to_numpy().astype("datetime64[ns]")
+        self.days, self.offsets = np.unique(days, return_index=True)
+        self.offsets = np.append(self.offsets, table.num_rows)
+        # the categories come from the whole table, so the days get the same categories
+        self.dtypes = {
+            column: pd.CategoricalDtype(sorted(pc.unique(table.column(column)).drop_null().to_pylist()))
+            for column in categorical_features or []
+        }
+
+    def slice(self, day: datetime) -> pa.Table:
+        position = np.searchsorted(self.days, np.datetime64(day, "ns"))
+        if position == len(self.days) or self.days[position] != np.datetime64(day, "ns"):
+            return self.table.slice(0, 0)
+        return self.table.slice(self.offsets[position], self.offsets[position + 1] - self.offsets[position])
+
+    def day(self, day: datetime) -> pd.DataFrame:
+        return self.slice(day).to_pandas().astype(self.dtypes)
+
+    def __iter__(self) -> Iterator[datetime]:
+        return iter(pd.to_datetime(self.days))
+
+
+class MonitoringDataStore:
+    """
+    Local cache of the monitoring datasets stored on S3 as parquet. A dataset is kept in an uncompressed
+    Arrow IPC file sorted by day and memory-mapped on load, it is downloaded again only when
+    the ETag of the S3 object changes. The cached version is used when S3 is unreachable
+    """
+
+    def __init__(self, cache_dir: str = MONITORING_CACHE_DIR, bucket: str = BUCKET_NAME, client=None):
+        """
+        @param cache_dir: str, the directory of the cache
+        @param bucket: str, the S3 bucket of the datasets
+        @param client: S3 client, a new boto3 client if None
+        """
+
+        self.cache_dir = Path(cache_dir)
+        self.bucket = bucket
+        self.client = client or boto3.client("s3")
+
+    def get_paths(self, key: str) -> Tuple[Path, Path]:
+        path = self.cache_dir / Path(key).with_suffix(".arrow")
+        return path, path.with_suffix(".etag.json")
+
+    def read_etag(self, key: str) -> Optional[str]:
+        path, etag_path = self.get_paths(key)
+        if not path.exists() or not etag_path.exists():
+            return None
+        with open(etag_path, "r", encoding="utf-8") as etag_file:
+            return json.load(etag_file)["etag"]
+
+    def refresh(self, key: str) -> Path:
+        """
+        Function updates the cached dataset if the S3 object has changed
+        @param key: str, the key of the parquet file on S3
+        @return: Path of the Arrow IPC file
+        """
+
+        path, etag_path = self.get_paths(key)
+        cached_etag = self.read_etag(key)
+        try:
+            etag = self.client.head_object(Bucket=self.bucket, Key=key)["ETag"]
+            if etag == cached_etag:
+                return path
+            response = self.client.get_object(Bucket=self.bucket, Key=key)
+            table = pq.read_table(io.BytesIO(response["Body"].read()))
+        except (BotoCoreError, ClientError) as error:
+            if cached_etag is None:
+                raise
+            print(f"S3 is unavailable ({error}), using cached {key}")
+            return path
+
+        write_table_atomically(path, table.sort_by(DAY_COLUMN).combine_chunks())
+        write_json_atomically(etag_path, {"etag": response["ETag"], "key": key})
+        print(f"{key} cached to {path}")
+
+        return path
+
+    def load(self, key: str) -> pa.Table:
+        """
+        Function refreshes the cached dataset and memory-maps it
+        @param key: str, the key of the parquet file on S3
+        @return: pa.Table backed by the memory-mapped file
+        """
+
+        # the buffers of the table keep the file mapped
+        source = pa.memory_map(str(self.refresh(key)), "r")
+        return pa.ipc.open_file(source).read_all()
+
+    def load_city(self, city: str, categorical_features: Optional[List[str]] = None) -> Tuple[pd.DataFrame, DailyTable]:
+        """
+        Function loads the reference data and the current data indexed by day of a city
+        @param city: str, the name of the city
+        @param categorical_features: list of the columns of the current data converted to categories
+        @return: the reference data and the current data
+        """
+
+        prefix = f"escooters-demand/data/processed/{city}"
+        reference_data = self.load(f"{prefix}/reference.parquet").to_pandas()
+        current_data = DailyTable(self.load(f"{prefix}/test.parquet"), categorical_features)
+
+        return reference_data, current_data
+
+
+def write_table_atomically(path: Path, table: pa.Table):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{path.name}.", dir=path.parent)
+    os.close(fd)
+    with pa.OSFile(tmp_path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table, max_chunksize=max(table.num_rows, 1))
+    # a process mapping the previous version keeps reading it until it loads the dataset again
+    os.replace(tmp_path, path)
@@ -1,10 +1,11 @@
+import os
 import random
+import sys
 import time
 from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Optional
 
-import boto3
-import mlflow.pyfunc
-import pandas as pd
 import psycopg
 from evidently import ColumnMapping
 from evidently.metrics import (
@@ -14,87 +15,56 @@ from evidently.metrics import (
     DatasetMissingValuesMetric,
 )
 from evidently.report import Report
-from mlflow import MlflowClient
+
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from src.cities import DEFAULT_CITY, get_city
+from src.features.definitions import CATEGORICAL_FEATURES, MODEL_FEATURES, NUMERICAL_FEATURES, TRIP_AGGREGATES
+from src.models.model_cache import ModelCache, load_cached_model
+from src.monitoring.data_store import DailyTable, MonitoringDataStore
 
 POSTGRES_USER = "postgres"
 POSTGRES_PASSWORD = "example"
-TRACKING_URI = "http://16.171.140.74:5000"
+TRACKING_URI = os.getenv("TRACKING_URI", "http://16.171.140.74:5000")
 
 BUCKET_NAME = "serjeeon-learning-bucket"
-MODEL_NAME = "escooter-demand-model"
-MODEL_FEATURES = [
-    'community',
-    'day_of_year',
-    'day_of_week',
-    'is_weekend',
-    'week',
-    'month',
-    'area',
-    'distance_to_center',
-]
+CITY = os.getenv("CITY", DEFAULT_CITY)
 
 SEND_TIMEOUT = 10
 rand = random.Random()
 
 create_table_statement = """
-drop table if exists escooter_demand_metrics;
-create table escooter_demand_metrics(
+create table if not exists escooter_demand_metrics(
+city varchar(64),
 timestamp timestamp,
 prediction_drift float,
 num_drifted_columns integer,
 share_missing_values float
-)
+);
+alter table escooter_demand_metrics add column if not exists city varchar(64);
 """
 
 
 def load_model(model_name):
-    stage = "Production"
-    client = MlflowClient(registry_uri=TRACKING_URI)
-    latest_version = client.get_latest_versions(model_name, stages=[stage])[0].source
-    model = mlflow.pyfunc.load_model(model_uri=latest_version)
+    model, _ = load_cached_model(model_name, cache=ModelCache(tracking_uri=TRACKING_URI))
 
     return model
 
 
-def read_data_from_s3(key, filename):
-    client = boto3.client("s3")
-    client.download_file(BUCKET_NAME, key, filename)
-
-
-MODEL = load_model(MODEL_NAME)
-read_data_from_s3("escooters-demand/data/reference.parquet", "reference.parquet")
-REFERENCE_DATA = pd.read_parquet("reference.parquet")
-read_data_from_s3("escooters-demand/data/processed/test.parquet", "test.parquet")
-NEW_DATA = pd.read_parquet("test.parquet")
-
 begin = datetime(2020, 10, 8)
 
-model_features = [
-    'community',
-    'day_of_year',
-    'day_of_week',
-    'is_weekend',
-    'week',
-    'month',
-    'area',
-    'distance_to_center',
-]
-num_features = [
-    'day_of_year',
-    'week',
-    'month',
-    'area',
-    'distance_to_center',
-]
-categorical_features = ['community', 'day_of_week', 'is_weekend']
 column_mapping = ColumnMapping(
-    prediction='prediction', numerical_features=num_features, categorical_features=categorical_features, target=None
+    prediction='prediction',
+    numerical_features=NUMERICAL_FEATURES,
+    categorical_features=CATEGORICAL_FEATURES,
+    target=None,
 )
-NEW_DATA[categorical_features] = NEW_DATA[categorical_features].astype("category")
 
+# the retraining gate reads the drift score of the prediction as a p-value, evidently would switch
+# to the Wasserstein distance for a reference of over 1000 rows, so the K-S test is set explicitly
 report = Report(
     metrics=[
-        ColumnDriftMetric(column_name='prediction'),
+        ColumnDriftMetric(column_name='prediction', stattest='ks'),
         DatasetDriftMetric(),
         DatasetMissingValuesMetric(),
         ColumnCorrelationsMetric(column_name='prediction'),
@@ -102,7 +72,11 @@ report = Report(
 )
 
 
-def prep_db():
+def load_monitoring_data(city: str = CITY, store: Optional[MonitoringDataStore] = None):
+    return (store or MonitoringDataStore(bucket=BUCKET_NAME)).load_city(city, CATEGORICAL_FEATURES)
+
+
+def prep_db(city: str = CITY):
     with psycopg.connect(
         f"host=localhost port=5432 user={POSTGRES_USER} password={POSTGRES_PASSWORD}", autocommit=True
     ) as conn:
@@ -111,39 +85,55 @@ def prep_db():
             conn.execute("create database test;")
         with psycopg.connect("host=localhost port=5432 dbname=test user=postgres password=example") as conn:
             conn.execute(create_table_statement)
+            conn.execute("delete from escooter_demand_metrics where city = %s", (city,))
 
 
-def calculate_metrics_postgresql(curr, i):
-    current_data = NEW_DATA[
-        (NEW_DATA['start_day'] >= (begin + timedelta(days=i))) & (NEW_DATA['start_day'] < (begin + timedelta(i + 1)))
-    ]
-
-    current_data['prediction'] = MODEL.predict(current_data[model_features].fillna(0))
+def calculate_metrics(model, reference_data, current_data):
+    # a categorical column cannot be filled with a value out of its categories, LightGBM handles the missing ones
+    features = current_data[MODEL_FEATURES].fillna({feature: 0 for feature in NUMERICAL_FEATURES})
+    current_data['prediction'] = model.predict(features)
 
-    report.run(reference_data=REFERENCE_DATA, current_data=current_data, column_mapping=column_mapping)
+    # the trip aggregates are missing on the days without trips and are not inputs of the model
+    report.run(
+        reference_data=reference_data.drop(columns=TRIP_AGGREGATES, errors="ignore"),
+        current_data=current_data.drop(columns=TRIP_AGGREGATES, errors="ignore"),
+        column_mapping=column_mapping,
+    )
 
     result = report.as_dict()
     prediction_drift = result['metrics'][0]['result']['drift_score']
     num_drifted_columns = result['metrics'][1]['result']['number_of_drifted_columns']
     share_missing_values = result['metrics'][2]['result']['current']['share_of_missing_values']
 
+    return prediction_drift, num_drifted_columns, share_missing_values
+
+
+def calculate_metrics_postgresql(curr, i, model, reference_data, new_data: DailyTable, city=CITY):
+    current_data = new_data.day(begin + timedelta(days=i))
+
+    prediction_drift, num_drifted_columns, share_missing_values = calculate_metrics(model, reference_data, current_data)
+
     print(i, prediction_drift, num_drifted_columns, share_missing_values)
 
     curr.execute(
-        "insert into escooter_demand_metrics(timestamp, prediction_drift, num_drifted_columns, share_missing_values) values (%s, %s, %s, %s)",
-        (begin + timedelta(i), prediction_drift, num_drifted_columns, share_missing_values),
+        "insert into escooter_demand_metrics"
+        "(city, timestamp, prediction_drift, num_drifted_columns, share_missing_values) "
+        "values (%s, %s, %s, %s, %s)",
+        (city, begin + timedelta(i), prediction_drift, num_drifted_columns, share_missing_values),
     )
 
 
-def batch_monitoring_backfill():
-    prep_db()
+def batch_monitoring_backfill(city: str = CITY):
+    model = load_model(get_city(city).model_name)
+    reference_data, new_data = load_monitoring_data(city)
+    prep_db(city)
     last_send = datetime.now() - timedelta(seconds=10)
     with psycopg.connect(
         "host=localhost port=5432 dbname=test user=postgres password=example", autocommit=True
     ) as conn:
         for i in range(0, 9):
             with conn.cursor() as curr:
-                calculate_metrics_postgresql(curr, i)
+                calculate_metrics_postgresql(curr, i, model, reference_data, new_data, city)
 
             new_send = datetime.now()
             seconds_elapsed = (new_send - last_send).total_seconds()
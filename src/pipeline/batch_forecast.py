@@ -0,0 +1,243 @@
+"""Module for batch forecasting of the demand for all communities over a horizon of days"""
+import io
+import os
+import pickle
+import sys
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Optional, Sequence, Tuple
+
+import lightgbm as lgb
+import numpy as np
+import pandas as pd
+from prefect import task
+from scipy.stats import poisson
+
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from src.cities import DEFAULT_CITY, get_city_path
+from src.features.build_features import build_features_on_date
+from src.features.definitions import CATEGORICAL_FEATURES, MODEL_FEATURES
+from src.pipeline.instrumentation import instrument_stage, record_rows
+
+QUANTILES = (0.1, 0.5, 0.9)
+
+FORECAST_TABLE = "escooter_demand_forecast"
+FORECAST_COLUMNS = [
+    "city",
+    "forecast_date",
+    "target_day",
+    "horizon",
+    "level",
+    "community",
+    "community_name",
+    "trips",
+    "p10",
+    "p50",
+    "p90",
+]
+
+create_table_statement = f"""
+create table if not exists {FORECAST_TABLE}(
+city varchar(64),
+forecast_date date,
+target_day date,
+horizon integer,
+level varchar(16),
+community integer,
+community_name varchar(64),
+trips float,
+p10 integer,
+p50 integer,
+p90 integer
+);
+alter table {FORECAST_TABLE} add column if not exists city varchar(64);
+"""
+
+
+def load_community_features(features_filepath: Path) -> Tuple[pd.DataFrame, date]:
+    """
+    Function loads the static features of the communities and the last day with data
+    @param features_filepath: Path, the path of the interim features dataset
+    @return: pd.DataFrame with one row per community and the last day with data
+    """
+
+    features = pd.read_parquet(features_filepath, columns=["start_day", "community", "area", "distance_to_center"])
+    community_features = features.drop_duplicates("community", keep="last").sort_values("community")
+    last_day = features["start_day"].max().date()
+
+    return community_features[["community", "area", "distance_to_center"]].reset_index(drop=True), last_day
+
+
+def build_horizon_features(community_features: pd.DataFrame, first_day: date, horizon_days: int) -> pd.DataFrame:
+    """
+    Function creates a dataset with all combinations of communities and days of the horizon
+    @param community_features: pd.DataFrame, the static features of the communities
+    @param first_day: date, the first day of the horizon
+    @param horizon_days: int, the number of days to forecast
+    @return: pd.DataFrame with the model features for every community and day of the horizon
+    """
+
+    days = pd.date_range(first_day, periods=horizon_days, freq="1D")
+    horizon = pd.DataFrame(
+        {
+            "start_day": np.repeat(days.values, len(community_features)),
+            "horizon": np.repeat(np.arange(1, horizon_days + 1), len(community_features)),
+        }
+    )
+    horizon = pd.concat(
+        [horizon, pd.concat([community_features] * horizon_days, ignore_index=True)],
+        axis=1,
+    )
+
+    return build_features_on_date(horizon)
+
+
+def score_horizon(
+    model: lgb.Booster, horizon_features: pd.DataFrame, quantiles: Sequence[float] = QUANTILES
+) -> pd.DataFrame:
+    """
+    Function scores the whole horizon with a single model call and derives
+    the quantiles of the number of trips from the predicted Poisson rates
+    @param model: lgb.Booster, the trained model
+    @param horizon_features: pd.DataFrame, the model features for every community and day
+    @param quantiles: levels of the quantiles to calculate
+    @return: pd.DataFrame with the forecasts for every community and day
+    """
+
+    X = horizon_features[MODEL_FEATURES].copy()
+    X[CATEGORICAL_FEATURES] = X[CATEGORICAL_FEATURES].astype("category")
+    rates = np.clip(model.predict(X), 0, None)
+
+    forecast = horizon_features[["start_day", "horizon", "community"]].copy()
+    forecast["trips"] = rates
+    quantile_values = poisson.ppf(np.asarray(quantiles)[np.newaxis, :], rates[:, np.newaxis])
+    for i, level in enumerate(quantiles):
+        forecast[f"p{round(level * 100)}"] = quantile_values[:, i].astype(int)
+
+    return forecast
+
+
+def reconcile_city_totals(forecast: pd.DataFrame, quantiles: Sequence[float] = QUANTILES) -> pd.DataFrame:
+    """
+    Function calculates city-wide forecasts as the sum of the communities forecasts,
+    so the hierarchy is coherent by construction. The sum of independent Poisson
+    variables is Poisson too, so the quantiles of the total come from the summed rate
+    @param forecast: pd.DataFrame, the forecasts for every community and day
+    @param quantiles: levels of the quantiles to calculate
+    @return: pd.DataFrame with one city-wide forecast per day
+    """
+
+    city_forecast = forecast.groupby(["start_day", "horizon"], as_index=False).agg(trips=("trips", "sum"))
+    quantile_values = poisson.ppf(np.asarray(quantiles)[np.newaxis, :], city_forecast["trips"].values[:, np.newaxis])
+    for i, level in enumerate(quantiles):
+        city_forecast[f"p{round(level * 100)}"] = quantile_values[:, i].astype(int)
+
+    return city_forecast
+
+
+def combine_forecasts(
+    forecast: pd.DataFrame,
+    city_forecast: pd.DataFrame,
+    community_codes_dict: dict,
+    forecast_date: date,
+    city: str = DEFAULT_CITY,
+) -> pd.DataFrame:
+    community_codes_inv_dict = {v: k for k, v in community_codes_dict.items()}
+    forecast = forecast.assign(level="community", community_name=forecast["community"].map(community_codes_inv_dict))
+    city_forecast = city_forecast.assign(level="city", community=pd.NA, community_name="CITY TOTAL")
+
+    result = pd.concat([forecast, city_forecast], ignore_index=True)
+    result["community"] = result["community"].astype("Int64")
+    result["target_day"] = result["start_day"].dt.date
+    result["forecast_date"] = forecast_date
+    result["city"] = city
+
+    return result[FORECAST_COLUMNS]
+
+
+def write_forecast_parquet(forecast: pd.DataFrame, path_to_forecasts: Path):
+    """
+    Function writes forecasts as a parquet dataset partitioned by the city and the forecast date,
+    a rerun for the same city and date replaces its partition
+    @param forecast: pd.DataFrame, the forecasts to write
+    @param path_to_forecasts: Path, the root directory of the dataset
+    """
+
+    path_to_forecasts.mkdir(parents=True, exist_ok=True)
+    forecast.astype({"forecast_date": str}).to_parquet(
+        path_to_forecasts,
+        partition_cols=["city", "forecast_date"],
+        index=False,
+        existing_data_behavior="delete_matching",
+    )
+
+
+def copy_forecast_to_postgres(forecast: pd.DataFrame, conninfo: str):
+    """
+    Function loads forecasts into PostgreSQL with a single COPY,
+    replacing the rows previously written for the same city and forecast date
+    @param forecast: pd.DataFrame, the forecasts to write
+    @param conninfo: str, the connection string of the database
+    """
+
+    import psycopg
+
+    buffer = io.StringIO()
+    forecast.to_csv(buffer, index=False, header=False, na_rep="")
+    buffer.seek(0)
+
+    with psycopg.connect(conninfo) as conn:
+        conn.execute(create_table_statement)
+        conn.execute(
+            f"delete from {FORECAST_TABLE} where city = %s and forecast_date = %s",
+            (forecast["city"].iloc[0], forecast["forecast_date"].iloc[0]),
+        )
+        with conn.cursor() as curr:
+            with curr.copy(
+                f"copy {FORECAST_TABLE} ({', '.join(FORECAST_COLUMNS)}) from stdin with (format csv, null '')"
+            ) as copy:
+                while data := buffer.read(1 << 20):
+                    copy.write(data)
+
+
+@task(retries=3, retry_delay_seconds=2, name="Forecast demand over the horizon")
+@instrument_stage("forecast_demand")
+def forecast_demand(
+    city: str = DEFAULT_CITY,
+    horizon_days: int = 3,
+    first_day: Optional[str] = None,
+    path_to_models: str = "./models",
+    path_to_interim_data: str = "./data/interim",
+    path_to_references: str = "./data/references",
+    path_to_forecasts: str = "./data/forecasts",
+    db_conninfo: Optional[str] = None,
+):
+    community_features, last_day = load_community_features(
+        Path.joinpath(get_city_path(path_to_interim_data, city), "interim_features.parquet")
+    )
+    if first_day is None:
+        horizon_start = last_day + timedelta(days=1)
+    else:
+        horizon_start = date.fromisoformat(first_day)
+
+    community_codes_filepath = Path.joinpath(get_city_path(path_to_references, city), "community_codes_dict.pkl")
+    with open(community_codes_filepath, "rb") as community_codes_file:
+        community_codes_dict = pickle.load(community_codes_file)
+
+    model = lgb.Booster(model_file=str(Path.joinpath(get_city_path(path_to_models, city), "model.txt")))
+    horizon_features = build_horizon_features(community_features, horizon_start, horizon_days)
+    forecast = score_horizon(model, horizon_features)
+    city_forecast = reconcile_city_totals(forecast)
+    result = combine_forecasts(forecast, city_forecast, community_codes_dict, date.today(), city)
+
+    record_rows(rows_in=len(horizon_features), rows_out=len(result))
+    write_forecast_parquet(result, Path(path_to_forecasts))
+    db_conninfo = db_conninfo or os.getenv("FORECAST_DB_CONNINFO")
+    if db_conninfo:
+        copy_forecast_to_postgres(result, db_conninfo)
+    print(f"{city} forecast for {horizon_days} days from {horizon_start} is ready: {len(result)} rows")
+
+
+if __name__ == "__main__":
+    forecast_demand()
@@ -0,0 +1,42 @@
+"""Module with the training flow of a single city"""
+from typing import Any, Dict, List
+
+from prefect import flow
+
+from src.data.load_data import load_raw_data
+from src.data.scrape_data import scrape_external_data
+from src.data.split import split_dataset
+from src.features.build_features import featurize
+from src.models.hpo import hpo
+from src.models.train_model import train_log_model
+from src.pipeline import instrumentation
+from src.pipeline.batch_forecast import forecast_demand
+from src.pipeline.retrain_gate import FULL_HPO, SKIP, retrain_gate, save_stage_costs
+
+
+@flow(name="City model training")
+def city_flow(city: str, retrain_mode: str = "auto"):
+    load_raw_data(city=city)
+    scrape_external_data(city=city)
+    featurize(city=city)
+    split_dataset(city=city)
+    decision = retrain_gate(city=city, mode=retrain_mode)
+    if decision == FULL_HPO:
+        hpo(city=city)
+    if decision != SKIP:
+        train_log_model(city=city)
+        save_stage_costs(city, instrumentation.STAGE_METRICS)
+    forecast_demand(city=city)
+
+
+def run_city_flow(city: str, retrain_mode: str = "auto") -> List[Dict[str, Any]]:
+    """
+    Function runs the flow of a city in a worker process. The active MLflow run
+    and the peak RSS are per process, so the cities trained in parallel do not interfere
+    @param city: str, the name of the city
+    @param retrain_mode: str, "auto" to let the retraining gate decide or the decision to force
+    @return: the metrics of the stages of the flow to report them in the parent process
+    """
+
+    city_flow(city, retrain_mode)
+    return instrumentation.STAGE_METRICS
@@ -0,0 +1,256 @@
+"""Module for measuring the resources used by the stages of the training flow"""
+import cProfile
+import functools
+import inspect
+import json
+import os
+import resource
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+PROFILE_STAGE_ENV = "PROFILE_STAGE"
+PROFILER_ENV = "PROFILER"
+PROFILES_DIR = "reports/profiles"
+
+STAGE_METRICS: List[Dict[str, Any]] = []
+_current_stage = threading.local()
+
+
+def read_process_io() -> Dict[str, int]:
+    """
+    Function reads the numbers of bytes the process has read and written so far,
+    including the network and the page cache (Linux only)
+    @return: dict with rchar and wchar counters, empty if they are not available
+    """
+
+    try:
+        with open("/proc/self/io", "r", encoding="utf-8") as io_file:
+            counters = dict(line.split(": ") for line in io_file.read().splitlines())
+    except OSError:
+        return {}
+
+    return {"rchar": int(counters["rchar"]), "wchar": int(counters["wchar"])}
+
+
+def reset_peak_rss() -> bool:
+    """
+    Function resets the peak RSS of the process to its current RSS (Linux only)
+    @return: bool, True if the peak RSS was reset
+    """
+
+    try:
+        with open("/proc/self/clear_refs", "w", encoding="utf-8") as clear_refs_file:
+            clear_refs_file.write("5")
+    except OSError:
+        return False
+
+    return True
+
+
+def read_peak_rss_mb() -> float:
+    """
+    Function reads the peak RSS of the process since the last reset
+    @return: float, the peak RSS in megabytes
+    """
+
+    try:
+        with open("/proc/self/status", "r", encoding="utf-8") as status_file:
+            for line in status_file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def record_rows(rows_in: Optional[int] = None, rows_out: Optional[int] = None):
+    """
+    Function records the numbers of rows processed by the stage running in the current thread
+    @param rows_in: int, the number of rows read by the stage
+    @param rows_out: int, the number of rows written by the stage
+    """
+
+    metrics = getattr(_current_stage, "metrics", None)
+    if metrics is None:
+        return
+    if rows_in is not None:
+        metrics["rows_in"] = metrics.get("rows_in", 0) + rows_in
+    if rows_out is not None:
+        metrics["rows_out"] = metrics.get("rows_out", 0) + rows_out
+
+
+def record_metrics(**values: Any):
+    """
+    Function records additional metrics of the stage running in the current thread,
+    the numeric ones are logged to MLflow and all of them are written to the JSON report
+    @param values: the metrics by their names
+    """
+
+    metrics = getattr(_current_stage, "metrics", None)
+    if metrics is not None:
+        metrics.update(values)
+
+
+class StageProfiler:
+    """
+    Profiler of a single stage. The sampling profiler (pyinstrument) is used by default,
+    cProfile is used if PROFILER=cprofile or pyinstrument is not installed
+    """
+
+    def __init__(self, stage_name: str):
+        self.stage_name = stage_name
+        self.profiler = None
+        self.kind = os.getenv(PROFILER_ENV, "pyinstrument")
+        if self.kind == "pyinstrument":
+            try:
+                from pyinstrument import Profiler
+            except ImportError:
+                print("pyinstrument is not installed, falling back to cProfile")
+                self.kind = "cprofile"
+            else:
+                self.profiler = Profiler()
+        if self.kind == "cprofile":
+            self.profiler = cProfile.Profile()
+
+    @staticmethod
+    def is_enabled(stage_name: str) -> bool:
+        return os.getenv(PROFILE_STAGE_ENV) in {stage_name, "all"}
+
+    def start(self):
+        if self.kind == "cprofile":
+            self.profiler.enable()
+        else:
+            self.profiler.start()
+
+    def stop(self) -> Path:
+        profiles_dir = Path(PROFILES_DIR)
+        profiles_dir.mkdir(parents=True, exist_ok=True)
+        filename = f"{self.stage_name}-{datetime.now():%Y%m%d-%H%M%S}"
+
+        if self.kind == "cprofile":
+            self.profiler.disable()
+            profile_path = profiles_dir / f"{filename}.prof"
+            self.profiler.dump_stats(profile_path)
+        else:
+            self.profiler.stop()
+            profile_path = profiles_dir / f"{filename}.html"
+            profile_path.write_text(self.profiler.output_html(), encoding="utf-8")
+
+        return profile_path
+
+
+def get_city_argument(signature: inspect.Signature, args: tuple, kwargs: Dict[str, Any]) -> Optional[Any]:
+    """
+    Function finds the city a stage is called for, Prefect passes the parameters of a task positionally
+    @param signature: inspect.Signature of the function of the stage
+    @param args: tuple, the positional arguments of the call
+    @param kwargs: dict, the keyword arguments of the call
+    @return: the city, None if the stage has no city parameter
+    """
+
+    if "city" not in signature.parameters:
+        return None
+    try:
+        bound_arguments = signature.bind(*args, **kwargs)
+    except TypeError:
+        # the call fails anyway, with the error of the function itself
+        return kwargs.get("city")
+    bound_arguments.apply_defaults()
+
+    return bound_arguments.arguments["city"]
+
+
+def instrument_stage(stage_name: str) -> Callable:
+    """
+    Decorator measuring wall and CPU time, peak RSS and I/O of a stage of the flow.
+    The peak RSS is the one of the stage where the peak of the process can be reset,
+    otherwise it is the peak of the whole process reported as process_peak_rss_mb.
+    The measurements are appended to STAGE_METRICS, the stage can report
+    the numbers of rows it processed with record_rows.
+    The city of the stage is recorded too, whether it is passed positionally, by keyword or by default
+    @param stage_name: str, the name of the stage
+    @return: decorator for the function of the stage
+    """
+
+    def decorator(func: Callable) -> Callable:
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            metrics: Dict[str, Any] = {"stage": stage_name, "started_at": datetime.now().isoformat()}
+            city = get_city_argument(signature, args, kwargs)
+            if city is not None:
+                metrics["city"] = city
+            profiler = StageProfiler(stage_name) if StageProfiler.is_enabled(stage_name) else None
+            _current_stage.metrics = metrics
+
+            io_before = read_process_io()
+            peak_rss_key = "stage_peak_rss_mb" if reset_peak_rss() else "process_peak_rss_mb"
+            wall_start, cpu_start = time.perf_counter(), time.process_time()
+            if profiler is not None:
+                profiler.start()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                if profiler is not None:
+                    metrics["profile"] = str(profiler.stop())
+                metrics["wall_time_s"] = time.perf_counter() - wall_start
+                metrics["cpu_time_s"] = time.process_time() - cpu_start
+                metrics[peak_rss_key] = read_peak_rss_mb()
+                io_after = read_process_io()
+                if io_before and io_after:
+                    metrics["bytes_read"] = io_after["rchar"] - io_before["rchar"]
+                    metrics["bytes_written"] = io_after["wchar"] - io_before["wchar"]
+                _current_stage.metrics = None
+                STAGE_METRICS.append(metrics)
+
+        return wrapper
+
+    return decorator
+
+
+def get_stage_key(metrics: Dict[str, Any]) -> str:
+    return f"{metrics['city']}.{metrics['stage']}" if "city" in metrics else metrics["stage"]
+
+
+def report_stage_metrics(report_path: str = "reports/stage_metrics.json", log_to_mlflow: bool = True):
+    """
+    Function writes the metrics of the stages to a JSON report and logs them to MLflow
+    @param report_path: str, the path of the JSON report
+    @param log_to_mlflow: bool, a flag that determines whether the metrics should be logged to MLflow
+    """
+
+    Path(report_path).parent.mkdir(parents=True, exist_ok=True)
+    with open(report_path, "w", encoding="utf-8") as report_file:
+        json.dump(STAGE_METRICS, report_file, indent=2)
+
+    if log_to_mlflow:
+        import mlflow
+
+        with mlflow.start_run(run_name="pipeline-stages"):
+            for metrics in STAGE_METRICS:
+                mlflow.log_metrics(
+                    {
+                        f"{get_stage_key(metrics)}.{name}": value
+                        for name, value in metrics.items()
+                        if isinstance(value, (int, float))
+                    }
+                )
+            mlflow.log_artifact(report_path)
+            for metrics in STAGE_METRICS:
+                if "profile" in metrics:
+                    mlflow.log_artifact(metrics["profile"], artifact_path="profiles")
+
+    for metrics in STAGE_METRICS:
+        if "stage_peak_rss_mb" in metrics:
+            peak_rss = f"stage peak rss {metrics['stage_peak_rss_mb']:.0f}MB"
+        else:
+            peak_rss = f"process peak rss {metrics['process_peak_rss_mb']:.0f}MB"
+        print(
+            f"{get_stage_key(metrics)}: wall {metrics['wall_time_s']:.1f}s, cpu {metrics['cpu_time_s']:.1f}s, "
+            f"{peak_rss}, rows in/out {metrics.get('rows_in')}/{metrics.get('rows_out')}"
+        )
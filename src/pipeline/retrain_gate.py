@@ -0,0 +1,240 @@
+"""Module with the stage deciding whether the model of a city should be retrained"""
+import os
+from dataclasses import dataclass
+from datetime import date, datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import lightgbm as lgb
+import mlflow
+import pandas as pd
+import psycopg
+from mlflow.exceptions import MlflowException
+from prefect import task
+
+from src.cities import DEFAULT_CITY, get_city, get_city_path
+from src.features.definitions import CATEGORICAL_FEATURES, MODEL_FEATURES
+from src.models.train_model import (
+    MODELS_DIR,
+    evaluate_model,
+    get_model_path,
+    get_training_state_path,
+    load_training_state,
+    save_training_state,
+    upload_reference_data,
+)
+from src.pipeline.instrumentation import instrument_stage, record_metrics
+
+DRIFT_METRICS_DSN = os.getenv(
+    "DRIFT_METRICS_DSN", "host=localhost port=5432 dbname=test user=postgres password=example"
+)
+STAGE_COSTS_FILENAME = "stage_costs.json"
+
+SKIP = "skip"
+RETRAIN = "retrain"
+FULL_HPO = "full_hpo"
+DECISIONS = [SKIP, RETRAIN, FULL_HPO]
+# the stages each decision leaves out of the flow
+SKIPPED_STAGES = {SKIP: ["hpo", "train_log_model"], RETRAIN: ["hpo"], FULL_HPO: []}
+
+# the monitoring tests the daily predictions with K-S, the drift score is its p-value
+PREDICTION_DRIFT_P_VALUE = 0.05
+MAX_DRIFTED_COLUMNS = 2
+MAX_SHARE_MISSING_VALUES = 0.05
+MIN_NEW_DAYS = 1
+# the training replaces an incremental model regressing by over 5% with a full refit, so the saved MAE
+# stays within 5% of the full refit and the regression is measured on the latest holdout instead
+MAX_MAE_REGRESSION_FOR_HPO = 0.15
+
+
+@dataclass
+class DriftMetrics:
+    """
+    The latest drift metrics of a city written by the monitoring
+    """
+
+    timestamp: datetime
+    prediction_drift: float
+    num_drifted_columns: int
+    share_missing_values: float
+
+
+def read_latest_drift_metrics(conn, city: str, placeholder: str = "%s") -> Optional[DriftMetrics]:
+    """
+    Function reads the drift metrics of the latest day from the escooter_demand_metrics table
+    @param conn: DB-API connection to the monitoring database, psycopg or sqlite3
+    @param city: str, the name of the city
+    @param placeholder: str, the query parameter placeholder of the driver, "?" for sqlite3
+    @return: DriftMetrics or None if the city has no metrics
+    """
+
+    row = conn.execute(
+        "select timestamp, prediction_drift, num_drifted_columns, share_missing_values "
+        f"from escooter_demand_metrics where city = {placeholder} order by timestamp desc limit 1",
+        (city,),
+    ).fetchone()
+    if row is None:
+        return None
+
+    timestamp = row[0] if isinstance(row[0], datetime) else datetime.fromisoformat(row[0])
+    return DriftMetrics(timestamp, row[1], row[2], row[3])
+
+
+def evaluate_current_model(city: str) -> Optional[float]:
+    """
+    Function measures the MAE of the current model of a city on the holdout of the latest split.
+    The model saved by the last training is used, or the Production one if it is not saved locally
+    @param city: str, the name of the city
+    @return: float, the MAE or None if the holdout or the model is not available
+    """
+
+    holdout_path = Path.joinpath(get_city_path("data/processed", city), "test.parquet")
+    if not holdout_path.exists():
+        return None
+
+    model_path = get_model_path(city)
+    try:
+        if os.path.exists(model_path):
+            model = lgb.Booster(model_file=model_path)
+        else:
+            model = mlflow.lightgbm.load_model(f"models:/{get_city(city).model_name}/Production")
+    except MlflowException as error:
+        print(f"current model is unavailable ({error})")
+        return None
+
+    holdout = pd.read_parquet(holdout_path)
+    holdout[CATEGORICAL_FEATURES] = holdout[CATEGORICAL_FEATURES].astype("category")
+    return evaluate_model(model, holdout, MODEL_FEATURES)
+
+
+def choose_retraining(
+    state: Optional[Dict[str, Any]],
+    drift: Optional[DriftMetrics],
+    new_days_num: int,
+    has_params: bool = True,
+    current_mae: Optional[float] = None,
+    prediction_drift_p_value: float = PREDICTION_DRIFT_P_VALUE,
+    max_drifted_columns: int = MAX_DRIFTED_COLUMNS,
+    max_share_missing_values: float = MAX_SHARE_MISSING_VALUES,
+    min_new_days: int = MIN_NEW_DAYS,
+    max_mae_regression_for_hpo: float = MAX_MAE_REGRESSION_FOR_HPO,
+) -> Tuple[str, str]:
+    """
+    Function chooses between skipping the training, retraining with the current hyperparameters
+    and retraining after a new hyperparameter search
+    @param state: dict, the state saved by the previous training or None
+    @param drift: DriftMetrics of the days after the training or None if they are not available
+    @param new_days_num: int, the number of days the current model was not trained on
+    @param has_params: bool, a flag that determines whether the hyperparameters of the city were searched before
+    @param current_mae: float, the MAE of the current model on the latest holdout or None if it is not available
+    @param prediction_drift_p_value: float, the p-value of the prediction drift test the drift is detected below
+    @param max_drifted_columns: int, the number of drifted features a new search is run from
+    @param max_share_missing_values: float, the share of missing values the model is retrained above
+    @param min_new_days: int, the number of new days the model is retrained from
+    @param max_mae_regression_for_hpo: float, the relative growth of the MAE of the current model
+    on the latest holdout over the MAE of the last full refit a new search is run above
+    @return: the decision and its reason
+    """
+
+    if not has_params:
+        return FULL_HPO, "no hyperparameters"
+    if state is None:
+        return RETRAIN, "no trained model"
+    if drift is not None and drift.num_drifted_columns >= max_drifted_columns:
+        return FULL_HPO, f"{drift.num_drifted_columns} features drifted"
+    if current_mae is not None and current_mae > state["full_refit_holdout_mae"] * (1 + max_mae_regression_for_hpo):
+        return FULL_HPO, "holdout MAE regressed"
+    if drift is not None and drift.prediction_drift < prediction_drift_p_value:
+        return RETRAIN, "prediction drifted"
+    if drift is not None and drift.share_missing_values > max_share_missing_values:
+        return RETRAIN, "missing values"
+    if new_days_num >= min_new_days:
+        return RETRAIN, f"{new_days_num} new days"
+
+    return SKIP, "no new data and no drift"
+
+
+def get_stage_costs_path(city: str) -> str:
+    return str(Path.joinpath(get_city_path(MODELS_DIR, city), STAGE_COSTS_FILENAME))
+
+
+def save_stage_costs(city: str, stage_metrics: List[Dict[str, Any]]):
+    """
+    Function saves the wall and CPU time of the last run of the stages the gate can skip
+    @param city: str, the name of the city
+    @param stage_metrics: list of the metrics recorded by instrument_stage
+    """
+
+    path = get_stage_costs_path(city)
+    costs = load_training_state(path) or {}
+    for metrics in stage_metrics:
+        if metrics.get("city") == city and metrics["stage"] in SKIPPED_STAGES[SKIP]:
+            costs[metrics["stage"]] = {"wall_time_s": metrics["wall_time_s"], "cpu_time_s": metrics["cpu_time_s"]}
+    save_training_state(costs, path)
+    upload_reference_data(path)
+
+
+def estimate_saved_compute(decision: str, costs: Dict[str, Dict[str, float]]) -> Dict[str, float]:
+    """
+    Function estimates the compute a decision saves from the last run of the skipped stages
+    @param decision: str, the decision of the gate
+    @param costs: dict, the last wall and CPU time of the stages
+    @return: dict with the saved wall and CPU time, the stages that never ran count as zero
+    """
+
+    skipped_costs = [costs[stage] for stage in SKIPPED_STAGES[decision] if stage in costs]
+    return {
+        "saved_wall_time_s": sum(cost["wall_time_s"] for cost in skipped_costs),
+        "saved_cpu_time_s": sum(cost["cpu_time_s"] for cost in skipped_costs),
+    }
+
+
+@task(name="Decide on retraining")
+@instrument_stage("retrain_gate")
+def retrain_gate(city: str = DEFAULT_CITY, mode: str = "auto", dsn: str = DRIFT_METRICS_DSN) -> str:
+    """
+    Function decides whether the model of a city should be retrained from the drift metrics
+    written by the monitoring, the error of the current model on the latest holdout and the new data
+    @param city: str, the name of the city
+    @param mode: str, "auto" or one of the decisions to force it
+    @param dsn: str, the connection string of the monitoring database
+    @return: str, "skip", "retrain" or "full_hpo"
+    """
+
+    if mode != "auto" and mode not in DECISIONS:
+        raise ValueError(f"Unknown retraining mode {mode}, expected auto or one of {', '.join(DECISIONS)}")
+
+    state = load_training_state(get_training_state_path(city))
+    train_days = pd.read_parquet(
+        Path.joinpath(get_city_path("data/processed", city), "train.parquet"), columns=["start_day"]
+    )["start_day"]
+    if state is not None:
+        train_days = train_days[train_days > pd.Timestamp(state["trained_until"])]
+    new_days_num = train_days.nunique()
+
+    try:
+        with psycopg.connect(dsn) as conn:
+            drift = read_latest_drift_metrics(conn, city)
+    except psycopg.Error as error:
+        print(f"drift metrics are unavailable ({error})")
+        drift = None
+    # the metrics of the days the model was trained on say nothing about the drift
+    if drift is not None and state is not None and drift.timestamp.date() <= date.fromisoformat(state["trained_until"]):
+        drift = None
+
+    current_mae = None
+    if mode == "auto":
+        has_params = Path.joinpath(get_city_path(MODELS_DIR, city), "best_params.json").exists()
+        if state is not None:
+            current_mae = evaluate_current_model(city)
+        decision, reason = choose_retraining(state, drift, new_days_num, has_params, current_mae)
+    else:
+        decision, reason = mode, "forced"
+
+    saved_compute = estimate_saved_compute(decision, load_training_state(get_stage_costs_path(city)) or {})
+    record_metrics(
+        decision=decision, reason=reason, new_days=new_days_num, current_holdout_mae=current_mae, **saved_compute
+    )
+    print(f"{city}: {decision} ({reason}), saved {saved_compute['saved_wall_time_s']:.0f}s of wall time")
+
+    return decision
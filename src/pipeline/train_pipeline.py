@@ -1,26 +1,41 @@
 import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
 from pathlib import Path
+from typing import List, Optional
 
 from prefect import flow
 
 sys.path.append(str(Path(__file__).parent.parent.parent))
 
-from src.data.load_data import load_raw_data
-from src.data.scrape_data import scrape_external_data
-from src.data.split import split_dataset
-from src.features.build_features import featurize
-from src.models.hpo import hpo
-from src.models.train_model import train_log_model
+from src.cities import load_cities
+from src.pipeline import instrumentation
+from src.pipeline.city_flow import city_flow, run_city_flow
+from src.pipeline.instrumentation import report_stage_metrics
 
 
 @flow(name="Model training")
-def main_flow():
-    load_raw_data()
-    scrape_external_data()
-    featurize()
-    split_dataset()
-    hpo()
-    train_log_model()
+def main_flow(cities: Optional[List[str]] = None, max_workers: int = 4, retrain_mode: str = "auto"):
+    cities = cities or list(load_cities())
+    failed_cities = []
+
+    if len(cities) == 1:
+        city_flow(cities[0], retrain_mode)
+    else:
+        # every city is trained in its own process, MLflow keeps the active run in a global
+        mp_context = get_context("spawn")
+        with ProcessPoolExecutor(max_workers=min(max_workers, len(cities)), mp_context=mp_context) as executor:
+            futures = {executor.submit(run_city_flow, city, retrain_mode): city for city in cities}
+            for future in as_completed(futures):
+                try:
+                    instrumentation.STAGE_METRICS.extend(future.result())
+                except Exception as error:  # pylint: disable=broad-except
+                    print(f"training for {futures[future]} failed: {error}")
+                    failed_cities.append(futures[future])
+
+    report_stage_metrics()
+    if failed_cities:
+        raise RuntimeError(f"training failed for {', '.join(failed_cities)}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,8 @@
+# -*- coding: utf-8 -*-
+import os
+import tempfile
+from pathlib import Path
+
+# the modules of the project configure MLflow at import, so a local tracking store has to be set up
+# before they are imported to keep the runs of the tests out of the repository
+os.environ["TRACKING_URI"] = (Path(tempfile.mkdtemp()) / "mlruns").as_uri()
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+import json
+
+import pytest
+
+from src.cities import DEFAULT_CITY, get_city, load_cities
+
+
+def test_cities_config(tmp_path, monkeypatch):
+    """
+    Function for testing the cities added with a JSON config
+    """
+    config_path = tmp_path / "cities.json"
+    config_path.write_text(
+        json.dumps(
+            {
+                "austin": {
+                    "rides_data_url": "https://data.austintexas.gov/rides.csv",
+                    "boundaries_url": "https://data.austintexas.gov/boundaries.geojson",
+                    "coordinates_page_url": "https://www.latlong.net/place/austin-tx-usa-4720.html",
+                }
+            }
+        ),
+        encoding="utf-8",
+    )
+    monkeypatch.setenv("CITIES_CONFIG", str(config_path))
+
+    assert set(load_cities()) == {DEFAULT_CITY, "austin"}
+    assert get_city("austin").model_name == "escooter-demand-model-austin"
+    assert get_city(DEFAULT_CITY).model_name == "escooter-demand-model"
+    with pytest.raises(ValueError):
+        get_city("springfield")
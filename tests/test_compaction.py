@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+import lightgbm as lgb
+import numpy as np
+import pandas as pd
+import pytest
+from lightgbm import LGBMRegressor
+
+from src.models.compaction import compact_model, pack_float32, select_trees, split_model_string
+
+FEATURES = ["community", "day_of_week", "distance_to_center"]
+
+
+@pytest.fixture(scope="module")
+def data():
+    """
+    A fixture for the train and the holdout data of a Poisson model
+    """
+
+    rng = np.random.default_rng(585)
+    n_rows = 6000
+    data = pd.DataFrame(
+        {
+            "community": rng.integers(1, 78, n_rows),
+            "day_of_week": rng.integers(0, 7, n_rows),
+            "distance_to_center": rng.uniform(0.003, 0.29, n_rows),
+        }
+    )
+    data["rides_number"] = rng.poisson(50 * np.exp(-5 * data["distance_to_center"]) * (1 + (data["day_of_week"] > 4)))
+    data[["community", "day_of_week"]] = data[["community", "day_of_week"]].astype("category")
+
+    return data[:4000], data[4000:]
+
+
+@pytest.fixture(scope="module")
+def booster(data):
+    """
+    A fixture for a model with more trees than it needs
+    """
+
+    train, _ = data
+    model = LGBMRegressor(objective="poisson", n_estimators=200, num_leaves=31, random_state=585)
+    model.fit(train[FEATURES], train["rides_number"])
+
+    return model.booster_
+
+
+def test_compact_model(booster, data):
+    """
+    Function for testing that the compacted model has fewer trees, keeps the holdout MAE
+    within the tolerance and is smaller
+    """
+
+    _, holdout = data
+    compact_model_str, metrics = compact_model(booster, holdout[FEATURES], holdout["rides_number"], tolerance=0.01)
+    compact_booster = lgb.Booster(model_str=compact_model_str)
+
+    full_mae = np.abs(holdout["rides_number"] - booster.predict(holdout[FEATURES])).mean()
+    compact_mae = np.abs(holdout["rides_number"] - compact_booster.predict(holdout[FEATURES])).mean()
+
+    assert compact_booster.num_trees() == metrics["compaction_kept_trees"] < booster.num_trees()
+    assert compact_mae == pytest.approx(metrics["compaction_holdout_mae"])
+    assert compact_mae <= full_mae * 1.01 + 1e-6
+    assert metrics["compaction_size_bytes_after"] < metrics["compaction_size_bytes_before"]
+    assert "tree_sizes=" not in compact_model_str and "split_gain=" not in compact_model_str
+    # the categories of the pandas columns are kept
+    assert compact_model_str.endswith(booster.model_to_string()[-200:])
+
+
+def test_float32_packing_keeps_predictions(booster, data):
+    """
+    Function for testing that a model keeping all the trees predicts as the original one up to the float32 precision
+    """
+
+    _, holdout = data
+    compact_model_str, metrics = compact_model(booster, holdout[FEATURES], holdout["rides_number"], tolerance=-1)
+
+    assert metrics["compaction_kept_trees"] == booster.num_trees()
+    compact_predictions = lgb.Booster(model_str=compact_model_str).predict(holdout[FEATURES])
+    np.testing.assert_allclose(compact_predictions, booster.predict(holdout[FEATURES]), rtol=1e-5)
+
+
+def test_select_trees_merges_dropped_trees():
+    """
+    Function for testing that the dropped trees are merged into a constant keeping the total of the predictions
+    """
+
+    tree_outputs = np.array([[1.0, 0.0, 0.01], [2.0, 0.5, 0.01], [3.0, 1.0, 0.01]])
+    y = np.exp(tree_outputs.sum(axis=1)) * np.array([1.1, 0.9, 1.0])
+
+    kept, contributions, bias = select_trees(tree_outputs, y, tolerance=0.01)
+
+    assert list(kept) == [True, True, False]
+    assert contributions.argmin() == 2
+    assert bias == pytest.approx(0.01)
+    full_total = np.exp(tree_outputs.sum(axis=1)).sum()
+    assert np.exp(tree_outputs[:, kept].sum(axis=1) + bias).sum() == pytest.approx(full_total)
+
+
+def test_pack_float32():
+    assert pack_float32("0.10000000000000001 225.50000000000003 1.0000000180025095e-35") == "0.1 225.5 1e-35"
+    assert pack_float32("1.7976931348623157e+308") == "1.7976931348623157e+308"
+
+
+def test_split_model_string(booster):
+    header, trees, footer = split_model_string(booster.model_to_string())
+
+    assert header.startswith("tree\n") and footer.startswith("end of trees")
+    assert len(trees) == booster.num_trees()
+    assert [tree["Tree"] for tree in trees[:2]] == ["0", "1"]
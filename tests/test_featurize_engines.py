@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+import pytest
+import shapely
+
+from src.features.build_features import aggregate_trips, build_features_pandas
+from src.features.duckdb_features import build_features_duckdb
+from src.features.geometry_store import CommunityGeometry
+
+NAMES = ["LOOP", "NEAR WEST SIDE", "UPTOWN", "None"]
+
+
+@pytest.fixture
+def geometry():
+    """
+    A fixture for the geometry of four square communities
+    """
+
+    return CommunityGeometry(
+        np.array(NAMES),
+        np.arange(1, 5),
+        np.array([shapely.box(i, 0, i + 1 + i / 10, 1) for i in range(len(NAMES))]),
+    )
+
+
+@pytest.fixture
+def rides_path(tmp_path):
+    """
+    A fixture for raw rides data with the times formatted as in the source dataset,
+    missing communities and vendors, trips ending outside the communities with starts
+    and a community without trips on some days
+    @return: Path of the dataset
+    """
+
+    rng = np.random.default_rng(585)
+    n_trips = 5000
+    start_time = pd.Timestamp("2020-08-12") + pd.to_timedelta(rng.integers(0, 20 * 24 * 3600, n_trips), unit="s")
+    numbers = rng.choice([1.0, 2.0, 3.0, 4.0, 5.0, np.nan], n_trips, p=[0.4, 0.3, 0.2, 0.05, 0.01, 0.04])
+    # community 5 has no name and no geometry, community 4 is named "None"
+    names = pd.Series(numbers).map({1.0: "LOOP", 2.0: "NEAR WEST SIDE", 3.0: "UPTOWN", 4.0: "None"})
+    end_time = start_time + pd.to_timedelta(rng.gamma(2.0, 450.0, n_trips).round(), unit="s")
+    rides = pd.DataFrame(
+        {
+            "Trip ID": np.arange(n_trips).astype(str),
+            "Start Time": start_time.strftime("%m/%d/%Y %I:%M:%S %p"),
+            "End Time": end_time.strftime("%m/%d/%Y %I:%M:%S %p"),
+            "Trip Distance": rng.gamma(2.0, 1000.0, n_trips).round(),
+            "Trip Duration": (end_time - start_time).total_seconds(),
+            "Vendor": rng.choice(["Bird", "Lime", "Spin", None], n_trips, p=[0.5, 0.3, 0.15, 0.05]),
+            "Start Community Area Number": numbers,
+            "End Community Area Number": rng.choice([1.0, 2.0, 3.0, 6.0, np.nan], n_trips),
+            "Start Community Area Name": names,
+        }
+    )
+    path = tmp_path / "rides_data.parquet"
+    rides.to_parquet(path)
+
+    return path
+
+
+@pytest.mark.parametrize("data_until", [None, "2020-08-25"])
+def test_engines_build_same_features(rides_path, geometry, data_until, tmp_path):
+    """
+    Function for testing that the DuckDB engine writes the same interim features as the pandas one
+    """
+
+    pandas_features, pandas_codes = build_features_pandas(rides_path, geometry, 0.5, 1.0, data_until)
+    duckdb_features, duckdb_codes = build_features_duckdb(rides_path, geometry, 0.5, 1.0, data_until)
+
+    pd.testing.assert_frame_equal(duckdb_features, pandas_features)
+    assert duckdb_codes == pandas_codes
+
+    pandas_features.to_parquet(tmp_path / "pandas.parquet")
+    duckdb_features.to_parquet(tmp_path / "duckdb.parquet")
+    pd.testing.assert_frame_equal(
+        pd.read_parquet(tmp_path / "duckdb.parquet"), pd.read_parquet(tmp_path / "pandas.parquet")
+    )
+
+
+def test_aggregate_trips():
+    """
+    Function for testing the aggregates of the trips of a community-day
+    """
+
+    day = pd.Timestamp("2020-08-12")
+    rides = pd.DataFrame(
+        {
+            "Start Time": [day, day, day, day + pd.Timedelta(days=1)],
+            "End Time": [day, day, day + pd.Timedelta(days=1), day + pd.Timedelta(days=1)],
+            "Trip Distance": [100.0, 300.0, 1000.0, 500.0],
+            "Trip Duration": [60.0, 120.0, 600.0, 300.0],
+            "Vendor": ["Bird", "Bird", "Lime", "Lime"],
+            "Start Community Area Number": [1.0, 1.0, 1.0, 2.0],
+            "End Community Area Number": [1.0, 2.0, 2.0, 1.0],
+        }
+    )
+
+    aggregates = aggregate_trips(rides).set_index(["start_day", "community"])
+
+    first_day = aggregates.loc[(day, 1.0)]
+    assert (first_day["rides_number"], first_day["inflow"]) == (3, 1)
+    assert first_day["mean_trip_distance"] == pytest.approx(1400 / 3)
+    assert first_day["median_trip_distance"] == 300.0
+    assert first_day["mean_trip_duration"] == 260.0
+    assert (first_day["vendors_number"], first_day["top_vendor_share"]) == (2, pytest.approx(2 / 3))
+    # a community only trips ended in has no trip statistics
+    assert aggregates.loc[(day, 2.0), "rides_number"] == 0
+    assert np.isnan(aggregates.loc[(day, 2.0), "mean_trip_distance"])
+    assert aggregates.loc[(day + pd.Timedelta(days=1), 2.0), "inflow"] == 1
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+import json
+from pathlib import Path
+
+import pytest
+from shapely.geometry import Point, shape
+
+from src.features.geometry_store import build_geometry_artifact, load_geometry_artifact
+
+PROJECT_DIR = Path(__file__).resolve().parents[1]
+LAT, LON = 41.881832, -87.623177
+
+
+@pytest.fixture(scope="module")
+def boundaries():
+    """
+    A fixture for the districts boundaries data stored in the repository
+    @return: list of GeoJSON features
+    """
+
+    with open(PROJECT_DIR / "data/external/chicago/boundaries.json", "r", encoding="utf-8") as boundaries_file:
+        return json.load(boundaries_file)["features"]
+
+
+def test_full_precision_artifact(boundaries, tmp_path):
+    """
+    Function for testing that the features derived from the full precision artifact
+    are the same as the ones derived from the GeoJSON
+    """
+    artifact_path = tmp_path / "boundaries.feather"
+    build_geometry_artifact(boundaries, artifact_path)
+    geometry = load_geometry_artifact(artifact_path)
+
+    areas = geometry.areas()
+    distances = geometry.distances_to_center(LAT, LON)
+    for feature in boundaries:
+        community_geometry = shape(feature["geometry"])
+        assert areas[feature["properties"]["community"]] == community_geometry.area
+        assert distances[feature["properties"]["community"]] == community_geometry.centroid.distance(Point(LON, LAT))
+    assert geometry.locate(LAT, LON) == "LOOP"
+
+
+def test_simplified_artifact(boundaries, tmp_path):
+    """
+    Function for testing that the features derived from the simplified artifact stay within the tolerance
+    """
+    artifact_path = tmp_path / "boundaries.feather"
+    build_geometry_artifact(boundaries, artifact_path, simplify_tolerance=1e-5, center=(LAT, LON))
+    geometry = load_geometry_artifact(artifact_path)
+
+    areas = geometry.areas()
+    distances = geometry.distances_to_center(LAT, LON)
+    for feature in boundaries:
+        community_geometry = shape(feature["geometry"])
+        assert areas[feature["properties"]["community"]] == pytest.approx(community_geometry.area, rel=1e-3)
+        assert distances[feature["properties"]["community"]] == pytest.approx(
+            community_geometry.centroid.distance(Point(LON, LAT)), rel=1e-3
+        )
+
+    with pytest.raises(ValueError):
+        build_geometry_artifact(boundaries, artifact_path, simplify_tolerance=1e-2, center=(LAT, LON))
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+import mlflow
+import numpy as np
+import pandas as pd
+import pytest
+from hyperopt import Trials
+from hyperopt.early_stop import no_progress_loss
+
+from src.models import hpo
+from src.models.hpo import (
+    EARLY_STOP_MIN_IMPROVEMENT_PERCENT,
+    EARLY_STOP_PATIENCE,
+    HPO_NUM_TRIALS,
+    get_best_lightgbm_params,
+    search_params,
+)
+
+CURRENT_PARAMS = {"n_estimators": 10, "num_leaves": 31}
+
+
+@pytest.fixture(autouse=True)
+def tracking(tmp_path):
+    """
+    A fixture for a local MLflow tracking store the trials are logged to
+    """
+
+    previous_tracking_uri = mlflow.get_tracking_uri()
+    mlflow.set_tracking_uri((tmp_path / "mlruns").as_uri())
+    mlflow.set_experiment("hpo-test")
+    yield
+    mlflow.set_tracking_uri(previous_tracking_uri)
+
+
+def constant_score(data, features, target_name, random_state, **params):  # pylint: disable=unused-argument
+    # the current params are the only ones scoring better than the searched ones
+    return 1.0 if params.get("num_leaves") == CURRENT_PARAMS["num_leaves"] else 2.0
+
+
+def test_early_stopping():
+    """
+    Function for testing that a search without progress stops before its budget is spent
+    """
+
+    trials = Trials()
+    get_best_lightgbm_params(
+        pd.DataFrame(),
+        [],
+        "rides_number",
+        constant_score,
+        585,
+        n_rounds=HPO_NUM_TRIALS,
+        trials=trials,
+        early_stop_fn=no_progress_loss(EARLY_STOP_PATIENCE, EARLY_STOP_MIN_IMPROVEMENT_PERCENT),
+    )
+
+    assert HPO_NUM_TRIALS > EARLY_STOP_PATIENCE
+    assert len(trials.trials) == EARLY_STOP_PATIENCE
+
+
+def test_search_keeps_better_current_params(monkeypatch, tmp_path):
+    """
+    Function for testing that the current params are kept when the search has not improved on them
+    and the files of the interrupted searches are removed after the search
+    """
+
+    monkeypatch.setattr(hpo, "cross_val_score", constant_score)
+    monkeypatch.setattr(hpo, "load_trials", lambda path: None)
+    monkeypatch.setattr(hpo, "upload_trials", lambda path: None)
+    rng = np.random.default_rng(585)
+    (tmp_path / "data" / "chicago").mkdir(parents=True)
+    pd.DataFrame(
+        {feature: rng.integers(0, 7, 100) for feature in hpo.MODEL_FEATURES} | {"rides_number": rng.poisson(5, 100)}
+    ).to_parquet(tmp_path / "data" / "chicago" / "train.parquet")
+    stale_resume_path = tmp_path / "models" / "chicago" / "hpo_trials-0123456789abcdef.inprogress.pkl"
+    stale_resume_path.parent.mkdir(parents=True)
+    stale_resume_path.write_bytes(b"")
+
+    mae, params = search_params(
+        str(tmp_path / "data"), num_trials=3, models_path=str(tmp_path / "models"), current_params=CURRENT_PARAMS
+    )
+
+    assert (mae, params) == (1.0, CURRENT_PARAMS)
+    assert (tmp_path / "models" / "chicago" / "hpo_trials.pkl").exists()
+    assert not list((tmp_path / "models" / "chicago").glob(hpo.RESUME_FILENAME_PATTERN))
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from src.data.http_cache import create_session, fetch_if_changed
+
+
+class StubSource:
+    """
+    A data source served by a local HTTP server
+    """
+
+    def __init__(self):
+        self.body = b"41.881832, -87.623177"
+        self.etag = '"v1"'
+        self.status = 200
+        self.responses = []
+
+
+@pytest.fixture
+def stub_server():
+    """
+    A fixture for a local HTTP server supporting conditional requests
+    @return: the stub source and the url it is served at
+    """
+
+    source = StubSource()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):  # pylint: disable=invalid-name
+            if source.etag is not None and self.headers.get("If-None-Match") == source.etag:
+                source.responses.append(304)
+                self.send_response(304)
+                self.end_headers()
+                return
+            source.responses.append(source.status)
+            self.send_response(source.status)
+            if source.etag is not None:
+                self.send_header("ETag", source.etag)
+            self.send_header("Content-Length", str(len(source.body)))
+            self.end_headers()
+            self.wfile.write(source.body)
+
+        def log_message(self, *args):  # pylint: disable=arguments-differ
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield source, f"http://127.0.0.1:{server.server_port}/coordinates"
+    server.shutdown()
+    server.server_close()
+
+
+def save_to(path):
+    def save(response):
+        path.write_bytes(response.content)
+
+    return save
+
+
+def test_unchanged_source_is_not_downloaded(stub_server, tmp_path):
+    """
+    Function for testing that an unchanged source costs a single 304 response
+    """
+    source, url = stub_server
+    cached_path = tmp_path / "coordinates.txt"
+    session = create_session()
+
+    assert fetch_if_changed(url, cached_path, save_to(cached_path), session=session)
+    assert not fetch_if_changed(url, cached_path, save_to(cached_path), session=session)
+
+    assert source.responses == [200, 304]
+    assert cached_path.read_bytes() == source.body
+
+
+def test_changed_source_is_downloaded(stub_server, tmp_path):
+    """
+    Function for testing that a changed source is downloaded again
+    """
+    source, url = stub_server
+    cached_path = tmp_path / "coordinates.txt"
+
+    fetch_if_changed(url, cached_path, save_to(cached_path))
+    source.body, source.etag = b"41.0, -87.0", '"v2"'
+
+    assert fetch_if_changed(url, cached_path, save_to(cached_path))
+    assert source.responses == [200, 200]
+    assert cached_path.read_bytes() == b"41.0, -87.0"
+
+
+def test_unavailable_source(stub_server, tmp_path):
+    """
+    Function for testing that the cached file is used when the source is unavailable
+    """
+    _, url = stub_server
+    cached_path = tmp_path / "coordinates.txt"
+    session = create_session(retries=0)
+    unavailable_url = "http://127.0.0.1:1/coordinates"
+
+    fetch_if_changed(url, cached_path, save_to(cached_path), session=session)
+
+    assert not fetch_if_changed(unavailable_url, cached_path, save_to(cached_path), session=session)
+    with pytest.raises(requests.ConnectionError):
+        fetch_if_changed(unavailable_url, tmp_path / "missing.txt", save_to(tmp_path / "missing.txt"), session=session)
+
+
+def test_source_without_validators(stub_server, tmp_path):
+    """
+    Function for testing that a source without ETag and Last-Modified is downloaded only once
+    """
+    source, url = stub_server
+    source.etag = None
+    cached_path = tmp_path / "coordinates.txt"
+
+    assert fetch_if_changed(url, cached_path, save_to(cached_path))
+    assert not fetch_if_changed(url, cached_path, save_to(cached_path))
+
+    assert source.responses == [200]
+    assert cached_path.read_bytes() == source.body
+
+
+def test_file_cached_without_metadata(stub_server, tmp_path):
+    """
+    Function for testing that a file cached without the metadata is downloaded once to record the validators
+    """
+    source, url = stub_server
+    cached_path = tmp_path / "coordinates.txt"
+    cached_path.write_bytes(b"41.0, -87.0")
+
+    assert fetch_if_changed(url, cached_path, save_to(cached_path))
+    assert not fetch_if_changed(url, cached_path, save_to(cached_path))
+
+    assert source.responses == [200, 304]
+    assert cached_path.read_bytes() == source.body
+
+
+def test_error_response(stub_server, tmp_path):
+    """
+    Function for testing that the cached file is used when the source responds with an error
+    """
+    source, url = stub_server
+    cached_path = tmp_path / "coordinates.txt"
+    session = create_session(retries=0)
+
+    fetch_if_changed(url, cached_path, save_to(cached_path), session=session)
+    source.etag, source.status = '"v2"', 404
+
+    assert not fetch_if_changed(url, cached_path, save_to(cached_path), session=session)
+    assert cached_path.read_bytes() == b"41.881832, -87.623177"
+    with pytest.raises(requests.HTTPError):
+        fetch_if_changed(url, tmp_path / "missing.txt", save_to(tmp_path / "missing.txt"), session=session)
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+import json
+
+import pytest
+
+from src.pipeline import instrumentation
+from src.pipeline.instrumentation import get_stage_key, instrument_stage, record_rows, report_stage_metrics
+
+
+@instrument_stage("double")
+def double_rows(rows):
+    record_rows(rows_in=len(rows), rows_out=2 * len(rows))
+    return rows + rows
+
+
+def test_stage_metrics(monkeypatch):
+    """
+    Function for testing the metrics recorded for a stage
+    """
+    monkeypatch.setattr(instrumentation, "STAGE_METRICS", [])
+
+    assert double_rows([1, 2, 3]) == [1, 2, 3, 1, 2, 3]
+
+    (metrics,) = instrumentation.STAGE_METRICS
+    assert metrics["stage"] == "double"
+    assert (metrics["rows_in"], metrics["rows_out"]) == (3, 6)
+    assert metrics["wall_time_s"] >= 0
+    assert metrics["cpu_time_s"] >= 0
+    assert metrics.get("stage_peak_rss_mb", metrics.get("process_peak_rss_mb")) > 0
+    assert "profile" not in metrics
+
+
+@instrument_stage("allocate")
+def allocate(n_megabytes):
+    return len(b"x" * (n_megabytes * 1024 * 1024))
+
+
+def test_stage_peak_rss(monkeypatch):
+    """
+    Function for testing that the peak RSS of a stage does not include the peak of a previous stage
+    """
+    monkeypatch.setattr(instrumentation, "STAGE_METRICS", [])
+    if not instrumentation.reset_peak_rss():
+        pytest.skip("the peak RSS of the process cannot be reset")
+
+    allocate(200)
+    double_rows([1])
+
+    allocate_metrics, double_metrics = instrumentation.STAGE_METRICS
+    assert allocate_metrics["stage_peak_rss_mb"] - double_metrics["stage_peak_rss_mb"] > 100
+
+
+@instrument_stage("train")
+def train_city(city="chicago", rounds=1):
+    return city, rounds
+
+
+def test_stage_city(monkeypatch):
+    """
+    Function for testing that the city of a stage is recorded however it is passed,
+    Prefect passes the parameters of a task positionally
+    """
+    monkeypatch.setattr(instrumentation, "STAGE_METRICS", [])
+
+    train_city("austin", 1)
+    train_city(city="denver")
+    train_city()
+    double_rows([1])
+
+    assert [get_stage_key(metrics) for metrics in instrumentation.STAGE_METRICS] == [
+        "austin.train",
+        "denver.train",
+        "chicago.train",
+        "double",
+    ]
+
+
+def test_stage_profile(monkeypatch, tmp_path):
+    """
+    Function for testing the profile dump of a single stage and the JSON report
+    """
+    monkeypatch.setattr(instrumentation, "STAGE_METRICS", [])
+    monkeypatch.setattr(instrumentation, "PROFILES_DIR", str(tmp_path / "profiles"))
+    monkeypatch.setenv("PROFILE_STAGE", "double")
+    monkeypatch.setenv("PROFILER", "cprofile")
+
+    double_rows([1])
+    report_path = tmp_path / "stage_metrics.json"
+    report_stage_metrics(str(report_path), log_to_mlflow=False)
+
+    (metrics,) = json.loads(report_path.read_text(encoding="utf-8"))
+    assert metrics["profile"].endswith(".prof")
+    assert (tmp_path / "profiles").joinpath(metrics["profile"].split("/")[-1]).exists()
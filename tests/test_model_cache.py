@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+import mlflow
+import numpy as np
+import pytest
+from lightgbm import LGBMRegressor
+from mlflow import MlflowClient
+
+from src.models.model_cache import ModelCache, load_cached_model
+
+MODEL_NAME = "escooter-demand-model-test"
+
+
+@pytest.fixture
+def registry(tmp_path):
+    """
+    A fixture for a local file-based model registry
+    @return: function registering a new Production version of the model and the address of the registry
+    """
+
+    tracking_uri = (tmp_path / "mlruns").as_uri()
+    previous_tracking_uri = mlflow.get_tracking_uri()
+    mlflow.set_tracking_uri(tracking_uri)
+    # the experiment set by the modules of the project at import does not exist in this registry
+    mlflow.set_experiment("model-cache-test")
+    rng = np.random.default_rng(585)
+
+    def register_version():
+        model = LGBMRegressor(objective="poisson", n_estimators=5).fit(rng.random((100, 3)), rng.poisson(5, 100))
+        with mlflow.start_run():
+            model_info = mlflow.lightgbm.log_model(model, "model")
+        model_version = mlflow.register_model(model_info.model_uri, MODEL_NAME)
+        MlflowClient().transition_model_version_stage(MODEL_NAME, model_version.version, "Production")
+        return model_version
+
+    yield register_version, tracking_uri
+    mlflow.set_tracking_uri(previous_tracking_uri)
+
+
+@pytest.fixture
+def downloads(monkeypatch):
+    """
+    A fixture counting the downloads of the artifacts
+    @return: list of the downloaded artifacts
+    """
+
+    downloaded = []
+    download_artifacts = mlflow.artifacts.download_artifacts
+
+    def counting_download_artifacts(artifact_uri, dst_path):
+        downloaded.append(artifact_uri)
+        return download_artifacts(artifact_uri=artifact_uri, dst_path=dst_path)
+
+    monkeypatch.setattr(mlflow.artifacts, "download_artifacts", counting_download_artifacts)
+    return downloaded
+
+
+def test_cached_version_is_not_downloaded(registry, downloads, tmp_path):
+    """
+    Function for testing that a cached version is loaded without downloading it again
+    """
+    register_version, tracking_uri = registry
+    register_version()
+
+    ModelCache(tmp_path / "cache", tracking_uri=tracking_uri).get(MODEL_NAME)
+    model, entry = load_cached_model(MODEL_NAME, cache=ModelCache(tmp_path / "cache", tracking_uri=tracking_uri))
+
+    assert len(downloads) == 1
+    assert entry.version == "1"
+    assert len(model.predict(np.zeros((2, 3)))) == 2
+
+
+def test_unreachable_registry(registry, downloads, tmp_path, monkeypatch):
+    """
+    Function for testing that the cached version is used when the registry is unreachable
+    """
+    register_version, tracking_uri = registry
+    register_version()
+    ModelCache(tmp_path / "cache", tracking_uri=tracking_uri).get(MODEL_NAME)
+    monkeypatch.setenv("MLFLOW_HTTP_REQUEST_MAX_RETRIES", "0")
+
+    entry = ModelCache(tmp_path / "cache", tracking_uri="http://127.0.0.1:1").get(MODEL_NAME)
+
+    assert entry.version == "1"
+    assert len(downloads) == 1
+    with pytest.raises(Exception):
+        ModelCache(tmp_path / "empty_cache", tracking_uri="http://127.0.0.1:1").get(MODEL_NAME)
+
+
+def test_slow_registry(registry, downloads, tmp_path):
+    """
+    Function for testing that the cached version is used without waiting for a slow registry,
+    the stage is refreshed in the background
+    """
+    register_version, tracking_uri = registry
+    register_version()
+    ModelCache(tmp_path / "cache", tracking_uri=tracking_uri).get(MODEL_NAME)
+    register_version()
+
+    cache = ModelCache(tmp_path / "cache", tracking_uri=tracking_uri, registry_timeout=0.1)
+    get_latest_versions = cache.client.get_latest_versions
+
+    def slow_get_latest_versions(*args, **kwargs):
+        time.sleep(1)
+        return get_latest_versions(*args, **kwargs)
+
+    cache.client.get_latest_versions = slow_get_latest_versions
+    load_start = time.perf_counter()
+    entry = cache.get(MODEL_NAME)
+
+    assert time.perf_counter() - load_start < 1
+    assert entry.version == "1"
+    for _ in range(100):
+        if cache.read_stage(MODEL_NAME, "Production").version == "2":
+            break
+        time.sleep(0.1)
+    assert cache.read_stage(MODEL_NAME, "Production").version == "2"
+    assert len(downloads) == 2
+
+
+def test_corrupted_version_is_downloaded_again(registry, downloads, tmp_path):
+    """
+    Function for testing that a cached version not matching its checksum is downloaded again
+    """
+    register_version, tracking_uri = registry
+    register_version()
+    cache = ModelCache(tmp_path / "cache", tracking_uri=tracking_uri)
+    entry = cache.get(MODEL_NAME)
+
+    (entry.model_path / "MLmodel").write_text("corrupted", encoding="utf-8")
+
+    assert cache.get(MODEL_NAME).checksum == entry.checksum
+    assert len(downloads) == 2
+
+
+def test_old_versions_are_evicted(registry, tmp_path):
+    """
+    Function for testing that the versions no stage points to are evicted when the cache is full
+    """
+    register_version, tracking_uri = registry
+    cache = ModelCache(tmp_path / "cache", max_bytes=1, tracking_uri=tracking_uri)
+
+    register_version()
+    first_entry = cache.get(MODEL_NAME)
+    register_version()
+    second_entry = cache.get(MODEL_NAME)
+
+    assert [entry.version for entry in cache.entries()] == ["2"]
+    assert not first_entry.model_path.exists()
+    assert second_entry.model_path.exists()
+
+
+def test_workers_download_once(registry, downloads, tmp_path):
+    """
+    Function for testing that the workers sharing the cache download a version once
+    """
+    register_version, tracking_uri = registry
+    register_version()
+    caches = [ModelCache(tmp_path / "cache", tracking_uri=tracking_uri) for _ in range(4)]
+    threads = [threading.Thread(target=cache.get, args=(MODEL_NAME,)) for cache in caches]
+
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(downloads) == 1
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+from botocore.exceptions import EndpointConnectionError
+
+from src.monitoring.data_store import MonitoringDataStore
+
+KEY = "escooters-demand/data/processed/chicago/test.parquet"
+REFERENCE_KEY = "escooters-demand/data/processed/chicago/reference.parquet"
+
+
+class InMemoryS3:
+    """
+    S3 client serving the objects from memory and counting the downloads
+    """
+
+    def __init__(self):
+        self.objects = {}
+        self.downloads = 0
+        self.available = True
+
+    def put(self, key, data: pd.DataFrame):
+        buffer = io.BytesIO()
+        data.to_parquet(buffer)
+        self.objects[key] = buffer.getvalue()
+
+    def head_object(self, Bucket, Key):  # pylint: disable=invalid-name,unused-argument
+        if not self.available:
+            raise EndpointConnectionError(endpoint_url="https://s3.amazonaws.com")
+        return {"ETag": f'"{hashlib.md5(self.objects[Key]).hexdigest()}"'}
+
+    def get_object(self, Bucket, Key):  # pylint: disable=invalid-name
+        self.downloads += 1
+        return {"Body": io.BytesIO(self.objects[Key]), **self.head_object(Bucket, Key)}
+
+
+def make_data(n_days, seed=585):
+    rng = np.random.default_rng(seed)
+    days = pd.date_range("2020-10-08", periods=n_days, freq="1D")
+    data = pd.DataFrame(
+        {
+            "start_day": np.repeat(days.values, 77),
+            "community": np.tile(np.arange(1, 78), n_days),
+            "rides_number": rng.poisson(20, 77 * n_days).astype(float),
+        }
+    )
+    # shuffled as the store must not rely on the order of the rows on S3
+    return data.sample(frac=1, random_state=seed)
+
+
+@pytest.fixture
+def s3():
+    client = InMemoryS3()
+    client.put(KEY, make_data(9))
+    client.put(REFERENCE_KEY, make_data(5, seed=586))
+    return client
+
+
+def test_day_slices(s3, tmp_path):
+    """
+    Function for testing that the slice of a day is the same as the rows selected by a mask
+    """
+
+    data = make_data(9)
+    data["community"] = data["community"].astype("category")
+    store = MonitoringDataStore(cache_dir=str(tmp_path), client=s3)
+
+    reference_data, current_data = store.load_city("chicago", ["community"])
+    day = pd.Timestamp("2020-10-10")
+    expected = data[data["start_day"] == day].sort_index()
+
+    pd.testing.assert_frame_equal(current_data.day(day).sort_index(), expected)
+    assert current_data.day(pd.Timestamp("2020-11-01")).empty
+    pd.testing.assert_frame_equal(reference_data.sort_index(), make_data(5, seed=586).sort_index())
+    assert list(current_data) == list(pd.date_range("2020-10-08", periods=9, freq="1D"))
+
+
+def test_refresh_on_etag_change(s3, tmp_path):
+    """
+    Function for testing that the data is downloaded again only when the object changes on S3
+    and the cached data is used when S3 is unavailable
+    """
+
+    store = MonitoringDataStore(cache_dir=str(tmp_path), client=s3)
+
+    assert store.load(KEY).num_rows == 9 * 77
+    assert store.load(KEY).num_rows == 9 * 77
+    assert s3.downloads == 1
+
+    s3.put(KEY, make_data(10))
+    assert store.load(KEY).num_rows == 10 * 77
+    assert s3.downloads == 2
+
+    s3.available = False
+    assert store.load(KEY).num_rows == 10 * 77
+    with pytest.raises(EndpointConnectionError):
+        MonitoringDataStore(cache_dir=str(tmp_path / "empty"), client=s3).load(KEY)
@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+import json
+import sqlite3
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+from botocore.exceptions import NoCredentialsError
+
+from src.features.definitions import CATEGORICAL_FEATURES, MODEL_FEATURES
+from src.models import train_model
+from src.pipeline import instrumentation, retrain_gate
+from src.pipeline.instrumentation import instrument_stage
+from src.pipeline.retrain_gate import (
+    FULL_HPO,
+    RETRAIN,
+    SKIP,
+    DriftMetrics,
+    choose_retraining,
+    estimate_saved_compute,
+    read_latest_drift_metrics,
+    save_stage_costs,
+)
+
+STATE = {"trained_until": "2020-10-05", "holdout_mae": 1.0, "full_refit_holdout_mae": 1.0}
+NO_DRIFT = DriftMetrics(datetime(2020, 10, 8), 0.5, 0, 0.0)
+
+
+@pytest.fixture
+def monitoring_db():
+    """
+    A fixture for an in-memory stand-in of the monitoring database
+    """
+
+    conn = sqlite3.connect(":memory:")
+    conn.execute(
+        "create table escooter_demand_metrics(city varchar(64), timestamp timestamp, prediction_drift float, "
+        "num_drifted_columns integer, share_missing_values float)"
+    )
+    conn.executemany(
+        "insert into escooter_demand_metrics values (?, ?, ?, ?, ?)",
+        [
+            ("chicago", "2020-10-08 00:00:00", 0.5, 0, 0.0),
+            ("chicago", "2020-10-09 00:00:00", 0.01, 3, 0.0),
+            ("austin", "2020-10-10 00:00:00", 0.5, 0, 0.0),
+        ],
+    )
+    yield conn
+    conn.close()
+
+
+def test_read_latest_drift_metrics(monitoring_db):
+    """
+    Function for testing that the metrics of the latest day of the city are read
+    """
+
+    assert read_latest_drift_metrics(monitoring_db, "chicago", placeholder="?") == DriftMetrics(
+        datetime(2020, 10, 9), 0.01, 3, 0.0
+    )
+    assert read_latest_drift_metrics(monitoring_db, "denver", placeholder="?") is None
+
+
+@pytest.mark.parametrize(
+    "state, drift, new_days_num, has_params, current_mae, decision",
+    [
+        (STATE, NO_DRIFT, 0, False, None, FULL_HPO),
+        (None, None, 60, True, None, RETRAIN),
+        (STATE, DriftMetrics(datetime(2020, 10, 8), 0.5, 3, 0.0), 0, True, None, FULL_HPO),
+        (STATE, NO_DRIFT, 0, True, 1.2, FULL_HPO),
+        (STATE, NO_DRIFT, 0, True, 1.1, SKIP),
+        ({**STATE, "holdout_mae": 1.2}, NO_DRIFT, 0, True, None, SKIP),
+        (STATE, DriftMetrics(datetime(2020, 10, 8), 0.01, 0, 0.0), 0, True, None, RETRAIN),
+        (STATE, DriftMetrics(datetime(2020, 10, 8), 0.5, 0, 0.2), 0, True, None, RETRAIN),
+        (STATE, NO_DRIFT, 3, True, None, RETRAIN),
+        (STATE, None, 3, True, None, RETRAIN),
+        (STATE, NO_DRIFT, 0, True, None, SKIP),
+        (STATE, None, 0, True, None, SKIP),
+    ],
+)
+def test_choose_retraining(state, drift, new_days_num, has_params, current_mae, decision):
+    """
+    Function for testing the decisions of the retraining gate
+    """
+
+    assert choose_retraining(state, drift, new_days_num, has_params, current_mae)[0] == decision
+
+
+def generate_features(days: pd.DatetimeIndex, demand_scale: float, seed: int = 0) -> pd.DataFrame:
+    """
+    Function generates the processed features of 24 communities with Poisson demand
+    @param days: pd.DatetimeIndex, the days to generate the features for
+    @param demand_scale: float, the factor the expected demand is multiplied by
+    @param seed: int, the seed of the random generator
+    @return: pd.DataFrame with the model features, the target and the day
+    """
+
+    rng = np.random.default_rng(seed)
+    communities = pd.DataFrame({"community": [f"AREA {i}" for i in range(24)], "base": np.geomspace(5, 80, 24)})
+    df = pd.merge(pd.DataFrame({"start_day": days}), communities, how="cross")
+    df["day_of_year"] = df["start_day"].dt.dayofyear
+    df["day_of_week"] = df["start_day"].dt.dayofweek
+    df["is_weekend"] = (df["day_of_week"] >= 5).astype(int)
+    df["week"] = df["start_day"].dt.isocalendar().week.astype(int)
+    df["month"] = df["start_day"].dt.month
+    df["area"] = df["base"] * 1000
+    df["distance_to_center"] = 1 / df["base"]
+    df["rides_number"] = rng.poisson(demand_scale * df["base"] * (1 + df["is_weekend"]))
+
+    return df[["start_day", *MODEL_FEATURES, "rides_number"]]
+
+
+@pytest.fixture
+def city_workdir(monkeypatch, tmp_path):
+    """
+    A fixture for a working directory with a model of chicago trained on 60 days,
+    its training state and the processed data of the days it was trained on
+    @return: the MAE of the model on its holdout
+    """
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(instrumentation, "STAGE_METRICS", [])
+    models_dir = tmp_path / "models" / "chicago"
+    processed_dir = tmp_path / "data" / "processed" / "chicago"
+    models_dir.mkdir(parents=True)
+    processed_dir.mkdir(parents=True)
+
+    train = generate_features(pd.date_range("2020-08-01", periods=60), 1.0)
+    holdout = generate_features(pd.date_range("2020-09-30", periods=14), 1.0, seed=1)
+    train.to_parquet(processed_dir / "train.parquet")
+    model = train_model.train_lgbm_model(train, MODEL_FEATURES, CATEGORICAL_FEATURES, {"n_estimators": 50})
+    model.booster_.save_model(str(models_dir / "model.txt"))
+    holdout[CATEGORICAL_FEATURES] = holdout[CATEGORICAL_FEATURES].astype("category")
+    holdout_mae = train_model.evaluate_model(model, holdout, MODEL_FEATURES)
+
+    state = {
+        "last_full_refit": "2020-09-29",
+        "full_refit_holdout_mae": holdout_mae,
+        "trained_until": "2020-09-29",
+        "holdout_mae": holdout_mae,
+    }
+    train_model.save_training_state(state, str(models_dir / "training_state.json"))
+    train_model.save_training_state({}, str(models_dir / "stage_costs.json"))
+    train_model.save_training_state({"n_estimators": 50}, str(models_dir / "best_params.json"))
+
+    return holdout_mae
+
+
+@pytest.mark.parametrize("demand_scale, decision", [(1.0, SKIP), (2.0, FULL_HPO)])
+def test_retrain_gate_measures_current_model(city_workdir, demand_scale, decision):
+    """
+    Function for testing that the gate runs a new search when the current model regresses
+    on the holdout of the latest split, and skips the training when it does not
+    """
+
+    holdout = generate_features(pd.date_range("2020-10-14", periods=14), demand_scale, seed=2)
+    holdout.to_parquet("data/processed/chicago/test.parquet")
+
+    current_mae = retrain_gate.evaluate_current_model("chicago")
+
+    assert (current_mae > city_workdir * (1 + retrain_gate.MAX_MAE_REGRESSION_FOR_HPO)) == (decision == FULL_HPO)
+    dsn = "host=127.0.0.1 port=1 connect_timeout=1"
+    assert retrain_gate.retrain_gate.fn("chicago", "auto", dsn) == decision
+    assert instrumentation.STAGE_METRICS[-1]["current_holdout_mae"] == current_mae
+
+
+def test_estimate_saved_compute():
+    """
+    Function for testing the compute saved by the decisions
+    """
+
+    costs = {
+        "hpo": {"wall_time_s": 600.0, "cpu_time_s": 1800.0},
+        "train_log_model": {"wall_time_s": 60.0, "cpu_time_s": 90.0},
+    }
+
+    assert estimate_saved_compute(SKIP, costs) == {"saved_wall_time_s": 660.0, "saved_cpu_time_s": 1890.0}
+    assert estimate_saved_compute(RETRAIN, costs) == {"saved_wall_time_s": 600.0, "saved_cpu_time_s": 1800.0}
+    assert estimate_saved_compute(FULL_HPO, costs) == {"saved_wall_time_s": 0, "saved_cpu_time_s": 0}
+    assert estimate_saved_compute(SKIP, {}) == {"saved_wall_time_s": 0, "saved_cpu_time_s": 0}
+
+
+def test_load_training_state_offline(monkeypatch, tmp_path):
+    """
+    Function for testing that a missing state is treated as no state when S3 is unreachable
+    """
+
+    class OfflineS3:
+        def download_file(self, *args):
+            raise NoCredentialsError()
+
+    monkeypatch.setattr(train_model.boto3, "client", lambda service: OfflineS3())
+
+    assert train_model.load_training_state(str(tmp_path / "chicago" / "training_state.json")) is None
+
+
+@pytest.mark.parametrize(
+    "state, new_days_num, mode",
+    [
+        (None, 3, "full"),
+        ({"last_full_refit": "2020-10-05"}, 0, "full"),
+        ({"last_full_refit": "2020-10-05"}, 8, "full"),
+        ({"last_full_refit": "2020-09-28"}, 3, "full"),
+        ({"last_full_refit": "2020-10-05"}, 3, "incremental"),
+    ],
+)
+def test_choose_training_mode(state, new_days_num, mode):
+    """
+    Function for testing the choice between a full refit and an incremental training
+    """
+
+    assert train_model.choose_training_mode(state, new_days_num, date(2020, 10, 8)) == mode
+
+
+@instrument_stage("hpo")
+def hpo_stage(city, num_trials=10):
+    return city, num_trials
+
+
+@instrument_stage("train_log_model")
+def train_stage(city="chicago", mode="auto"):
+    return city, mode
+
+
+def test_save_stage_costs_of_positionally_called_stages(monkeypatch, tmp_path):
+    """
+    Function for testing that the costs of the stages are saved for their city when Prefect
+    passes the parameters of the tasks positionally
+    """
+
+    monkeypatch.setattr(instrumentation, "STAGE_METRICS", [])
+    monkeypatch.setattr(retrain_gate, "MODELS_DIR", str(tmp_path))
+    monkeypatch.setattr(retrain_gate, "load_training_state", lambda path: None)
+    monkeypatch.setattr(retrain_gate, "upload_reference_data", lambda path: None)
+    (tmp_path / "austin").mkdir()
+
+    hpo_stage("austin", 1)
+    train_stage("austin", "full")
+    train_stage()
+    save_stage_costs("austin", instrumentation.STAGE_METRICS)
+
+    costs = json.loads((tmp_path / "austin" / "stage_costs.json").read_text(encoding="utf-8"))
+    assert sorted(costs) == ["hpo", "train_log_model"]
+    assert costs["train_log_model"]["wall_time_s"] == instrumentation.STAGE_METRICS[1]["wall_time_s"]
+    assert estimate_saved_compute(SKIP, costs)["saved_wall_time_s"] > 0
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+import threading
+
+import pytest
+
+from src.api.shadow import ShadowScorer
+
+
+@pytest.fixture
+def scorer():
+    """
+    A fixture for a shadow scorer with a single worker and a single pending scoring
+    @return: ShadowScorer
+    """
+
+    shadow_scorer = ShadowScorer(max_workers=1, max_pending=1, disagreement_tolerance=0.1)
+    yield shadow_scorer
+    shadow_scorer.shutdown()
+
+
+def test_shadow_statistics(scorer):
+    """
+    Function for testing the statistics of the comparison of the candidate with the served model
+    """
+    for candidate_prediction, served_prediction in [(100, 100), (120, 100), (95, 100)]:
+        assert scorer.submit("chicago", lambda value=candidate_prediction: value, served_prediction)
+        scorer.executor.submit(lambda: None).result()
+
+    stats = scorer.snapshot()["chicago"]
+    assert stats["requests"] == 3
+    assert stats["disagreements"] == 1
+    assert stats["max_abs_difference"] == 20
+    assert stats["mean_abs_difference"] == pytest.approx(25 / 3)
+
+
+def test_failed_scoring_is_counted(scorer):
+    """
+    Function for testing that an error of the candidate model does not reach the caller
+    """
+
+    def fail():
+        raise ValueError("candidate failed")
+
+    assert scorer.submit("chicago", fail, 100)
+    scorer.executor.submit(lambda: None).result()
+
+    stats = scorer.snapshot()["chicago"]
+    assert (stats["requests"], stats["errors"]) == (1, 1)
+    assert stats["mean_abs_difference"] is None
+
+
+def test_saturated_scorer_drops_scorings(scorer):
+    """
+    Function for testing that scorings are dropped instead of queued when the executor is saturated
+    """
+    released = threading.Event()
+
+    assert scorer.submit("chicago", lambda: released.wait() and 100, 100)
+    assert not scorer.submit("chicago", lambda: 100, 100)
+    assert not scorer.submit("chicago", lambda: 100, 100)
+    released.set()
+    scorer.executor.submit(lambda: None).result()
+
+    stats = scorer.snapshot()["chicago"]
+    assert (stats["requests"], stats["dropped"]) == (1, 2)
+    assert scorer.submit("chicago", lambda: 100, 100)
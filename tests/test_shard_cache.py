@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+import threading
+
+from src.api.shard_cache import ShardCache
+
+
+class Loader:
+    """
+    A loader of shards counting the loads
+    """
+
+    def __init__(self, sizes):
+        self.sizes = sizes
+        self.loads = []
+
+    def __call__(self, key):
+        self.loads.append(key)
+        return f"shard of {key}", self.sizes[key]
+
+
+def test_shards_are_loaded_lazily_once():
+    """
+    Function for testing that a shard is loaded on the first request only
+    """
+    loader = Loader({"chicago": 10})
+    cache = ShardCache(loader, max_bytes=100)
+
+    assert "chicago" not in cache
+    assert cache.get("chicago") == "shard of chicago"
+    assert cache.get("chicago") == "shard of chicago"
+    assert loader.loads == ["chicago"]
+
+
+def test_least_recently_used_shards_are_evicted():
+    """
+    Function for testing that the least recently used shards are evicted when the cache is full
+    """
+    loader = Loader({"chicago": 40, "austin": 40, "denver": 40})
+    evicted = []
+    cache = ShardCache(loader, max_bytes=100, on_evict=lambda key, shard: evicted.append(key))
+
+    cache.get("chicago")
+    cache.get("austin")
+    cache.get("chicago")
+    cache.get("denver")
+
+    assert evicted == ["austin"]
+    assert cache.keys() == ["chicago", "denver"]
+    assert cache.size_bytes == 80
+
+
+def test_shard_larger_than_cache_is_kept():
+    """
+    Function for testing that the requested shard is kept even if it does not fit into the cache
+    """
+    loader = Loader({"chicago": 40, "austin": 400})
+    cache = ShardCache(loader, max_bytes=100)
+
+    cache.get("chicago")
+    cache.get("austin")
+
+    assert cache.keys() == ["austin"]
+
+
+def test_concurrent_requests_load_shard_once():
+    """
+    Function for testing that concurrent requests for a city load its shard once
+    """
+    loader = Loader({"chicago": 10})
+    cache = ShardCache(loader, max_bytes=100)
+    threads = [threading.Thread(target=cache.get, args=("chicago",)) for _ in range(8)]
+
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert loader.loads == ["chicago"]
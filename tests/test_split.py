@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.data.split import split_train_test, split_train_test_streaming
+
+
+@pytest.fixture
+def features_path(tmp_path):
+    """
+    A fixture for a features dataset sorted by start_day as it is written by featurize
+    @return: Path of the dataset
+    """
+
+    rng = np.random.default_rng(585)
+    days = pd.date_range("2020-08-12", "2020-10-17", freq="1D")
+    features = pd.DataFrame(
+        {
+            "start_day": np.repeat(days.values, 77),
+            "community": np.tile(np.arange(1, 78), len(days)),
+            "rides_number": rng.poisson(20, 77 * len(days)).astype(float),
+        }
+    )
+    features = features[features["community"] != 5]
+    path = tmp_path / "interim_features.parquet"
+    features.to_parquet(path, row_group_size=1000)
+
+    return path
+
+
+@pytest.mark.parametrize("batch_size", [1, 500, 1 << 16])
+def test_streaming_split_is_identical(features_path, tmp_path, batch_size):
+    """
+    Function for testing that the streaming split gives the same datasets as the in-memory one
+    """
+    train, test = split_train_test(pd.read_parquet(features_path), 0.15)
+
+    train_rows_num, test_rows_num = split_train_test_streaming(
+        features_path, tmp_path / "train.parquet", tmp_path / "test.parquet", 0.15, batch_size=batch_size
+    )
+
+    assert (train_rows_num, test_rows_num) == (len(train), len(test))
+    pd.testing.assert_frame_equal(pd.read_parquet(tmp_path / "train.parquet"), train)
+    pd.testing.assert_frame_equal(pd.read_parquet(tmp_path / "test.parquet"), test)
+
+
+def test_streaming_split_of_unsorted_dataset(features_path, tmp_path):
+    """
+    Function for testing that the streaming split refuses a dataset not sorted by start_day
+    """
+    pd.read_parquet(features_path).sample(frac=1, random_state=585).to_parquet(features_path)
+
+    with pytest.raises(ValueError):
+        split_train_test_streaming(features_path, tmp_path / "train.parquet", tmp_path / "test.parquet", 0.15)